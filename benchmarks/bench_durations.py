@@ -0,0 +1,49 @@
+"""
+Compare parse_duration against the previous dateparser-based path.
+
+Usage: python -m benchmarks.bench_durations [iterations]
+"""
+
+import sys
+import time
+from datetime import datetime
+
+from db.durations import parse_duration
+
+DURATIONS = ["+1d", "+3h45m", "+2w", "+1y3m", "2023-04-03", "2023-04-03 12:30"]
+
+
+def dateparser_path(duration: str):
+    import dateparser
+
+    if duration.startswith("+"):
+        return dateparser.parse(f"now + {duration[1:]}")
+    return dateparser.parse(duration)
+
+
+def bench(fn, iterations: int) -> float:
+    """
+    Mean microseconds per call over every duration in DURATIONS.
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for duration in DURATIONS:
+            fn(duration)
+    return (time.perf_counter() - start) / (iterations * len(DURATIONS)) * 1e6
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    start = time.perf_counter()
+    import dateparser  # noqa: F401
+
+    import_ms = (time.perf_counter() - start) * 1000
+    now = datetime.now()
+    native_us = bench(lambda d: parse_duration(d, now=now), iterations)
+    dateparser_us = bench(dateparser_path, iterations)
+
+    print(f"dateparser import:  {import_ms:10.1f} ms")
+    print(f"parse_duration:     {native_us:10.2f} us/call")
+    print(f"dateparser.parse:   {dateparser_us:10.2f} us/call")
+    print(f"speedup:            {dateparser_us / native_us:10.1f}x")
@@ -0,0 +1,89 @@
+"""
+Measure how fast the books are rebuilt from a journal snapshot plus tail.
+
+Usage: python -m benchmarks.bench_replay [snapshot_orders] [tail_events]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+from db.journal import (
+    ACCEPT,
+    Event,
+    build_books,
+    cancel_event,
+    encode,
+    replay,
+    write_snapshot,
+)
+
+MARKETS = 100
+
+
+def generate(directory: str, snapshot_orders: int, tail_events: int, seed: int = 0):
+    rng = random.Random(seed)
+    markets = {}
+    for order_id in range(1, snapshot_orders + 1):
+        direction = rng.choice((1, -1))
+        price = rng.randint(1, 49) if direction > 0 else rng.randint(51, 99)
+        markets.setdefault(rng.randrange(MARKETS), {})[order_id] = [
+            rng.randrange(1000),
+            direction,
+            price,
+            rng.randint(1, 100),
+            -1,
+        ]
+    write_snapshot(os.path.join(directory, f"snapshot-{0:020d}.bin"), 0, markets)
+
+    # Mostly new orders, with every fourth event cancelling an earlier one
+    next_id = snapshot_orders + 1
+    with open(os.path.join(directory, f"journal-{1:020d}.log"), "wb") as f:
+        for seq in range(1, tail_events + 1):
+            market_id = rng.randrange(MARKETS)
+            if seq % 4 == 0:
+                event = cancel_event(market_id, rng.randrange(1, next_id))
+            else:
+                direction = rng.choice(("buy", "sell"))
+                event = Event(
+                    ACCEPT,
+                    market_id,
+                    next_id,
+                    rng.randrange(1000),
+                    direction,
+                    rng.randint(1, 49) if direction == "buy" else rng.randint(51, 99),
+                    10,
+                    10,
+                )
+                next_id += 1
+            f.write(encode(seq, event))
+
+
+if __name__ == "__main__":
+    snapshot_orders = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    tail_events = int(sys.argv[2]) if len(sys.argv) > 2 else 200_000
+
+    with tempfile.TemporaryDirectory() as directory:
+        generate(directory, snapshot_orders, tail_events)
+        size = sum(
+            os.path.getsize(os.path.join(directory, name))
+            for name in os.listdir(directory)
+        )
+
+        result = replay(directory)
+        start = time.perf_counter()
+        books = build_books(result.markets)
+        build_seconds = time.perf_counter() - start
+
+    resting = sum(len(book) for book in books.values())
+    print(f"journal size:       {size / 1e6:10.1f} MB")
+    print(f"snapshot orders:    {result.snapshot_orders:10d}")
+    print(f"tail events:        {result.events:10d}")
+    print(f"replay:             {result.seconds * 1000:10.1f} ms")
+    print(
+        f"replay throughput:  "
+        f"{(result.snapshot_orders + result.events) / result.seconds:10.0f} records/s"
+    )
+    print(f"build books:        {build_seconds * 1000:10.1f} ms ({resting} orders)")
@@ -0,0 +1,105 @@
+"""
+Compare the time and memory it takes to load every trade as plain tuples,
+as dataclass instances (the row type used before db.objects switched to named
+tuples), as named tuples through db.Database's row factory, and as columnar
+batches. Figures are scaled to 1M rows.
+
+Usage: python -m benchmarks.bench_rows [rows] [repeats]
+"""
+
+import gc
+import sqlite3
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Callable
+
+from db import Database
+from db.migrate import create_schema
+from db.timestamps import parse_micros
+
+
+@dataclass
+class DataclassTrade:
+    id: int
+    market_id: int
+    buyer_id: int
+    seller_id: int
+    price_cents: int
+    quantity: int
+    timestamp: int
+
+
+def make_database(n: int) -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    create_schema(conn)
+    start = parse_micros("2024-01-01")
+    with conn:
+        conn.executemany(
+            "INSERT INTO markets (name, creator_id, criteria) VALUES (?, 1, '')",
+            ((f"market {i}",) for i in range(100)),
+        )
+        conn.executemany(
+            "INSERT INTO trades (market_id, buyer_id, seller_id, price_cents, "
+            "quantity, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    1 + i % 100,
+                    i % 1000,
+                    (i * 7) % 1000,
+                    1 + i % 99,
+                    1 + i % 10,
+                    start + i,
+                )
+                for i in range(n)
+            ),
+        )
+    return conn
+
+
+def measure(load: Callable[[], object], repeats: int):
+    """
+    Best seconds over repeats, and the bytes held by the result.
+    """
+    seconds = []
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        result = load()
+        seconds.append(time.perf_counter() - start)
+        del result
+    gc.collect()
+    tracemalloc.start()
+    result = load()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return min(seconds), size
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    conn = make_database(n)
+    db = Database(conn)
+    loaders = {
+        "tuples": lambda: conn.execute("SELECT * FROM trades").fetchall(),
+        "dataclasses": lambda: [
+            DataclassTrade(*row)
+            for row in conn.execute("SELECT * FROM trades").fetchall()
+        ],
+        "named tuples": db.get_trades,
+        "columns": lambda: list(db.iter_columns("trades", batch_size=n)),
+    }
+
+    scale = 1_000_000 / n
+    print(f"{n} trades, figures per 1M rows")
+    print(f"{'rows as':<14} {'seconds':>8} {'MB':>8} {'bytes/row':>10}")
+    for name, load in loaders.items():
+        seconds, size = measure(load, repeats)
+        print(
+            f"{name:<14} {seconds * scale:>8.2f} {size * scale / 1e6:>8.1f} "
+            f"{size / n:>10.0f}"
+        )
@@ -0,0 +1,101 @@
+"""
+Compare FTS5 market search against a LIKE scan over a synthetic market set.
+
+Usage: python -m benchmarks.bench_search [markets] [iterations]
+"""
+
+import itertools
+import random
+import sqlite3
+import sys
+import time
+
+from db.migrate import create_schema
+from db.search import build_query, search_markets
+
+VOCABULARY = 20_000
+SYLLABLES = "ba ke ri to lu ma ne so vi da pe go zu ha fi".split()
+
+
+def make_words(rng: random.Random, n: int):
+    words = set()
+    while len(words) < n:
+        words.add("".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+    return sorted(words, key=lambda w: (len(w), w))
+
+
+def generate(conn: sqlite3.Connection, markets: int, seed: int = 0):
+    """
+    Insert markets with Zipf-distributed words, returning the vocabulary from
+    most to least common.
+    """
+    rng = random.Random(seed)
+    words = make_words(rng, VOCABULARY)
+    cum_weights = list(itertools.accumulate(1 / r for r in range(1, len(words) + 1)))
+    rows = (
+        (
+            " ".join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(3, 6))),
+            1,
+            " ".join(rng.choices(words, cum_weights=cum_weights, k=30)),
+        )
+        for _ in range(markets)
+    )
+    with conn:
+        conn.executemany(
+            "INSERT INTO markets (name, creator_id, criteria) VALUES (?, ?, ?)", rows
+        )
+    return words
+
+
+def make_queries(words):
+    # A common, a mid-frequency and a rare word, a prefix and two-word searches
+    return [
+        words[10],
+        words[500],
+        words[5000],
+        words[300][:4] + "*",
+        f"{words[20]} {words[200]}",
+        f'"{words[0]} {words[1]}"',
+    ]
+
+
+def like_search(conn: sqlite3.Connection, q: str, limit: int = 20):
+    # Unranked substring match on every term, stopping at the first limit rows
+    terms = [t.strip('"*') for t in build_query(q).split(" AND ")]
+    where = " AND ".join(["(name LIKE ? OR criteria LIKE ?)"] * len(terms))
+    params = [p for t in terms for p in (f"%{t}%", f"%{t}%")]
+    return conn.execute(
+        f"SELECT id, name FROM markets WHERE {where} LIMIT ?", (*params, limit)
+    ).fetchall()
+
+
+def bench(fn, q: str, iterations: int) -> float:
+    """
+    Mean milliseconds per query.
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(q)
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+if __name__ == "__main__":
+    markets = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    conn = sqlite3.connect(":memory:")
+    create_schema(conn)
+    start = time.perf_counter()
+    queries = make_queries(generate(conn, markets))
+    load_seconds = time.perf_counter() - start
+
+    print(f"{markets} markets inserted and indexed in {load_seconds:.2f}s")
+    print(f"{'query':<24} {'matches':>8} {'fts5 ms':>10} {'LIKE ms':>10}")
+    for q in queries:
+        (matches,) = conn.execute(
+            "SELECT COUNT(*) FROM markets_fts WHERE markets_fts MATCH ?",
+            (build_query(q),),
+        ).fetchone()
+        fts_ms = bench(lambda q: search_markets(conn, q), q, iterations)
+        like_ms = bench(lambda q: like_search(conn, q), q, iterations)
+        print(f"{q:<24} {matches:>8} {fts_ms:>10.2f} {like_ms:>10.2f}")
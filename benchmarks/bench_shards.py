@@ -0,0 +1,112 @@
+"""
+Measure order entry throughput through /order with the markets matched in the
+web process and sharded across 1, 2, 4, ... worker processes. Orders come from
+concurrent clients spread evenly over the markets.
+
+Usage: python -m benchmarks.bench_shards [orders] [markets] [clients] [max_workers]
+    max_workers defaults to the number of CPUs.
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from db import server
+from db.migrate import create_schema
+from db.pool import close_pools
+from db.sequencer import close_sequencers
+
+
+def make_database(path: str, markets: int):
+    conn = sqlite3.connect(path)
+    create_schema(conn)
+    with conn:
+        conn.executemany(
+            "INSERT INTO markets (name, creator_id, criteria) VALUES (?, 1, '')",
+            ((f"market {i}",) for i in range(markets)),
+        )
+    conn.close()
+
+
+def make_orders(n: int, markets: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [
+        {
+            "market_id": rng.randint(1, markets),
+            "order_type": "limit",
+            "order_direction": rng.choice(("buy", "sell")),
+            "price": f"0.{rng.randint(40, 60)}",
+            "quantity": rng.randint(1, 10),
+        }
+        for _ in range(n)
+    ]
+
+
+def run(directory: str, workers: int, orders, markets: int, clients: int) -> float:
+    """
+    Place every order and return the orders placed per second.
+    """
+    path = os.path.join(directory, f"shards-{workers}.db")
+    make_database(path, markets)
+    server.app.config["DATABASE"] = path
+    server.app.config["EXPIRY_INTERVAL_SECONDS"] = None
+    server.app.config["MATCHING_WORKERS"] = workers
+    server.engine.clear()
+
+    def place(chunk, user_id):
+        client = server.app.test_client()
+        with client.session_transaction() as session:
+            session["user_id"] = user_id
+        for order in chunk:
+            res = client.post("/order", json=order)
+            assert res.status_code == 200, res.get_json()
+
+    # Warm up: start the workers and load every book
+    place([dict(orders[0], market_id=m, quantity=1) for m in range(1, markets + 1)], 0)
+
+    threads = [
+        threading.Thread(target=place, args=(orders[i::clients], i + 1))
+        for i in range(clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    server.stop_workers()
+    close_sequencers()
+    close_pools()
+    return len(orders) / elapsed
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    markets = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    clients = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+    max_workers = int(sys.argv[4]) if len(sys.argv) > 4 else os.cpu_count() or 1
+    orders = make_orders(n, markets)
+
+    counts = [0]
+    while counts[-1] < max_workers:
+        counts.append(max(1, counts[-1] * 2))
+
+    print(f"{n} orders over {markets} markets from {clients} clients")
+    print(f"{os.cpu_count()} CPUs")
+    print(f"{'workers':>8} {'orders/s':>10} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        baseline = None
+        for workers in counts:
+            rate = run(directory, workers, orders, markets, clients)
+            baseline = baseline or rate
+            label = workers or "in-proc"
+            print(f"{label:>8} {rate:>10.0f} {rate / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Compare two JSON reports written by benchmarks.run.
+
+Usage: python -m benchmarks.compare BASELINE.json CANDIDATE.json
+"""
+
+import json
+import sys
+from typing import Dict, Iterator, Tuple
+
+
+def flatten(results: Dict, prefix: str = "") -> Iterator[Tuple[str, float]]:
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f"{prefix}{key}.")
+        else:
+            yield f"{prefix}{key}", value
+
+
+def main():
+    if len(sys.argv) != 3:
+        print(__doc__.strip())
+        sys.exit(1)
+    with open(sys.argv[1]) as f:
+        baseline = json.load(f)
+    with open(sys.argv[2]) as f:
+        candidate = json.load(f)
+
+    old = dict(flatten(baseline["results"]))
+    new = dict(flatten(candidate["results"]))
+    print(
+        f"{'metric':<24}{baseline['commit']:>14}{candidate['commit']:>14}{'change':>10}"
+    )
+    for metric, before in old.items():
+        after = new.get(metric)
+        if after is None:
+            continue
+        change = (after - before) / before * 100 if before else 0.0
+        print(f"{metric:<24}{before:>14.3f}{after:>14.3f}{change:>+9.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Seeded synthetic data for benchmarks: markets, deep resting books and a long
+trade history, written to an on-disk SQLite file.
+"""
+
+import random
+import sqlite3
+from dataclasses import dataclass
+
+from db.candles import backfill_candles
+from db.migrate import create_schema
+from db.positions import rebuild_positions
+from db.timestamps import MICROS_PER_SECOND, parse_micros
+
+
+@dataclass
+class DataSize:
+    markets: int
+    users: int
+    orders_per_market: int  # resting orders per market, split across both sides
+    trades: int
+
+
+SIZES = {
+    "small": DataSize(markets=20, users=100, orders_per_market=200, trades=20_000),
+    "medium": DataSize(
+        markets=200, users=2_000, orders_per_market=1_000, trades=500_000
+    ),
+    "large": DataSize(
+        markets=1_000, users=20_000, orders_per_market=2_000, trades=3_000_000
+    ),
+}
+
+BATCH_SIZE = 50_000
+
+
+def generate(path: str, size: DataSize, seed: int = 0) -> None:
+    """
+    Create a database at path with the full schema and size's worth of data.
+    Bids rest between 1 and 49 cents and asks between 51 and 99 cents, so the
+    generated books are never crossed.
+    """
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    create_schema(conn)
+    conn.execute("PRAGMA journal_mode = WAL")
+
+    with conn:
+        conn.executemany(
+            "INSERT INTO markets (id, name, creator_id, criteria) VALUES (?, ?, ?, ?)",
+            [
+                (m, f"market-{m}", rng.randrange(size.users), "x" * 200)
+                for m in range(1, size.markets + 1)
+            ],
+        )
+
+    orders = []
+    for market_id in range(1, size.markets + 1):
+        for _ in range(size.orders_per_market):
+            if rng.random() < 0.5:
+                direction, price_cents = "buy", rng.randint(1, 49)
+            else:
+                direction, price_cents = "sell", rng.randint(51, 99)
+            orders.append(
+                (
+                    market_id,
+                    rng.randrange(size.users),
+                    "limit",
+                    direction,
+                    price_cents,
+                    rng.randint(1, 100),
+                )
+            )
+    _insert_batches(
+        conn,
+        "INSERT INTO orders (market_id, creator_id, order_type, order_direction, "
+        "price_cents, quantity) VALUES (?, ?, ?, ?, ?, ?)",
+        orders,
+    )
+
+    start = parse_micros("2023-01-01")
+    trades = (
+        (
+            rng.randint(1, size.markets),
+            rng.randrange(size.users),
+            rng.randrange(size.users),
+            rng.randint(1, 99),
+            rng.randint(1, 100),
+            start + i * MICROS_PER_SECOND,
+        )
+        for i in range(size.trades)
+    )
+    _insert_batches(
+        conn,
+        "INSERT INTO trades (market_id, buyer_id, seller_id, price_cents, quantity, "
+        "timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+        trades,
+    )
+
+    rebuild_positions(conn)
+    backfill_candles(conn)
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def _insert_batches(conn: sqlite3.Connection, sql: str, rows) -> None:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            with conn:
+                conn.executemany(sql, batch)
+            batch = []
+    with conn:
+        conn.executemany(sql, batch)
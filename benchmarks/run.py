@@ -0,0 +1,166 @@
+"""
+Benchmark order entry, /clob and /pnl against an on-disk database through the
+Flask test client.
+
+Usage: python -m benchmarks.run [--size small|medium|large] [--output FILE]
+
+Results are printed and written as JSON, which benchmarks.compare can diff
+between two runs, e.g. two commits.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from benchmarks.datagen import SIZES, generate
+from db import server
+from db.pool import close_pools
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    n = len(samples)
+    return {
+        "p50_ms": samples[n // 2] * 1000,
+        "p99_ms": samples[min(n - 1, n * 99 // 100)] * 1000,
+        "mean_ms": sum(samples) / n * 1000,
+    }
+
+
+def timed(fn: Callable[[], object], iterations: int) -> List[float]:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_orders(client, rng: random.Random, markets: int, n: int) -> Dict:
+    """
+    Random limit orders around the middle of the book, so a good share of them
+    cross and fill.
+    """
+    orders = [
+        {
+            "market_id": rng.randint(1, markets),
+            "order_type": "limit",
+            "order_direction": rng.choice(["buy", "sell"]),
+            "price": f"{rng.randint(40, 60) / 100:.2f}",
+            "quantity": rng.randint(1, 200),
+        }
+        for _ in range(n)
+    ]
+    it = iter(orders)
+    samples = timed(lambda: _ok(client.post("/order", json=next(it))), n)
+    return {"orders_per_sec": n / sum(samples), **percentiles(samples)}
+
+
+def bench_clob(client, rng: random.Random, markets: int, n: int) -> Dict:
+    samples = timed(
+        lambda: _ok(client.get(f"/clob?market_id={rng.randint(1, markets)}")), n
+    )
+    return percentiles(samples)
+
+
+def bench_pnl(client, rng: random.Random, users: int, markets: int, n: int) -> Dict:
+    def request():
+        with client.session_transaction() as session:
+            session["user_id"] = rng.randrange(users)
+        market = rng.choice(["all", str(rng.randint(1, markets))])
+        res = client.get(f"/pnl?market={market}")
+        assert res.status_code in (200, 404), res.get_data()
+
+    return percentiles(timed(request, n))
+
+
+def _ok(res):
+    assert res.status_code in (200, 304), res.get_data()
+    return res
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", choices=SIZES, default="small")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument(
+        "--data-dir",
+        help="Where to keep generated databases between runs (default: temporary)",
+    )
+    parser.add_argument("--output", help="Write JSON results here")
+    args = parser.parse_args()
+
+    size = SIZES[args.size]
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="predicord-bench-")
+    os.makedirs(data_dir, exist_ok=True)
+    template = os.path.join(data_dir, f"{args.size}-{args.seed}.db")
+    if not os.path.exists(template):
+        start = time.perf_counter()
+        generate(template, size, seed=args.seed)
+        print(f"Generated {template} in {time.perf_counter() - start:.1f}s")
+
+    # Order entry mutates the database, so every run works on a fresh copy
+    path = os.path.join(data_dir, "run.db")
+    shutil.copyfile(template, path)
+
+    server.app.config["DATABASE"] = path
+    server.app.config["EXPIRY_INTERVAL_SECONDS"] = None
+    server.engine.clear()
+    server.snapshots.clear()
+    rng = random.Random(args.seed)
+    n = args.iterations
+
+    results = {}
+    with server.app.test_client() as client:
+        with client.session_transaction() as session:
+            session["user_id"] = 0
+        # Load every book up front, so order entry measures matching rather
+        # than the first load of each book
+        start = time.perf_counter()
+        for market_id in range(1, size.markets + 1):
+            _ok(client.get(f"/clob?market_id={market_id}"))
+        results["book_load_s"] = time.perf_counter() - start
+
+        results["order"] = bench_orders(client, rng, size.markets, n)
+        results["clob"] = bench_clob(client, rng, size.markets, n)
+        results["pnl"] = bench_pnl(client, rng, size.users, size.markets, n)
+    close_pools()
+    if not args.data_dir:
+        shutil.rmtree(data_dir)
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "size": args.size,
+        "seed": args.seed,
+        "iterations": n,
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
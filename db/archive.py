@@ -0,0 +1,272 @@
+"""
+Hot/cold tiering of trades. Trades of resolved markets never change again and
+are only needed for history, so they are moved out of the main database into
+one archive file per period (year or month) of their timestamp. The hot trades
+table then only holds trades of open markets.
+
+History queries attach the archives with attach_archives(), which creates a
+temporary trades_history view over the hot table and every archive. The
+positions ledger and candles are unaffected by archiving; rebuilding them from
+scratch needs the archives attached (see db.positions and db.candles).
+
+Usage: python -m db.archive [--period year|month] [--no-vacuum] DATABASE DIRECTORY
+    Archive trades of resolved markets into DIRECTORY, then ANALYZE and VACUUM
+    the database and report the bytes reclaimed.
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+PERIODS = {"year": "%Y", "month": "%Y-%m"}
+HISTORY_VIEW = "trades_history"
+
+_ARCHIVE_RE = re.compile(r"^trades-(\d{4}(?:-\d{2})?)\.db$")
+_ARCHIVE_SCHEMA_RE = re.compile(r"^archive_\d{4}(?:_\d{2})?$")
+_COPIED_TABLE = "trades_archived"
+
+# Same columns as the trades table, without the triggers and foreign keys
+ARCHIVE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS archive.trades (
+        id INTEGER PRIMARY KEY,
+        market_id INTEGER NOT NULL,
+        buyer_id INTEGER NOT NULL,
+        seller_id INTEGER NOT NULL,
+        price_cents INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        timestamp INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS archive.trades_market_idx ON trades (market_id, timestamp);
+"""
+
+# Trades of the archives that didn't fit in the attached databases, see
+# attach_archives
+COPIED_TABLE_SQL = f"""
+    CREATE TEMP TABLE {_COPIED_TABLE} (
+        id INTEGER PRIMARY KEY,
+        market_id INTEGER NOT NULL,
+        buyer_id INTEGER NOT NULL,
+        seller_id INTEGER NOT NULL,
+        price_cents INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        timestamp INTEGER
+    );
+    CREATE INDEX temp.{_COPIED_TABLE}_market_idx ON {_COPIED_TABLE} (market_id, timestamp);
+"""
+
+RESOLVED_TRADES = """
+    market_id IN (SELECT id FROM main.markets WHERE resolved_at IS NOT NULL)
+    AND strftime(?, timestamp / 1000000, 'unixepoch') = ?
+"""
+
+
+@dataclass
+class ArchiveResult:
+    trades_moved: int
+    files: List[str]
+    seconds: float
+
+
+@dataclass
+class MaintenanceResult:
+    bytes_before: int
+    bytes_after: int
+    seconds: float
+
+    @property
+    def bytes_reclaimed(self) -> int:
+        return self.bytes_before - self.bytes_after
+
+
+def archive_path(directory: str, period: str) -> str:
+    return os.path.join(directory, f"trades-{period}.db")
+
+
+def archive_trades(
+    conn: sqlite3.Connection, directory: str, period: str = "year"
+) -> ArchiveResult:
+    """
+    Move the trades of resolved markets into per-period archives in directory,
+    one transaction per archive. Rows are copied before they are deleted and
+    only deleted once found in the archive, so an interrupted run loses nothing
+    and the next one picks up where it stopped.
+    """
+    start = time.perf_counter()
+    period_format = PERIODS[period]
+    os.makedirs(directory, exist_ok=True)
+    periods = [
+        p
+        for (p,) in conn.execute(
+            """
+            SELECT DISTINCT strftime(?, timestamp / 1000000, 'unixepoch') FROM trades
+            WHERE market_id IN (SELECT id FROM markets WHERE resolved_at IS NOT NULL)
+            """,
+            (period_format,),
+        )
+    ]
+
+    moved = 0
+    files = []
+    for p in periods:
+        path = archive_path(directory, p)
+        conn.execute("ATTACH DATABASE ? AS archive", (path,))
+        try:
+            conn.executescript(ARCHIVE_TABLE_SQL)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR IGNORE INTO archive.trades "
+                    f"SELECT * FROM main.trades WHERE {RESOLVED_TRADES}",
+                    (period_format, p),
+                )
+                moved += conn.execute(
+                    f"DELETE FROM main.trades WHERE {RESOLVED_TRADES} "
+                    "AND id IN (SELECT id FROM archive.trades)",
+                    (period_format, p),
+                ).rowcount
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        finally:
+            conn.execute("DETACH DATABASE archive")
+        files.append(path)
+
+    return ArchiveResult(moved, files, time.perf_counter() - start)
+
+
+def list_archives(directory: str) -> List[str]:
+    """
+    Periods archived in directory, oldest first.
+    """
+    if not os.path.isdir(directory):
+        return []
+    matches = (_ARCHIVE_RE.match(name) for name in os.listdir(directory))
+    return sorted(m.group(1) for m in matches if m)
+
+
+def attach_archives(
+    conn: sqlite3.Connection,
+    directory: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+) -> List[str]:
+    """
+    Attach the archives of directory to conn and (re)create the temporary
+    trades_history view over the hot trades table and all of them. start and
+    end, as ISO dates, limit the archives to the periods they cover. SQLite
+    only allows a handful of attached databases, so archives beyond the free
+    slots are copied into a temporary table one at a time instead. Returns the
+    schema names attached.
+    """
+    periods = [
+        p
+        for p in list_archives(directory)
+        if (start is None or p >= start[: len(p)])
+        and (end is None or p <= end[: len(p)])
+    ]
+    wanted = {"archive_" + p.replace("-", "_"): p for p in periods}
+
+    # Archives attached by an earlier call that aren't needed any more give
+    # their slots back
+    conn.execute(f"DROP VIEW IF EXISTS temp.{HISTORY_VIEW}")
+    attached = _attached(conn)
+    for schema in attached:
+        if _ARCHIVE_SCHEMA_RE.match(schema) and schema not in wanted:
+            conn.execute(f"DETACH DATABASE {schema}")
+    attached = _attached(conn)
+    free = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) - len(attached)
+    missing = [schema for schema in wanted if schema not in attached]
+    copied = []
+    if len(missing) > free:
+        # Keep a slot to copy the rest through
+        keep = max(free - 1, 0)
+        copied, missing = missing[keep:], missing[:keep]
+
+    for schema in missing:
+        conn.execute(
+            f"ATTACH DATABASE ? AS {schema}", (archive_path(directory, wanted[schema]),)
+        )
+    conn.execute(f"DROP TABLE IF EXISTS temp.{_COPIED_TABLE}")
+    if copied:
+        conn.executescript(COPIED_TABLE_SQL)
+        for schema in copied:
+            conn.execute(
+                "ATTACH DATABASE ? AS archive",
+                (archive_path(directory, wanted[schema]),),
+            )
+            try:
+                with conn:
+                    conn.execute(
+                        f"INSERT INTO temp.{_COPIED_TABLE} SELECT * FROM archive.trades"
+                    )
+            finally:
+                conn.execute("DETACH DATABASE archive")
+
+    schemas = [schema for schema in wanted if schema not in copied]
+    selects = ["SELECT * FROM main.trades"]
+    selects += [f"SELECT * FROM {schema}.trades" for schema in schemas]
+    if copied:
+        selects.append(f"SELECT * FROM temp.{_COPIED_TABLE}")
+    conn.execute(f"CREATE TEMP VIEW {HISTORY_VIEW} AS " + " UNION ALL ".join(selects))
+    return schemas
+
+
+def _attached(conn: sqlite3.Connection) -> List[str]:
+    names = [row[1] for row in conn.execute("PRAGMA database_list")]
+    return [name for name in names if name not in ("main", "temp")]
+
+
+def maintain(conn: sqlite3.Connection, vacuum: bool = True) -> MaintenanceResult:
+    """
+    Refresh the query planner's statistics with ANALYZE and, unless told not
+    to, rebuild the database with VACUUM to return the pages freed by archiving
+    to the file system. VACUUM needs exclusive access for its duration.
+    """
+    start = time.perf_counter()
+    conn.commit()
+    conn.execute("ANALYZE")
+    # Measured after ANALYZE, which adds its statistics tables
+    before = database_size(conn)
+    if vacuum:
+        conn.execute("VACUUM")
+    return MaintenanceResult(before, database_size(conn), time.perf_counter() - start)
+
+
+def database_size(conn: sqlite3.Connection) -> int:
+    (page_count,) = conn.execute("PRAGMA page_count").fetchone()
+    (page_size,) = conn.execute("PRAGMA page_size").fetchone()
+    return page_count * page_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive trades of resolved markets")
+    parser.add_argument("database")
+    parser.add_argument("directory")
+    parser.add_argument("--period", choices=PERIODS, default="year")
+    parser.add_argument("--no-vacuum", dest="vacuum", action="store_false")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database)
+    result = archive_trades(conn, args.directory, args.period)
+    print(
+        f"Archived {result.trades_moved} trades into {len(result.files)} files "
+        f"in {result.seconds:.2f}s"
+    )
+    for path in result.files:
+        print(f"  {path}: {os.path.getsize(path)} bytes")
+    maintenance = maintain(conn, args.vacuum)
+    print(
+        f"Reclaimed {maintenance.bytes_reclaimed} bytes "
+        f"({maintenance.bytes_before} -> {maintenance.bytes_after}) "
+        f"in {maintenance.seconds:.2f}s"
+    )
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
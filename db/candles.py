@@ -0,0 +1,169 @@
+"""
+OHLCV candles per market at fixed intervals, kept up to date in the same
+transaction as each trade insert. Deleting a trade doesn't update them; rebuild
+them with the backfill instead.
+
+Usage: python -m db.candles [path/to/database.db] [archive/directory]
+    Rebuild every candle from the trades table, and the archived trades if
+    given their directory.
+"""
+
+import sqlite3
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .archive import HISTORY_VIEW, attach_archives
+
+INTERVALS = {"1m": 60, "5m": 300, "1h": 3600, "1d": 86400}
+BACKFILL_BATCH_SIZE = 1000
+
+# Trades are stamped by their column default, from SQLite's clock, so the
+# bucket uses it too
+UPSERT_CANDLE_SQL = """
+    INSERT INTO candles (
+        market_id, interval_seconds, bucket_start,
+        open_cents, high_cents, low_cents, close_cents, volume, trade_count
+    )
+    VALUES (
+        ?1, ?2, CAST(strftime('%s', 'now') AS INTEGER) / ?2 * ?2, ?3, ?3, ?3, ?3, ?4, 1
+    )
+    ON CONFLICT (market_id, interval_seconds, bucket_start) DO UPDATE SET
+        high_cents = MAX(high_cents, excluded.high_cents),
+        low_cents = MIN(low_cents, excluded.low_cents),
+        close_cents = excluded.close_cents,
+        volume = volume + excluded.volume,
+        trade_count = trade_count + 1
+"""
+
+INSERT_CANDLE_SQL = """
+    INSERT INTO candles (
+        market_id, interval_seconds, bucket_start,
+        open_cents, high_cents, low_cents, close_cents, volume, trade_count
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+Candle = Tuple[int, int, int, int, int, int, int, int, int]
+
+
+def candle_rows(
+    market_id: int, price_cents: int, quantity: int
+) -> List[Tuple[int, int, int, int]]:
+    """
+    Rows for UPSERT_CANDLE_SQL recording a single trade, one per interval.
+    """
+    return [
+        (market_id, seconds, price_cents, quantity) for seconds in INTERVALS.values()
+    ]
+
+
+def iter_candles(rows: Iterator[tuple]) -> Iterator[Candle]:
+    """
+    Fold (market_id, epoch_seconds, price_cents, quantity) trade rows, ordered
+    by market and time, into complete candles for every interval. Only the bar
+    in progress per interval is held in memory.
+    """
+    current: Dict[int, list] = {}
+    for market_id, ts, price_cents, quantity in rows:
+        for seconds in INTERVALS.values():
+            bucket_start = ts // seconds * seconds
+            bar = current.get(seconds)
+            if bar is not None and bar[0] == market_id and bar[2] == bucket_start:
+                bar[4] = max(bar[4], price_cents)
+                bar[5] = min(bar[5], price_cents)
+                bar[6] = price_cents
+                bar[7] += quantity
+                bar[8] += 1
+                continue
+            if bar is not None:
+                yield tuple(bar)
+            current[seconds] = [
+                market_id,
+                seconds,
+                bucket_start,
+                price_cents,
+                price_cents,
+                price_cents,
+                price_cents,
+                quantity,
+                1,
+            ]
+    for bar in current.values():
+        yield tuple(bar)
+
+
+def backfill_candles(conn: sqlite3.Connection, table: str = "trades") -> int:
+    """
+    Rebuild every candle from trades in one transaction, streaming over the
+    trades in a single ordered pass. Returns the number of candles written.
+    Pass the trades_history view as table to include archived trades, see
+    db.archive.
+    """
+    count = 0
+    with conn:
+        conn.execute("DELETE FROM candles")
+        # A separate cursor, since the connection is written to while reading
+        trades = conn.cursor()
+        trades.execute(
+            f"""
+            SELECT market_id, timestamp / 1000000, price_cents, quantity
+            FROM {table}
+            ORDER BY market_id, timestamp, id
+            """
+        )
+        batch = []
+        for candle in iter_candles(trades):
+            batch.append(candle)
+            if len(batch) == BACKFILL_BATCH_SIZE:
+                conn.executemany(INSERT_CANDLE_SQL, batch)
+                count += len(batch)
+                batch = []
+        conn.executemany(INSERT_CANDLE_SQL, batch)
+        count += len(batch)
+    return count
+
+
+def get_candles(
+    conn: sqlite3.Connection,
+    market_id: int,
+    interval_seconds: int,
+    start: int = 0,
+    end: Optional[int] = None,
+) -> List[dict]:
+    """
+    Candles of a market with bucket_start in [start, end), oldest first.
+    """
+    end = int(time.time()) + 1 if end is None else end
+    rows = conn.execute(
+        """
+        SELECT bucket_start, open_cents, high_cents, low_cents, close_cents, volume, trade_count
+        FROM candles
+        WHERE market_id = ? AND interval_seconds = ? AND bucket_start >= ? AND bucket_start < ?
+        ORDER BY bucket_start
+        """,
+        (market_id, interval_seconds, start, end),
+    )
+    return [
+        {
+            "start": bucket_start,
+            "open_cents": open_cents,
+            "high_cents": high_cents,
+            "low_cents": low_cents,
+            "close_cents": close_cents,
+            "volume": volume,
+            "trades": trade_count,
+        }
+        for bucket_start, open_cents, high_cents, low_cents, close_cents, volume, trade_count in rows
+    ]
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "prediction_markets.db"
+    conn = sqlite3.connect(path)
+    table = "trades"
+    if len(sys.argv) > 2:
+        attach_archives(conn, sys.argv[2])
+        table = HISTORY_VIEW
+    print(f"Rebuilt {backfill_candles(conn, table)} candles")
+    conn.close()
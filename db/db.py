@@ -1,15 +1,68 @@
+import functools
 import logging
 import sqlite3
-from typing import List, Literal, Optional
+from typing import Callable, Dict, Iterator, List, Literal, Optional
 
-from .objects import Market, Order, Trade
+import numpy as np
+
+from .archive import HISTORY_VIEW
+from .objects import Market, MarketSummary, Order, Position, Settlement, Trade
+from .candles import UPSERT_CANDLE_SQL, candle_rows
+from .market_cache import MarketCache
+from .positions import UPSERT_POSITION_SQL, position_deltas
+from .timestamps import parse_micros
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_COLUMN_BATCH_SIZE = 100_000
+
+# Row type, market id column and time column of the tables that can be iterated
+TABLES = {
+    "markets": (Market, "id", "created_at"),
+    "orders": (Order, "market_id", "created_at"),
+    "trades": (Trade, "market_id", "timestamp"),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def row_factory(cls) -> Callable[[sqlite3.Cursor, tuple], tuple]:
+    """
+    A sqlite3 row factory returning rows as cls, one of the named tuples of
+    db.objects. The row tuple is reused as is, so the query must select every
+    field in order.
+    """
+    new = tuple.__new__
+
+    def factory(cursor, row):
+        return new(cls, row)
+
+    return factory
+
+
+def to_columns(cls, rows: List[tuple]) -> Dict[str, np.ndarray]:
+    """
+    A batch of rows of cls as one array per field. Integer columns become int64
+    arrays; columns of text, or with NULLs, arrays of str or object.
+    """
+    if all(t is int for t in cls.__annotations__.values()):
+        # Convert the whole batch at once and transpose it, unless a NULL made
+        # it an object array
+        table = np.array(rows)
+        if table.dtype.kind == "i":
+            return dict(zip(cls._fields, table.T.copy()))
+    return {name: np.array(column) for name, column in zip(cls._fields, zip(*rows))}
 
 
 class Database:
-    def __init__(self, conn: sqlite3.Connection):
+    def __init__(
+        self, conn: sqlite3.Connection, market_cache: Optional[MarketCache] = None
+    ):
         self.conn = conn
         self.conn.execute("PRAGMA foreign_keys = ON")
         self.cursor: Optional[sqlite3.Cursor] = None
+        # Markets are read through market_cache if given, and the markets changed
+        # in the current transaction are invalidated again once it ends
+        self.market_cache = market_cache
+        self._changed_markets = set()
 
     def __enter__(self):
         self.cursor = self.conn.cursor()
@@ -22,6 +75,10 @@ class Database:
             logging.warning("DB exception", exc_info=exc_info)
         else:
             self.conn.commit()
+        if self.market_cache is not None:
+            for market_id in self._changed_markets:
+                self.market_cache.invalidate(market_id)
+        self._changed_markets.clear()
 
         # Deliberately remove the cursor, so it can't be reused without the context
         # manager
@@ -31,6 +88,19 @@ class Database:
     def commit(self):
         self.conn.commit()
 
+    def _market_changed(self, market_id: int) -> None:
+        if self.market_cache is not None:
+            self.market_cache.invalidate(market_id)
+            self._changed_markets.add(market_id)
+
+    def _rows(self, cls, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        """
+        Run a query on a cursor of its own, with the row factory for cls.
+        """
+        cursor = self.conn.cursor()
+        cursor.row_factory = row_factory(cls)
+        return cursor.execute(sql, params)
+
     def create_market(self, name: str, creator_id: int, criteria: str) -> int:
         sql = "INSERT INTO markets (name, creator_id, criteria) VALUES (?, ?, ?)"
         self.cursor.execute(sql, (name, creator_id, criteria))
@@ -39,22 +109,41 @@ class Database:
     def update_market(self, market_id: int, name: str, criteria: str) -> None:
         sql = "UPDATE markets SET name = ?, criteria = ? WHERE id = ?"
         self.cursor.execute(sql, (name, criteria, market_id))
+        self._market_changed(market_id)
 
     def get_market_by_id(self, market_id: int) -> Optional[Market]:
+        if self.market_cache is not None:
+            return self.market_cache.get(self.conn, market_id)
         sql = "SELECT * FROM markets WHERE id = ?"
-        self.cursor.execute(sql, (market_id,))
-        res = self.cursor.fetchone()
-        return Market(*res) if res else None
+        return self._rows(Market, sql, (market_id,)).fetchone()
 
     def get_markets(self) -> List[Market]:
-        sql = "SELECT * FROM markets"
-        self.cursor.execute(sql)
-        markets = [Market(*m) for m in self.cursor.fetchall()]
-        return markets
+        return self._rows(Market, "SELECT * FROM markets").fetchall()
+
+    def list_markets(
+        self, before_id: Optional[int] = None, limit: int = 50
+    ) -> List[MarketSummary]:
+        """
+        Up to limit markets, newest first, starting after before_id if given.
+        """
+        sql = (
+            "SELECT id, name, creator_id, created_at, outcome, resolved_at "
+            "FROM markets WHERE id < ? ORDER BY id DESC LIMIT ?"
+        )
+        before_id = before_id if before_id is not None else 2**63 - 1
+        return self._rows(MarketSummary, sql, (before_id, limit)).fetchall()
+
+    def get_markets_version(self) -> int:
+        """
+        A number that changes whenever any market is created, updated or deleted.
+        """
+        self.cursor.execute("SELECT version FROM markets_version WHERE id = 1")
+        return self.cursor.fetchone()[0]
 
     def delete_market(self, market_id: int) -> None:
         sql = "DELETE FROM markets where id = ?"
         self.cursor.execute(sql, (market_id,))
+        self._market_changed(market_id)
 
     def create_order(
         self,
@@ -64,7 +153,7 @@ class Database:
         order_direction: Literal["buy", "sell"],
         price_cents: int,
         quantity: int,
-        expires_at: float,
+        expires_at: Optional[int],
     ) -> int:
         sql = (
             "INSERT INTO orders (market_id, creator_id, order_type, order_direction, "
@@ -85,10 +174,7 @@ class Database:
         return self.cursor.lastrowid
 
     def get_orders(self) -> List[Order]:
-        sql = "SELECT * FROM orders"
-        self.cursor.execute(sql)
-        orders = [Order(*o) for o in self.cursor.fetchall()]
-        return orders
+        return self._rows(Order, "SELECT * FROM orders").fetchall()
 
     def delete_order(self, order_id: int) -> None:
         sql = "DELETE FROM orders where id = ?"
@@ -109,14 +195,145 @@ class Database:
         self.cursor.execute(
             sql, (market_id, buyer_id, seller_id, price_cents, quantity)
         )
-        return self.cursor.lastrowid
+        trade_id = self.cursor.lastrowid
+        self.cursor.executemany(
+            UPSERT_POSITION_SQL,
+            position_deltas(market_id, buyer_id, seller_id, price_cents, quantity),
+        )
+        self.cursor.executemany(
+            UPSERT_CANDLE_SQL, candle_rows(market_id, price_cents, quantity)
+        )
+        return trade_id
 
     def get_trades(self) -> List[Trade]:
-        sql = "SELECT * FROM trades"
-        self.cursor.execute(sql)
-        trades = [Trade(*t) for t in self.cursor.fetchall()]
-        return trades
+        return self._rows(Trade, "SELECT * FROM trades").fetchall()
 
     def delete_trade(self, trade_id: int) -> None:
+        sql = (
+            "SELECT market_id, buyer_id, seller_id, price_cents, quantity "
+            "FROM trades WHERE id = ?"
+        )
+        self.cursor.execute(sql, (trade_id,))
+        res = self.cursor.fetchone()
+        if res is None:
+            return
+        market_id, buyer_id, seller_id, price_cents, quantity = res
+
+        # Reverse the trade's effect on the positions ledger
+        self.cursor.executemany(
+            UPSERT_POSITION_SQL,
+            position_deltas(market_id, seller_id, buyer_id, price_cents, quantity),
+        )
         sql = "DELETE FROM trades where id = ?"
         self.cursor.execute(sql, (trade_id,))
+
+    def get_position(self, user_id: int, market_id: int) -> Optional[Position]:
+        sql = "SELECT * FROM positions WHERE user_id = ? AND market_id = ?"
+        return self._rows(Position, sql, (user_id, market_id)).fetchone()
+
+    def get_settlements(self, market_id: int) -> List[Settlement]:
+        sql = "SELECT * FROM settlements WHERE market_id = ?"
+        return self._rows(Settlement, sql, (market_id,)).fetchall()
+
+    def _iter_batches(
+        self,
+        table: str,
+        market_id: Optional[int],
+        start: Optional[str],
+        end: Optional[str],
+        batch_size: int,
+        history: bool = False,
+        factory: Optional[Callable] = None,
+    ) -> Iterator[list]:
+        """
+        Yield every row of table matching the filters in id order, in batches
+        of batch_size, each read by its own LIMIT query resuming after the last
+        id seen, so memory use is flat. Unlike fetchmany on a single cursor, no
+        read transaction stays open between batches, which would hold back WAL
+        checkpoints for as long as a slow client takes to download. start and
+        end, as ISO dates, bound the table's time column, end exclusive. Rows
+        are built by factory if given, and plain tuples otherwise.
+        """
+        _, market_column, time_column = TABLES[table]
+        if history:
+            table = HISTORY_VIEW
+        where = ["id > ?"]
+        params = []
+        if market_id is not None:
+            where.append(f"{market_column} = ?")
+            params.append(market_id)
+        if start is not None:
+            where.append(f"{time_column} >= ?")
+            params.append(parse_micros(start))
+        if end is not None:
+            where.append(f"{time_column} < ?")
+            params.append(parse_micros(end))
+        sql = f"SELECT * FROM {table} WHERE {' AND '.join(where)} ORDER BY id LIMIT ?"
+
+        last_id = 0
+        while True:
+            cursor = self.conn.cursor()
+            cursor.row_factory = factory
+            rows = cursor.execute(sql, (last_id, *params, batch_size)).fetchall()
+            cursor.close()
+            if rows:
+                yield rows
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1][0]
+
+    def _iter_rows(self, table: str, *args, **kwargs) -> Iterator:
+        factory = row_factory(TABLES[table][0])
+        for batch in self._iter_batches(table, *args, **kwargs, factory=factory):
+            yield from batch
+
+    def iter_markets(
+        self,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> Iterator[Market]:
+        return self._iter_rows("markets", None, start, end, batch_size)
+
+    def iter_orders(
+        self,
+        market_id: Optional[int] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> Iterator[Order]:
+        return self._iter_rows("orders", market_id, start, end, batch_size)
+
+    def iter_trades(
+        self,
+        market_id: Optional[int] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        history: bool = False,
+    ) -> Iterator[Trade]:
+        """
+        With history, archived trades are included too, see db.archive.
+        """
+        return self._iter_rows("trades", market_id, start, end, batch_size, history)
+
+    def iter_columns(
+        self,
+        table: str,
+        market_id: Optional[int] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        batch_size: int = DEFAULT_COLUMN_BATCH_SIZE,
+        history: bool = False,
+    ) -> Iterator[Dict[str, np.ndarray]]:
+        """
+        The rows of table (markets, orders or trades) filtered as by the iter_*
+        methods, as batches of one array per column, see to_columns(). For
+        analytics over many rows, which then never become Python objects one
+        by one.
+        """
+        cls = TABLES[table][0]
+        for batch in self._iter_batches(
+            table, market_id, start, end, batch_size, history
+        ):
+            yield to_columns(cls, batch)
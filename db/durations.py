@@ -0,0 +1,102 @@
+"""
+Parsing of order durations into expiry timestamps.
+
+Accepted formats:
+
+    Format                  Example                 Meaning
+    ----------------------  ----------------------  ------------------------------
+    +<n><unit>...           +1y3m3w9d3h45m3s        now plus the given amounts
+    YYYY-MM-DD              2023-04-03              end of that day (23:59:59)
+    YYYY-MM-DD[T ]HH:MM     2023-04-03 12:00        that time
+    YYYY-MM-DD[T ]HH:MM:SS  2023-04-03T12:00:30     that time
+    anything else           next friday             free-form, via dateparser
+
+Relative units must appear in the order y, mo, w, d, h, m, s, each at most once.
+"m" is months when it follows "y" or comes before "w", "d" or "h", and minutes
+otherwise; "mo" is always months. So +3m is three minutes, +1y3m is a year and
+three months, and +1h3m is an hour and three minutes.
+
+Only free-form input imports dateparser, which is slow to import and to call.
+"""
+
+import calendar
+import re
+from datetime import datetime, time, timedelta
+from typing import Optional
+
+_RELATIVE_RE = re.compile(r"^\+(?:\d+(?:y|mo|w|d|h|m|s))+$")
+_TOKEN_RE = re.compile(r"(\d+)(y|mo|w|d|h|m|s)")
+_ISO_RE = re.compile(r"^\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?$")
+
+# Position of each unit in the grammar, "m" is resolved to "mo" or "min" first
+_UNIT_ORDER = {"y": 0, "mo": 1, "w": 2, "d": 3, "h": 4, "min": 5, "s": 6}
+
+
+def add_months(dt: datetime, months: int) -> datetime:
+    """
+    Add calendar months, clamping the day to the end of the resulting month.
+    """
+    month_index = dt.year * 12 + dt.month - 1 + months
+    year, month = divmod(month_index, 12)
+    day = min(dt.day, calendar.monthrange(year, month + 1)[1])
+    return dt.replace(year=year, month=month + 1, day=day)
+
+
+def parse_relative(duration: str, now: datetime) -> datetime:
+    """
+    Parse a duration like +1y3m3w9d3h45m3s relative to now.
+    """
+    if not _RELATIVE_RE.match(duration):
+        raise ValueError("Invalid relative duration format")
+
+    tokens = _TOKEN_RE.findall(duration)
+    units = [unit for _, unit in tokens]
+    amounts = {}
+    for i, (amount, unit) in enumerate(tokens):
+        if unit == "m":
+            after_year = i > 0 and units[i - 1] == "y"
+            before_day = any(u in ("w", "d", "h") for u in units[i + 1 :])
+            unit = "mo" if after_year or before_day else "min"
+        if unit in amounts or any(_UNIT_ORDER[u] > _UNIT_ORDER[unit] for u in amounts):
+            raise ValueError("Invalid relative duration format")
+        amounts[unit] = int(amount)
+
+    try:
+        expires_at = add_months(now, 12 * amounts.get("y", 0) + amounts.get("mo", 0))
+        return expires_at + timedelta(
+            weeks=amounts.get("w", 0),
+            days=amounts.get("d", 0),
+            hours=amounts.get("h", 0),
+            minutes=amounts.get("min", 0),
+            seconds=amounts.get("s", 0),
+        )
+    except OverflowError:
+        # Too far out for a datetime
+        raise ValueError("Invalid relative duration format")
+
+
+def parse_duration(duration: str, now: Optional[datetime] = None) -> datetime:
+    """
+    Return the expiry timestamp for an order duration, see the module docstring
+    for the accepted formats. Raises ValueError if it can't be parsed.
+    """
+    now = now or datetime.now()
+    duration = duration.strip()
+
+    if duration.startswith("+"):
+        return parse_relative(duration, now)
+
+    if _ISO_RE.match(duration):
+        expires_at = datetime.fromisoformat(duration)
+    else:
+        import dateparser  # free-form input only, see module docstring
+
+        expires_at = dateparser.parse(
+            duration, settings={"RELATIVE_BASE": now.replace(tzinfo=None)}
+        )
+        if expires_at is None:
+            raise ValueError("Invalid ISO date format")
+
+    if expires_at.time() == time(0, 0, 0):
+        expires_at = expires_at.replace(hour=23, minute=59, second=59)
+    return expires_at
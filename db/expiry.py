@@ -0,0 +1,150 @@
+import functools
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from .journal import Journal, expire_event
+from .matching import MatchingEngine, OrderBook, RestingOrder
+from .sequencer import Transaction, WriteSequencer
+from .timestamps import now_micros
+
+DEFAULT_INTERVAL_SECONDS = 1.0
+DEFAULT_BATCH_SIZE = 500
+
+# One batch of expired orders of markets without a loaded book, given now, a
+# JSON array of the loaded market ids and the batch size
+EXPIRE_ON_DISK_SQL = """
+    DELETE FROM orders WHERE id IN (
+        SELECT id FROM orders
+        WHERE expires_at <= ?
+            AND market_id NOT IN (SELECT value FROM json_each(?))
+        LIMIT ?
+    )
+"""
+
+
+@dataclass
+class SweepResult:
+    in_memory: int  # orders removed from loaded books
+    on_disk: int  # orders of markets without a loaded book
+    seconds: float
+
+    @property
+    def total(self) -> int:
+        return self.in_memory + self.on_disk
+
+
+class ExpiryScheduler:
+    """
+    Periodically deletes expired orders, so reads and matching never need to
+    filter on expires_at.
+
+    Loaded books are swept through their expiry heaps and every book change is
+    reported to on_expired. Orders of markets that have no book in memory are
+    deleted straight from the table in batches of batch_size, using the expiry
+    index.
+    """
+
+    def __init__(
+        self,
+        engine: MatchingEngine,
+        interval_seconds: float = DEFAULT_INTERVAL_SECONDS,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        on_expired: Optional[Callable[[OrderBook, List[RestingOrder]], None]] = None,
+    ):
+        self.engine = engine
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.on_expired = on_expired
+        # Set to a Journal to record the orders expired from loaded books
+        self.journal: Optional[Journal] = None
+
+        self.sweeps = 0
+        self.expired_total = 0
+        self.last_result: Optional[SweepResult] = None
+
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def sweep(self, tx: Transaction, now: Optional[int] = None) -> SweepResult:
+        """
+        Write command removing everything that has expired by now, in epoch
+        microseconds.
+        """
+        start = time.perf_counter()
+        now = now_micros() if now is None else now
+        conn = tx.conn
+
+        in_memory = 0
+        for book in self.engine.books():
+            with book.lock:
+                expiry = book.next_expiry()
+                if expiry is None or expiry > now:
+                    continue
+                tx.on_rollback(functools.partial(self.engine.discard, book.market_id))
+                expired = book.expire(now)
+                conn.executemany(
+                    "DELETE FROM orders WHERE id = ?",
+                    [(order.id,) for order in expired],
+                )
+                in_memory += len(expired)
+                if self.journal is not None:
+                    self.journal.record(
+                        tx, [expire_event(book.market_id, o.id) for o in expired]
+                    )
+                if self.on_expired is not None:
+                    tx.on_commit(functools.partial(self.on_expired, book, expired))
+
+        # No book may be loaded while deleting rows behind its back
+        on_disk = 0
+        with self.engine.loading_paused() as loaded:
+            loaded_json = "[" + ",".join(map(str, loaded)) + "]"
+            while True:
+                cursor = conn.execute(
+                    EXPIRE_ON_DISK_SQL, (now, loaded_json, self.batch_size)
+                )
+                on_disk += cursor.rowcount
+                if cursor.rowcount < self.batch_size:
+                    break
+
+        result = SweepResult(in_memory, on_disk, time.perf_counter() - start)
+        self.sweeps += 1
+        self.expired_total += result.total
+        self.last_result = result
+        if result.total:
+            logging.info(
+                f"Expired {result.total} orders ({result.in_memory} in memory, "
+                f"{result.on_disk} on disk) in {result.seconds * 1000:.1f}ms"
+            )
+        return result
+
+    def start(self, sequencer: WriteSequencer) -> None:
+        """
+        Start sweeping in a background thread, if not already running. Sweeps
+        are submitted to sequencer like any other write.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(sequencer,), name="order-expiry", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+    def _run(self, sequencer: WriteSequencer) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                sequencer.submit(self.sweep)
+            except Exception as e:
+                logging.error(f"Error expiring orders: {str(e)}")
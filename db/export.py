@@ -0,0 +1,127 @@
+"""
+Streaming CSV and NDJSON export of markets, orders and trades. Rows are read
+in keyset-paginated batches and written out batch by batch, so memory use stays
+flat however large the table is.
+
+Usage: python -m db.export [--format csv|ndjson] [--market-id ID] [--from TIME]
+                           [--to TIME] [--output FILE] DATABASE TABLE
+    Export TABLE (markets, orders or trades) to FILE, or stdout.
+"""
+
+import argparse
+import csv
+import io
+import json
+import sqlite3
+import sys
+from typing import Iterable, Iterator, Optional
+
+from .db import DEFAULT_BATCH_SIZE, Database
+from .objects import Market, Order, Trade
+
+TABLES = {"markets": Market, "orders": Order, "trades": Trade}
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def iter_table(
+    db: Database,
+    table: str,
+    market_id: Optional[int] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    history: bool = False,
+) -> Iterator:
+    if table == "markets":
+        return db.iter_markets(start, end, batch_size)
+    if table == "orders":
+        return db.iter_orders(market_id, start, end, batch_size)
+    if table == "trades":
+        return db.iter_trades(market_id, start, end, batch_size, history)
+    raise ValueError(f"Unknown table: {table}")
+
+
+def _batches(rows: Iterable, batch_size: int) -> Iterator[list]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def to_csv(
+    rows: Iterable, columns: Iterable[str], batch_size: int = DEFAULT_BATCH_SIZE
+) -> Iterator[str]:
+    """
+    CSV text for rows, a header line and then one chunk per batch.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    for batch in _batches(rows, batch_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue()
+
+
+def to_ndjson(rows: Iterable, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[str]:
+    """
+    One JSON object per named tuple row and line, in one chunk per batch.
+    """
+    for batch in _batches(rows, batch_size):
+        yield "".join(json.dumps(row._asdict(), default=str) + "\n" for row in batch)
+
+
+def export(
+    db: Database,
+    table: str,
+    format: str = "csv",
+    market_id: Optional[int] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    history: bool = False,
+) -> Iterator[str]:
+    """
+    Chunks of table in the given format, see iter_table for the filters. With
+    history, trades include the archived ones attached with
+    db.archive.attach_archives.
+    """
+    rows = iter_table(db, table, market_id, start, end, batch_size, history)
+    if format == "csv":
+        return to_csv(rows, TABLES[table]._fields, batch_size)
+    if format == "ndjson":
+        return to_ndjson(rows, batch_size)
+    raise ValueError(f"Unknown format: {format}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a table as CSV or NDJSON")
+    parser.add_argument("database")
+    parser.add_argument("table", choices=TABLES)
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--market-id", type=int)
+    parser.add_argument("--from", dest="start")
+    parser.add_argument("--to", dest="end")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    db = Database(sqlite3.connect(args.database))
+    chunks = export(db, args.table, args.format, args.market_id, args.start, args.end)
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+        db.conn.close()
+
+
+if __name__ == "__main__":
+    main()
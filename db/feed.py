@@ -0,0 +1,156 @@
+import json
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Set, Tuple
+
+DEFAULT_MAX_PENDING = 256
+
+
+class Subscriber:
+    """
+    One consumer of a market's feed.
+
+    Depth updates are coalesced per (side, price), so a slow consumer only ever
+    sees the latest quantity at each level. Other messages, e.g. trade prints,
+    are queued in order up to max_pending; past that the subscriber is marked as
+    overflowed, its backlog is dropped, and the consumer is expected to resync
+    from a fresh snapshot.
+    """
+
+    def __init__(self, max_pending: int = DEFAULT_MAX_PENDING):
+        self.max_pending = max_pending
+        self.overflowed = False
+        self.closed = False
+        self._cond = threading.Condition()
+        self._levels: "OrderedDict[Tuple[str, int], int]" = OrderedDict()
+        self._messages: deque = deque()
+
+    def _pending(self) -> bool:
+        return bool(self._levels or self._messages or self.overflowed or self.closed)
+
+    def push_level(self, side: str, price_cents: int, total_quantity: int) -> None:
+        with self._cond:
+            self._levels[(side, price_cents)] = total_quantity
+            self._cond.notify()
+
+    def push(self, event: str, data: dict) -> None:
+        with self._cond:
+            if len(self._messages) >= self.max_pending:
+                self.overflowed = True
+                self._messages.clear()
+                self._levels.clear()
+            else:
+                self._messages.append((event, data))
+            self._cond.notify()
+
+    def close(self) -> None:
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+    def drain(self, timeout: Optional[float] = None) -> List[Tuple[str, dict]]:
+        """
+        Wait up to timeout for messages and return everything pending. Returns an
+        empty list on timeout. If the subscriber overflowed, a single ("resync",
+        {}) message is returned instead and the flag is reset.
+        """
+        with self._cond:
+            self._cond.wait_for(self._pending, timeout)
+            if self.overflowed:
+                self.overflowed = False
+                return [("resync", {})]
+            messages = list(self._messages)
+            messages.extend(
+                ("depth", {"side": s, "price_cents": p, "total_quantity": q})
+                for (s, p), q in self._levels.items()
+            )
+            self._messages.clear()
+            self._levels.clear()
+            return messages
+
+
+class MarketFeed:
+    """
+    Fan-out of book and trade updates to every subscriber of a market.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[int, Set[Subscriber]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(
+        self, market_id: int, max_pending: int = DEFAULT_MAX_PENDING
+    ) -> Subscriber:
+        subscriber = Subscriber(max_pending)
+        with self._lock:
+            self._subscribers.setdefault(market_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, market_id: int, subscriber: Subscriber) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(market_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[market_id]
+
+    def subscribers(self, market_id: int) -> List[Subscriber]:
+        with self._lock:
+            return list(self._subscribers.get(market_id, ()))
+
+    def publish_level(
+        self, market_id: int, side: str, price_cents: int, total_quantity: int
+    ) -> None:
+        for subscriber in self.subscribers(market_id):
+            subscriber.push_level(side, price_cents, total_quantity)
+
+    def publish(self, market_id: int, event: str, data: dict) -> None:
+        for subscriber in self.subscribers(market_id):
+            subscriber.push(event, data)
+
+    def close(self, market_id: int) -> None:
+        """
+        End every stream for a market, e.g. once it has been resolved.
+        """
+        for subscriber in self.subscribers(market_id):
+            subscriber.close()
+
+
+class RelayFeed:
+    """
+    Stands in for a MarketFeed in another process: every publication is put on
+    events as a (method, args) pair, to be replayed on the real feed there with
+    replay().
+    """
+
+    def __init__(self, events):
+        self.events = events
+
+    def publish_level(
+        self, market_id: int, side: str, price_cents: int, total_quantity: int
+    ) -> None:
+        self.events.put(
+            ("publish_level", (market_id, side, price_cents, total_quantity))
+        )
+
+    def publish(self, market_id: int, event: str, data: dict) -> None:
+        self.events.put(("publish", (market_id, event, data)))
+
+    def close(self, market_id: int) -> None:
+        self.events.put(("close", (market_id,)))
+
+
+RELAYED_METHODS = {"publish_level", "publish", "close"}
+
+
+def replay(feed: MarketFeed, method: str, args: tuple) -> None:
+    """
+    Apply a publication relayed by a RelayFeed.
+    """
+    if method not in RELAYED_METHODS:
+        raise ValueError(f"Unknown feed method: {method}")
+    getattr(feed, method)(*args)
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
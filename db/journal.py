@@ -0,0 +1,543 @@
+"""
+Append-only journal of order book events, plus snapshots of every market's
+resting orders, so the in-memory books can be rebuilt on startup from the
+latest snapshot and the journal written since, rather than from the orders
+table.
+
+Events are fixed-size binary records, each with a sequence number and a CRC,
+appended to the current segment file once the transaction that produced them
+has committed. The sequence number of the last event is also written to the
+journal_state table in that transaction, so a journal that lost its tail, e.g.
+in a crash between the commit and the append, is detected on replay and
+rebuilt from the database instead.
+
+A snapshot is a header followed by one fixed-size record per resting order,
+grouped by market in time priority, read back through mmap. Taking one starts
+a new segment and deletes everything the snapshot covers, so replay is bounded
+by the number of events since the last snapshot.
+
+Orders removed by the expiry sweeper without their book being loaded aren't
+journaled; replay drops orders that have expired instead.
+
+Usage: python -m db.journal DATABASE DIRECTORY
+    Rebuild the books from the journal in DIRECTORY, checked against DATABASE,
+    and print what was replayed.
+"""
+
+import functools
+import logging
+import mmap
+import os
+import re
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from .matching import Fill, OrderBook, RestingOrder
+from .sequencer import Transaction
+from .timestamps import now_micros
+
+ACCEPT, FILL, CANCEL, EXPIRE, RESOLVE = range(1, 6)
+DEFAULT_SNAPSHOT_EVERY = 100_000
+
+# seq, kind, direction, market_id, order_id, user_id, price_cents, quantity,
+# remaining, expires_at; followed by a CRC32 of those bytes
+RECORD = struct.Struct("<QBbqqqqqqq")
+CRC = struct.Struct("<I")
+RECORD_SIZE = RECORD.size + CRC.size
+
+SNAPSHOT_MAGIC = b"PMSNAP01"
+# magic, seq, order count, CRC32 of the orders
+SNAPSHOT_HEADER = struct.Struct("<8sQQI")
+# market_id, order_id, user_id, direction, price_cents, quantity, expires_at
+SNAPSHOT_ORDER = struct.Struct("<qqqbqqq")
+
+_SEGMENT_RE = re.compile(r"journal-(\d{20})\.log")
+_SNAPSHOT_RE = re.compile(r"snapshot-(\d{20})\.bin")
+
+_NO_EXPIRY = -1
+
+# order_id -> [user_id, direction, price_cents, quantity, expires_at], in time
+# priority
+OrderState = Dict[int, list]
+
+
+@dataclass
+class Event:
+    kind: int
+    market_id: int
+    order_id: int = 0
+    user_id: int = 0
+    order_direction: Optional[str] = None
+    price_cents: int = 0
+    quantity: int = 0
+    remaining: int = 0
+    expires_at: Optional[int] = None
+
+
+def accept_event(market_id: int, order: RestingOrder) -> Event:
+    return Event(
+        ACCEPT,
+        market_id,
+        order.id,
+        order.user_id,
+        order.order_direction,
+        order.price_cents,
+        order.quantity,
+        order.quantity,
+        order.expires_at,
+    )
+
+
+def fill_event(market_id: int, fill: Fill) -> Event:
+    return Event(
+        FILL,
+        market_id,
+        fill.order_id,
+        fill.user_id,
+        price_cents=fill.price_cents,
+        quantity=fill.quantity,
+        remaining=fill.remaining,
+    )
+
+
+def cancel_event(market_id: int, order_id: int) -> Event:
+    return Event(CANCEL, market_id, order_id)
+
+
+def expire_event(market_id: int, order_id: int) -> Event:
+    return Event(EXPIRE, market_id, order_id)
+
+
+def resolve_event(market_id: int) -> Event:
+    return Event(RESOLVE, market_id)
+
+
+def _expiry(expires_at: Optional[int]) -> int:
+    return _NO_EXPIRY if expires_at is None else expires_at
+
+
+def _direction(order_direction: Optional[str]) -> int:
+    if order_direction is None:
+        return 0
+    return 1 if order_direction == "buy" else -1
+
+
+def encode(seq: int, event: Event) -> bytes:
+    body = RECORD.pack(
+        seq,
+        event.kind,
+        _direction(event.order_direction),
+        event.market_id,
+        event.order_id,
+        event.user_id,
+        event.price_cents,
+        event.quantity,
+        event.remaining,
+        _expiry(event.expires_at),
+    )
+    return body + CRC.pack(zlib.crc32(body))
+
+
+def read_segment(path: str) -> Tuple[List[tuple], int]:
+    """
+    Decode every intact record of a segment. Returns the records and the length
+    of the segment up to the first torn or corrupt one.
+    """
+    records = []
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < RECORD_SIZE:
+            return records, 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            offset = 0
+            while offset + RECORD_SIZE <= size:
+                body = mm[offset : offset + RECORD.size]
+                (crc,) = CRC.unpack_from(mm, offset + RECORD.size)
+                if zlib.crc32(body) != crc:
+                    break
+                records.append(RECORD.unpack(body))
+                offset += RECORD_SIZE
+    return records, offset
+
+
+def apply_records(markets: Dict[int, OrderState], records: List[tuple]) -> None:
+    for (
+        _,
+        kind,
+        direction,
+        market_id,
+        order_id,
+        user_id,
+        price_cents,
+        quantity,
+        remaining,
+        expires_at,
+    ) in records:
+        if kind == ACCEPT:
+            orders = markets.get(market_id)
+            if orders is None:
+                orders = markets[market_id] = {}
+            orders[order_id] = [user_id, direction, price_cents, quantity, expires_at]
+        elif kind == FILL:
+            orders = markets.get(market_id, {})
+            if remaining == 0:
+                orders.pop(order_id, None)
+            elif order_id in orders:
+                orders[order_id][3] = remaining
+        elif kind == CANCEL or kind == EXPIRE:
+            markets.get(market_id, {}).pop(order_id, None)
+        elif kind == RESOLVE:
+            markets.pop(market_id, None)
+
+
+def write_snapshot(path: str, seq: int, markets: Dict[int, OrderState]) -> int:
+    """
+    Write a snapshot atomically, returning the number of orders in it.
+    """
+    body = bytearray()
+    count = 0
+    for market_id, orders in markets.items():
+        for order_id, (
+            user_id,
+            direction,
+            price,
+            quantity,
+            expires_at,
+        ) in orders.items():
+            body += SNAPSHOT_ORDER.pack(
+                market_id, order_id, user_id, direction, price, quantity, expires_at
+            )
+            count += 1
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, seq, count, zlib.crc32(body))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(body)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return count
+
+
+def read_snapshot(path: str) -> Tuple[int, Dict[int, OrderState]]:
+    """
+    Load a snapshot, returning its sequence number and orders. Raises
+    ValueError if it is corrupt.
+    """
+    markets: Dict[int, OrderState] = {}
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        magic, seq, count, crc = SNAPSHOT_HEADER.unpack_from(mm)
+        end = SNAPSHOT_HEADER.size + count * SNAPSHOT_ORDER.size
+        if magic != SNAPSHOT_MAGIC or len(mm) != end:
+            raise ValueError(f"Not a valid snapshot: {path}")
+        view = memoryview(mm)[SNAPSHOT_HEADER.size : end]
+        try:
+            if zlib.crc32(view) != crc:
+                raise ValueError(f"Snapshot checksum mismatch: {path}")
+            orders = None
+            current = None
+            for (
+                market_id,
+                order_id,
+                user_id,
+                direction,
+                price_cents,
+                quantity,
+                expires_at,
+            ) in SNAPSHOT_ORDER.iter_unpack(view):
+                if market_id != current:
+                    current = market_id
+                    orders = markets.setdefault(market_id, {})
+                orders[order_id] = [
+                    user_id,
+                    direction,
+                    price_cents,
+                    quantity,
+                    expires_at,
+                ]
+        finally:
+            view.release()
+    return seq, markets
+
+
+# Every market's resting orders, grouped by market in time priority
+READ_ORDERS_SQL = """
+    SELECT market_id, id, creator_id, order_direction, price_cents, quantity, expires_at
+    FROM orders
+    WHERE order_type = 'limit'
+    ORDER BY market_id, created_at, id
+"""
+
+
+def read_orders(conn: sqlite3.Connection) -> Dict[int, OrderState]:
+    """
+    Every market's resting orders as stored in the database.
+    """
+    markets: Dict[int, OrderState] = {}
+    rows = conn.execute(READ_ORDERS_SQL)
+    for market_id, order_id, user_id, direction, price, quantity, expires_at in rows:
+        markets.setdefault(market_id, {})[order_id] = [
+            user_id,
+            _direction(direction),
+            price,
+            quantity,
+            _expiry(expires_at),
+        ]
+    return markets
+
+
+def build_books(
+    markets: Dict[int, OrderState], now: Optional[int] = None
+) -> Dict[int, OrderBook]:
+    """
+    Order books for the given orders, leaving out any that have expired as of
+    now, in epoch microseconds.
+    """
+    now = now_micros() if now is None else now
+    books = {}
+    for market_id, orders in markets.items():
+        book = OrderBook(market_id)
+        for order_id, (
+            user_id,
+            direction,
+            price,
+            quantity,
+            expires_at,
+        ) in orders.items():
+            if expires_at != _NO_EXPIRY and expires_at <= now:
+                continue
+            book.add(
+                RestingOrder(
+                    id=order_id,
+                    user_id=user_id,
+                    order_direction="buy" if direction > 0 else "sell",
+                    price_cents=price,
+                    quantity=quantity,
+                    expires_at=None if expires_at == _NO_EXPIRY else expires_at,
+                )
+            )
+        if len(book):
+            books[market_id] = book
+    return books
+
+
+@dataclass
+class ReplayResult:
+    seq: int  # last event applied
+    snapshot_orders: int
+    events: int
+    seconds: float
+    markets: Dict[int, OrderState]
+
+
+def _list_files(directory: str, pattern: re.Pattern) -> List[Tuple[int, str]]:
+    files = []
+    for name in os.listdir(directory):
+        match = pattern.fullmatch(name)
+        if match:
+            files.append((int(match.group(1)), os.path.join(directory, name)))
+    return sorted(files)
+
+
+def replay(directory: str) -> Optional[ReplayResult]:
+    """
+    Rebuild every market's orders from the latest snapshot in directory and the
+    journal since. Returns None if there is no usable snapshot.
+    """
+    start = time.perf_counter()
+    snapshots = _list_files(directory, _SNAPSHOT_RE)
+    if not snapshots:
+        return None
+    try:
+        seq, markets = read_snapshot(snapshots[-1][1])
+    except (ValueError, struct.error) as e:
+        logging.warning(f"Ignoring journal snapshot: {str(e)}")
+        return None
+    snapshot_orders = sum(len(orders) for orders in markets.values())
+
+    events = 0
+    for _, path in _list_files(directory, _SEGMENT_RE):
+        records, _ = read_segment(path)
+        records = [r for r in records if r[0] > seq]
+        if records:
+            apply_records(markets, records)
+            events += len(records)
+            seq = records[-1][0]
+
+    return ReplayResult(
+        seq, snapshot_orders, events, time.perf_counter() - start, markets
+    )
+
+
+class Journal:
+    """
+    Writer side of the journal in directory. Events are assigned sequence
+    numbers by record(), which must be called from write commands, and
+    appended once the command commits. Once snapshot_every events have been
+    appended since the last snapshot, snapshot_due is set and snapshot() should
+    be submitted.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        snapshot_every: int = DEFAULT_SNAPSHOT_EVERY,
+        fsync: bool = False,
+    ):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.last_seq = 0
+        self.snapshot_seq = 0
+        self.snapshot_due = False
+        self.last_replay: Optional[ReplayResult] = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def recover(self, tx: Transaction) -> Dict[int, OrderBook]:
+        """
+        Write command rebuilding the books, from the journal if it agrees with
+        the database and from the orders table otherwise, and opening the
+        journal for writing.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        (db_seq,) = tx.conn.execute(
+            "SELECT last_seq FROM journal_state WHERE id = 1"
+        ).fetchone()
+
+        result = replay(self.directory)
+        if result is None or result.seq != db_seq:
+            if result is not None:
+                logging.warning(
+                    f"Journal ends at event {result.seq} but the database is at "
+                    f"{db_seq}, rebuilding it from the database"
+                )
+            start = time.perf_counter()
+            markets = read_orders(tx.conn)
+            self._write_snapshot(db_seq, markets)
+            count = sum(len(orders) for orders in markets.values())
+            result = ReplayResult(
+                db_seq, count, 0, time.perf_counter() - start, markets
+            )
+        else:
+            self.last_seq = result.seq
+            self.snapshot_seq = self._latest_snapshot_seq()
+            self._open_segment()
+
+        self.last_seq = result.seq
+        self.last_replay = result
+        logging.info(
+            f"Replayed {result.snapshot_orders} snapshot orders and "
+            f"{result.events} events in {result.seconds * 1000:.1f}ms"
+        )
+        return build_books(result.markets)
+
+    def record(self, tx: Transaction, events: List[Event]) -> None:
+        """
+        Assign sequence numbers to events, to be appended if tx commits.
+        """
+        if not events:
+            return
+        data = bytearray()
+        for event in events:
+            self.last_seq += 1
+            data += encode(self.last_seq, event)
+        tx.conn.execute(
+            "UPDATE journal_state SET last_seq = ? WHERE id = 1", (self.last_seq,)
+        )
+        tx.on_commit(functools.partial(self._append, bytes(data), self.last_seq))
+
+    def snapshot(self, tx: Transaction) -> None:
+        """
+        Write command snapshotting every market's orders as of the last event
+        recorded, then starting a new segment.
+        """
+        if not self.snapshot_due:
+            return
+        self.snapshot_due = False
+        seq = self.last_seq
+        markets = read_orders(tx.conn)
+        tx.on_commit(functools.partial(self._write_snapshot, seq, markets))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _append(self, data: bytes, seq: int) -> None:
+        with self._lock:
+            self._file.write(data)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        if seq - self.snapshot_seq >= self.snapshot_every:
+            self.snapshot_due = True
+
+    def _write_snapshot(self, seq: int, markets: Dict[int, OrderState]) -> None:
+        path = os.path.join(self.directory, f"snapshot-{seq:020d}.bin")
+        write_snapshot(path, seq, markets)
+        self.snapshot_seq = seq
+        self.close()
+        # Everything before the snapshot is no longer needed
+        for pattern in (_SEGMENT_RE, _SNAPSHOT_RE):
+            for _, old_path in _list_files(self.directory, pattern):
+                if old_path != path:
+                    os.remove(old_path)
+        self._open_segment(seq + 1)
+
+    def _latest_snapshot_seq(self) -> int:
+        snapshots = _list_files(self.directory, _SNAPSHOT_RE)
+        return snapshots[-1][0] if snapshots else 0
+
+    def _open_segment(self, first_seq: Optional[int] = None) -> None:
+        """
+        Open a new segment starting at first_seq, or reopen the latest one,
+        cutting off anything after its last intact record.
+        """
+        segments = _list_files(self.directory, _SEGMENT_RE)
+        if first_seq is None and segments:
+            path = segments[-1][1]
+            _, length = read_segment(path)
+            with open(path, "r+b") as f:
+                f.truncate(length)
+        else:
+            first_seq = self.last_seq + 1 if first_seq is None else first_seq
+            path = os.path.join(self.directory, f"journal-{first_seq:020d}.log")
+        with self._lock:
+            self._file = open(path, "ab")
+
+
+def main():
+    if len(sys.argv) != 3:
+        print(__doc__)
+        sys.exit(1)
+    database, directory = sys.argv[1:]
+    conn = sqlite3.connect(database)
+    (db_seq,) = conn.execute("SELECT last_seq FROM journal_state").fetchone()
+    conn.close()
+
+    result = replay(directory)
+    if result is None:
+        print("No snapshot found")
+        sys.exit(1)
+    books = build_books(result.markets)
+    print(
+        f"Replayed {result.snapshot_orders} snapshot orders and {result.events} "
+        f"events in {result.seconds * 1000:.1f}ms: {len(books)} books, "
+        f"{sum(len(book) for book in books.values())} resting orders"
+    )
+    if result.seq != db_seq:
+        print(f"Journal ends at event {result.seq}, database is at {db_seq}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
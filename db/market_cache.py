@@ -0,0 +1,158 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from .metrics import REGISTRY
+from .objects import Market
+
+DEFAULT_MAX_MARKETS = 1024
+DEFAULT_MAX_AGE_SECONDS = 30.0
+
+
+class MarketCache:
+    """
+    Read-through LRU cache of Market rows of one database, by id and by name.
+    Only markets that exist are cached.
+
+    Writers must call invalidate() for every market they change, both when
+    writing and once the transaction has committed or rolled back. Every
+    invalidation bumps the market's generation, and a row is only stored if
+    no invalidation happened while it was being read, so a read racing a
+    commit can't leave the old row cached. Changes made by other processes
+    are picked up once entries reach max_age_seconds.
+
+    Names are only mapped to ids by get_by_name(), so it always returns the
+    oldest market of that name, whatever get() has cached.
+    """
+
+    def __init__(
+        self,
+        max_markets: int = DEFAULT_MAX_MARKETS,
+        max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS,
+    ):
+        self.max_markets = max_markets
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self._markets: "OrderedDict[int, Tuple[float, Market]]" = OrderedDict()
+        self._ids_by_name: Dict[str, int] = {}
+        # Invalidations per market id, and in total including clears
+        self._generations: Dict[int, int] = {}
+        self._invalidations = 0
+        self._clears = 0
+        self._lock = threading.Lock()
+
+    def _lookup(self, market_id: Optional[int]) -> Optional[Market]:
+        entry = self._markets.get(market_id)
+        if entry is None:
+            return None
+        loaded_at, market = entry
+        if time.monotonic() - loaded_at > self.max_age_seconds:
+            self._remove(market_id)
+            return None
+        self._markets.move_to_end(market_id)
+        return market
+
+    def _generation(self, market_id: int) -> Tuple[int, int]:
+        return self._clears, self._generations.get(market_id, 0)
+
+    def _store(self, market: Market, by_name: bool = False) -> None:
+        self._remove(market.id)
+        self._markets[market.id] = (time.monotonic(), market)
+        if by_name:
+            self._ids_by_name[market.name] = market.id
+        while len(self._markets) > self.max_markets:
+            self._remove(next(iter(self._markets)))
+
+    def _remove(self, market_id: int) -> None:
+        entry = self._markets.pop(market_id, None)
+        if entry is not None and self._ids_by_name.get(entry[1].name) == market_id:
+            del self._ids_by_name[entry[1].name]
+
+    def get(self, conn: sqlite3.Connection, market_id: int) -> Optional[Market]:
+        with self._lock:
+            market = self._lookup(market_id)
+            if market is not None:
+                self.hits += 1
+                return market
+            self.misses += 1
+            generation = self._generation(market_id)
+
+        row = conn.execute(
+            "SELECT * FROM markets WHERE id = ?", (market_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        market = Market(*row)
+        with self._lock:
+            if self._generation(market_id) == generation:
+                self._store(market)
+        return market
+
+    def get_by_name(self, conn: sqlite3.Connection, name: str) -> Optional[Market]:
+        """
+        The oldest market with the given name.
+        """
+        with self._lock:
+            market = self._lookup(self._ids_by_name.get(name))
+            if market is not None:
+                self.hits += 1
+                return market
+            self.misses += 1
+            # The id isn't known yet, so any invalidation counts
+            invalidations = self._invalidations
+
+        row = conn.execute(
+            "SELECT * FROM markets WHERE name = ? ORDER BY id LIMIT 1", (name,)
+        ).fetchone()
+        if row is None:
+            return None
+        market = Market(*row)
+        with self._lock:
+            if self._invalidations == invalidations:
+                self._store(market, by_name=True)
+        return market
+
+    def invalidate(self, market_id: int) -> None:
+        with self._lock:
+            self._remove(market_id)
+            self._generations[market_id] = self._generations.get(market_id, 0) + 1
+            self._invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._markets.clear()
+            self._ids_by_name.clear()
+            self._clears += 1
+            self._invalidations += 1
+
+
+_caches: Dict[str, MarketCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_market_cache(path: str) -> MarketCache:
+    """
+    Return the process-wide market cache for the database at path.
+    """
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = _caches[path] = MarketCache()
+        return cache
+
+
+def clear_market_caches() -> None:
+    with _caches_lock:
+        _caches.clear()
+
+
+def _total(attr: str) -> int:
+    with _caches_lock:
+        return sum(getattr(cache, attr) for cache in _caches.values())
+
+
+REGISTRY.gauge("market_cache_hits", "Market cache hits", lambda: _total("hits"))
+REGISTRY.gauge("market_cache_misses", "Market cache misses", lambda: _total("misses"))
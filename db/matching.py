@@ -0,0 +1,299 @@
+import heapq
+import secrets
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Literal, Optional, Tuple
+
+from .timestamps import now_micros
+
+
+@dataclass
+class RestingOrder:
+    id: int
+    user_id: int
+    order_direction: Literal["buy", "sell"]
+    price_cents: int
+    quantity: int
+    expires_at: Optional[int]  # epoch microseconds
+
+
+@dataclass
+class Fill:
+    order_id: int  # the resting order that was hit
+    user_id: int  # owner of the resting order
+    price_cents: int
+    quantity: int
+    remaining: int  # quantity left on the resting order after this fill
+
+
+class PriceLevel:
+    """
+    All resting orders at a single price, in time priority.
+    """
+
+    __slots__ = ("price_cents", "orders", "quantity")
+
+    def __init__(self, price_cents: int):
+        self.price_cents = price_cents
+        self.orders: "OrderedDict[int, RestingOrder]" = OrderedDict()
+        self.quantity = 0
+
+
+class OrderBook:
+    """
+    Price-time priority order book for a single market.
+
+    Each side keeps a dict of price -> PriceLevel plus a heap of prices for
+    O(1) access to the best level. Heap entries for levels that have emptied
+    out are discarded lazily when they reach the top; the same goes for the
+    heap of expiry times.
+
+    version is bumped on every change to the book. Together with epoch, which is
+    unique to this instance, it identifies a state of the book, e.g. for ETags.
+    """
+
+    def __init__(self, market_id: int):
+        self.market_id = market_id
+        self.lock = threading.RLock()
+        self.orders: Dict[int, RestingOrder] = {}
+        self.version = 0
+        self.epoch = secrets.token_hex(4)
+        self._bids: Dict[int, PriceLevel] = {}
+        self._asks: Dict[int, PriceLevel] = {}
+        self._bid_heap: List[int] = []  # negated prices
+        self._ask_heap: List[int] = []
+        self._expiry_heap: List[Tuple[int, int]] = []
+
+    def __contains__(self, order_id: int) -> bool:
+        return order_id in self.orders
+
+    def __len__(self) -> int:
+        return len(self.orders)
+
+    @property
+    def etag(self) -> str:
+        return f"{self.epoch}-{self.version}"
+
+    def _side(self, order_direction: str) -> Tuple[Dict[int, PriceLevel], List[int]]:
+        if order_direction == "buy":
+            return self._bids, self._bid_heap
+        return self._asks, self._ask_heap
+
+    def best_bid(self) -> Optional[int]:
+        heap = self._bid_heap
+        while heap and -heap[0] not in self._bids:
+            heapq.heappop(heap)
+        return -heap[0] if heap else None
+
+    def best_ask(self) -> Optional[int]:
+        heap = self._ask_heap
+        while heap and heap[0] not in self._asks:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def add(self, order: RestingOrder) -> None:
+        levels, heap = self._side(order.order_direction)
+        level = levels.get(order.price_cents)
+        if level is None:
+            level = levels[order.price_cents] = PriceLevel(order.price_cents)
+            key = (
+                -order.price_cents
+                if order.order_direction == "buy"
+                else order.price_cents
+            )
+            heapq.heappush(heap, key)
+        level.orders[order.id] = order
+        level.quantity += order.quantity
+        self.orders[order.id] = order
+        if order.expires_at is not None:
+            heapq.heappush(self._expiry_heap, (order.expires_at, order.id))
+        self.version += 1
+
+    def cancel(self, order_id: int) -> Optional[RestingOrder]:
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return None
+        levels, _ = self._side(order.order_direction)
+        level = levels[order.price_cents]
+        del level.orders[order_id]
+        level.quantity -= order.quantity
+        if not level.orders:
+            del levels[order.price_cents]
+        self.version += 1
+        return order
+
+    def next_expiry(self) -> Optional[int]:
+        """
+        Earliest expiry time of any resting order, if any order can expire.
+        """
+        heap = self._expiry_heap
+        while heap and heap[0][1] not in self.orders:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def expire(self, now: Optional[int] = None) -> List[RestingOrder]:
+        """
+        Remove and return every order that has expired as of now, in epoch
+        microseconds.
+        """
+        now = now_micros() if now is None else now
+        expired = []
+        while (expiry := self.next_expiry()) is not None and expiry <= now:
+            _, order_id = heapq.heappop(self._expiry_heap)
+            expired.append(self.cancel(order_id))
+        return expired
+
+    def match(
+        self,
+        order_direction: Literal["buy", "sell"],
+        price_cents: int,
+        quantity: int,
+        now: Optional[int] = None,
+    ) -> Tuple[List[Fill], List[RestingOrder]]:
+        """
+        Match an incoming order against the opposite side of the book, mutating
+        the book. Returns the fills in execution order, as well as any expired
+        orders that were swept out of the way.
+        """
+        now = now_micros() if now is None else now
+        fills: List[Fill] = []
+        expired: List[RestingOrder] = []
+
+        if order_direction == "buy":
+            levels, best = self._asks, self.best_ask
+        else:
+            levels, best = self._bids, self.best_bid
+
+        while quantity > 0:
+            level_price = best()
+            if level_price is None:
+                break
+            if order_direction == "buy" and level_price > price_cents:
+                break
+            if order_direction == "sell" and level_price < price_cents:
+                break
+            level = levels[level_price]
+
+            while quantity > 0 and level.orders:
+                resting = next(iter(level.orders.values()))
+                if resting.expires_at is not None and resting.expires_at <= now:
+                    expired.append(self.cancel(resting.id))
+                    continue
+
+                fill_quantity = min(quantity, resting.quantity)
+                quantity -= fill_quantity
+                resting.quantity -= fill_quantity
+                level.quantity -= fill_quantity
+                fills.append(
+                    Fill(
+                        order_id=resting.id,
+                        user_id=resting.user_id,
+                        price_cents=resting.price_cents,
+                        quantity=fill_quantity,
+                        remaining=resting.quantity,
+                    )
+                )
+                if resting.quantity == 0:
+                    del level.orders[resting.id]
+                    del self.orders[resting.id]
+
+            if not level.orders:
+                levels.pop(level_price, None)
+
+        if fills:
+            self.version += 1
+        return fills, expired
+
+    def level_quantity(self, order_direction: str, price_cents: int) -> int:
+        levels, _ = self._side(order_direction)
+        level = levels.get(price_cents)
+        return level.quantity if level else 0
+
+    def depth(self, order_direction: Literal["buy", "sell"]) -> List[Tuple[int, int]]:
+        """
+        Aggregated (price_cents, total_quantity) per level, best price first.
+        """
+        levels, _ = self._side(order_direction)
+        prices = sorted(levels, reverse=order_direction == "buy")
+        return [(p, levels[p].quantity) for p in prices]
+
+
+class MatchingEngine:
+    """
+    Registry of in-memory order books, one per market. Books are loaded from the
+    orders table the first time a market is touched and are the source of truth
+    for matching from then on.
+    """
+
+    def __init__(self):
+        self._books: Dict[int, OrderBook] = {}
+        self._lock = threading.Lock()
+
+    def get_book(self, cursor: sqlite3.Cursor, market_id: int) -> OrderBook:
+        with self._lock:
+            book = self._books.get(market_id)
+            if book is None:
+                book = self._books[market_id] = load_book(cursor, market_id)
+            return book
+
+    def books(self) -> List[OrderBook]:
+        with self._lock:
+            return list(self._books.values())
+
+    @contextmanager
+    def loading_paused(self) -> Iterator[List[int]]:
+        """
+        Hold off loading any new book, yielding the ids of the markets whose
+        books are already loaded.
+        """
+        with self._lock:
+            yield list(self._books)
+
+    def install(self, books: Dict[int, OrderBook]) -> None:
+        """
+        Replace every loaded book, e.g. with books rebuilt from the journal.
+        Markets without a book are loaded from the database as usual.
+        """
+        with self._lock:
+            self._books = dict(books)
+
+    def discard(self, market_id: int) -> None:
+        """
+        Drop a cached book, e.g. after a failed transaction left it out of sync
+        with the database. It will be reloaded on next access.
+        """
+        with self._lock:
+            self._books.pop(market_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._books.clear()
+
+
+# A market's resting orders in time priority
+LOAD_BOOK_SQL = """
+    SELECT id, creator_id, order_direction, price_cents, quantity, expires_at
+    FROM orders
+    WHERE market_id = ? AND order_type = 'limit'
+    ORDER BY created_at ASC, id ASC
+"""
+
+
+def load_book(cursor: sqlite3.Cursor, market_id: int) -> OrderBook:
+    book = OrderBook(market_id)
+    cursor.execute(LOAD_BOOK_SQL, (market_id,))
+    for order_id, user_id, direction, price_cents, quantity, expires_at in cursor:
+        book.add(
+            RestingOrder(
+                id=order_id,
+                user_id=user_id,
+                order_direction=direction,
+                price_cents=price_cents,
+                quantity=quantity,
+                expires_at=expires_at,
+            )
+        )
+    return book
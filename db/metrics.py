@@ -0,0 +1,200 @@
+"""
+In-process metrics, exported in the Prometheus text format on /metrics.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+import flask
+
+LabelValues = Tuple[str, ...]
+
+QUANTILES = (0.5, 0.99)
+DEFAULT_WINDOW = 1024
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, **extra) -> str:
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(
+                    f"{self.name}{_format_labels(self.labels, labels)} {value}"
+                )
+        return lines
+
+
+class Summary:
+    """
+    Count and sum of observations, plus quantiles over a sliding window of the
+    most recent window observations per label set.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Tuple[str, ...] = (),
+        window: int = DEFAULT_WINDOW,
+    ):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.window = window
+        self._series: Dict[LabelValues, Tuple[List[float], deque]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = ([0, 0.0], deque(maxlen=self.window))
+            totals, recent = series
+            totals[0] += 1
+            totals[1] += value
+            recent.append(value)
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return series[0][0] if series else 0
+
+    def quantile(self, q: float, *labels: str) -> Optional[float]:
+        series = self._series.get(labels)
+        if not series or not series[1]:
+            return None
+        recent = sorted(series[1])
+        return recent[min(len(recent) - 1, int(q * len(recent)))]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} summary"]
+        with self._lock:
+            for labels in sorted(self._series):
+                (count, total), _ = self._series[labels]
+                for q in QUANTILES:
+                    label_str = _format_labels(self.labels, labels, quantile=q)
+                    value = self.quantile(q, *labels)
+                    lines.append(
+                        f"{self.name}{label_str} {'NaN' if value is None else value}"
+                    )
+                label_str = _format_labels(self.labels, labels)
+                lines.append(f"{self.name}_sum{label_str} {total}")
+                lines.append(f"{self.name}_count{label_str} {count}")
+        return lines
+
+
+class Gauge:
+    """
+    A value read from fn at export time.
+    """
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} gauge",
+            f"{self.name} {self.fn()}",
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            # Registering twice, e.g. from two app instances, shares the metric
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def summary(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Summary:
+        return self._register(Summary(name, help, labels))
+
+    def gauge(self, name: str, help: str, fn: Callable[[], float]) -> Gauge:
+        gauge = Gauge(name, help, fn)
+        with self._lock:
+            self._metrics[name] = gauge  # the latest callback wins
+        return gauge
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        return "\n".join(line for m in metrics for line in m.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+request_latency = REGISTRY.summary(
+    "http_request_duration_seconds",
+    "Request latency by app, endpoint and status code",
+    ("app", "endpoint", "status"),
+)
+sql_latency = REGISTRY.summary(
+    "sqlite_statement_duration_seconds",
+    "Time spent executing each SQL statement, by slow-query log fingerprint id",
+    ("statement",),
+)
+sql_rows = REGISTRY.counter(
+    "sqlite_statement_rows_total",
+    "Rows fetched or modified by each SQL statement, by fingerprint id",
+    ("statement",),
+)
+
+
+def instrument_app(app: flask.Flask) -> None:
+    """
+    Record per-endpoint request latency for app and serve REGISTRY on /metrics.
+    """
+
+    @app.before_request
+    def start_timer():
+        flask.g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_latency(response):
+        start = flask.g.pop("request_start", None)
+        if start is not None:
+            request_latency.observe(
+                time.perf_counter() - start,
+                app.name,
+                flask.request.endpoint or "unknown",
+                str(response.status_code),
+            )
+        return response
+
+    @app.route("/metrics")
+    def metrics():
+        return flask.Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,95 @@
+"""
+Versioned schema migrations.
+
+db/ddl.sql is schema version 0. Every file in db/migrations named
+NNNN_description.sql is migration NNNN, and is applied exactly once, in order,
+inside its own transaction. The current version is kept in PRAGMA user_version.
+
+Migrations run with foreign key enforcement off, so they can rebuild a table
+other tables refer to, and are checked for foreign key violations before they
+commit.
+
+Usage: python -m db.migrate [path/to/database.db]
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import sys
+from typing import List, Tuple
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "migrations")
+DDL_FILE = os.path.join(os.path.dirname(__file__), "ddl.sql")
+
+_MIGRATION_RE = re.compile(r"^(\d+)_\w+\.sql$")
+
+
+def get_migrations() -> List[Tuple[int, str]]:
+    """
+    Return (version, path) for every migration, sorted by version.
+    """
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        m = _MIGRATION_RE.match(filename)
+        if m:
+            migrations.append((int(m.group(1)), os.path.join(MIGRATIONS_DIR, filename)))
+    migrations.sort()
+    return migrations
+
+
+def get_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Apply all pending migrations and return the resulting schema version.
+    """
+    version = get_version(conn)
+    pending = [(target, path) for target, path in get_migrations() if target > version]
+    if not pending:
+        return version
+
+    conn.commit()
+    (foreign_keys,) = conn.execute("PRAGMA foreign_keys").fetchone()
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        for target, path in pending:
+            with open(path) as f:
+                sql = f.read()
+            try:
+                conn.executescript(f"BEGIN;\n{sql}\nPRAGMA user_version = {target};")
+                violation = conn.execute("PRAGMA foreign_key_check").fetchone()
+                if violation is not None:
+                    raise sqlite3.IntegrityError(
+                        f"Migration {os.path.basename(path)} violates a foreign "
+                        f"key of table {violation[0]}"
+                    )
+                conn.commit()
+            except sqlite3.Error:
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
+            logging.info(f"Applied migration {os.path.basename(path)}")
+            version = target
+    finally:
+        conn.execute(f"PRAGMA foreign_keys = {foreign_keys}")
+    return version
+
+
+def create_schema(conn: sqlite3.Connection) -> int:
+    """
+    Load the base schema into an empty database and bring it up to date.
+    """
+    with open(DDL_FILE) as f:
+        conn.executescript(f.read())
+    return migrate(conn)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    path = sys.argv[1] if len(sys.argv) > 1 else "prediction_markets.db"
+    conn = sqlite3.connect(path)
+    print(f"Schema version: {migrate(conn)}")
+    conn.close()
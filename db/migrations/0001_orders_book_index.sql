@@ -0,0 +1,10 @@
+-- Resting orders by book side, in price-time priority. Also covers the depth
+-- aggregation in /clob, which groups by price_cents and sums quantity.
+CREATE INDEX IF NOT EXISTS orders_book_idx ON orders (
+    market_id,
+    order_direction,
+    price_cents,
+    created_at,
+    quantity,
+    expires_at
+);
@@ -0,0 +1,17 @@
+-- /pnl looks trades up by buyer_id OR seller_id, optionally within a market.
+-- SQLite answers the OR with one lookup per index.
+CREATE INDEX IF NOT EXISTS trades_buyer_idx ON trades (
+    buyer_id,
+    market_id,
+    price_cents,
+    quantity
+);
+
+CREATE INDEX IF NOT EXISTS trades_seller_idx ON trades (
+    seller_id,
+    market_id,
+    price_cents,
+    quantity
+);
+
+CREATE INDEX IF NOT EXISTS trades_market_idx ON trades (market_id, timestamp);
@@ -0,0 +1,24 @@
+-- Net position and cash flow per user and market, maintained alongside every
+-- trade insert so /pnl doesn't need to aggregate trades.
+CREATE TABLE IF NOT EXISTS positions (
+    user_id INTEGER NOT NULL,
+    market_id INTEGER NOT NULL,
+    quantity INTEGER NOT NULL DEFAULT 0,
+    cash_cents INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, market_id),
+    FOREIGN KEY (market_id) REFERENCES markets (id) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS positions_market_idx ON positions (market_id);
+
+-- Backfill from existing trades
+INSERT INTO positions (user_id, market_id, quantity, cash_cents)
+SELECT user_id, market_id, SUM(quantity), SUM(cash_cents)
+FROM (
+    SELECT buyer_id AS user_id, market_id, quantity, -price_cents * quantity AS cash_cents
+    FROM trades
+    UNION ALL
+    SELECT seller_id, market_id, -quantity, price_cents * quantity
+    FROM trades
+)
+GROUP BY user_id, market_id;
@@ -0,0 +1,3 @@
+-- Lets the expiry sweeper find expired orders without scanning the table
+CREATE INDEX IF NOT EXISTS orders_expiry_idx ON orders (expires_at)
+WHERE expires_at IS NOT NULL;
@@ -0,0 +1,9 @@
+-- Sequence number of the last order journal event committed, updated in the
+-- same transaction as the writes it describes. Replay only trusts a journal
+-- that ends at this number.
+CREATE TABLE IF NOT EXISTS journal_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    last_seq INTEGER NOT NULL
+);
+
+INSERT OR IGNORE INTO journal_state (id, last_seq) VALUES (1, 0);
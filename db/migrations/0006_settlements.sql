@@ -0,0 +1,15 @@
+-- resolve_market has always set an outcome, but the column was never created
+ALTER TABLE markets ADD COLUMN outcome TEXT;
+
+-- Final position and payout of every holder of a resolved market, written in
+-- bulk when it is resolved
+CREATE TABLE IF NOT EXISTS settlements (
+    market_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    cash_cents INTEGER NOT NULL,
+    payout_cents INTEGER NOT NULL,
+    pnl_cents INTEGER NOT NULL,
+    PRIMARY KEY (market_id, user_id),
+    FOREIGN KEY (market_id) REFERENCES markets (id) ON DELETE CASCADE
+) WITHOUT ROWID;
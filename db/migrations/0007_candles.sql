@@ -0,0 +1,16 @@
+-- OHLCV bars per market and interval, updated with every trade insert so
+-- charts never need to read the trades table. bucket_start is in epoch
+-- seconds, a multiple of interval_seconds.
+CREATE TABLE IF NOT EXISTS candles (
+    market_id INTEGER NOT NULL,
+    interval_seconds INTEGER NOT NULL,
+    bucket_start INTEGER NOT NULL,
+    open_cents INTEGER NOT NULL,
+    high_cents INTEGER NOT NULL,
+    low_cents INTEGER NOT NULL,
+    close_cents INTEGER NOT NULL,
+    volume INTEGER NOT NULL,
+    trade_count INTEGER NOT NULL,
+    PRIMARY KEY (market_id, interval_seconds, bucket_start),
+    FOREIGN KEY (market_id) REFERENCES markets (id) ON DELETE CASCADE
+) WITHOUT ROWID;
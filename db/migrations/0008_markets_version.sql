@@ -0,0 +1,26 @@
+-- Bumped by every change to markets, so pages listing them can be cached
+-- until the next change, whichever process makes it
+CREATE TABLE IF NOT EXISTS markets_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+
+INSERT OR IGNORE INTO markets_version (id, version) VALUES (1, 0);
+
+CREATE TRIGGER IF NOT EXISTS markets_version_insert
+AFTER INSERT ON markets
+BEGIN
+    UPDATE markets_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS markets_version_update
+AFTER UPDATE ON markets
+BEGIN
+    UPDATE markets_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS markets_version_delete
+AFTER DELETE ON markets
+BEGIN
+    UPDATE markets_version SET version = version + 1 WHERE id = 1;
+END;
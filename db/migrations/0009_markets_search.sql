@@ -0,0 +1,38 @@
+-- Exact lookups by name, e.g. /clob?market_name=
+CREATE INDEX IF NOT EXISTS markets_name_idx ON markets (name);
+
+-- Full-text index over market names and criteria, stored as an external
+-- content table over markets and kept in sync by triggers
+CREATE VIRTUAL TABLE IF NOT EXISTS markets_fts USING fts5 (
+    name,
+    criteria,
+    content = 'markets',
+    content_rowid = 'id',
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS markets_fts_insert
+AFTER INSERT ON markets
+BEGIN
+    INSERT INTO markets_fts (rowid, name, criteria)
+    VALUES (NEW.id, NEW.name, NEW.criteria);
+END;
+
+CREATE TRIGGER IF NOT EXISTS markets_fts_delete
+AFTER DELETE ON markets
+BEGIN
+    INSERT INTO markets_fts (markets_fts, rowid, name, criteria)
+    VALUES ('delete', OLD.id, OLD.name, OLD.criteria);
+END;
+
+CREATE TRIGGER IF NOT EXISTS markets_fts_update
+AFTER UPDATE OF name, criteria ON markets
+BEGIN
+    INSERT INTO markets_fts (markets_fts, rowid, name, criteria)
+    VALUES ('delete', OLD.id, OLD.name, OLD.criteria);
+    INSERT INTO markets_fts (rowid, name, criteria)
+    VALUES (NEW.id, NEW.name, NEW.criteria);
+END;
+
+INSERT INTO markets_fts (markets_fts) VALUES ('rebuild');
@@ -0,0 +1,235 @@
+-- Store every time column as integer microseconds since the Unix epoch, UTC,
+-- instead of whatever CURRENT_TIMESTAMP and the datetime adapter left behind
+-- (text, in UTC for the defaults and local time for expires_at). Integers
+-- compare and range scan in the indexes without conversions.
+--
+-- SQLite can't change a column's type or default in place, so markets, orders
+-- and trades are rebuilt, along with their indexes and triggers. migrate()
+-- runs this with foreign keys off, so dropping markets doesn't cascade.
+--
+-- Text is converted to the millisecond, the precision of strftime('%f').
+-- Numbers were already read as epoch seconds.
+
+CREATE TABLE markets_new (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    creator_id INTEGER NOT NULL,
+    created_at INTEGER DEFAULT (
+        CAST(strftime('%s', 'now') AS INTEGER) * 1000000
+        + CAST(substr(strftime('%f', 'now'), 4) AS INTEGER) * 1000
+    ),
+    criteria TEXT NOT NULL,
+    payout_cents INTEGER,
+    resolved_at INTEGER,
+    outcome TEXT
+);
+
+INSERT INTO markets_new
+SELECT
+    id,
+    name,
+    creator_id,
+    CASE
+        WHEN typeof(created_at) IN ('integer', 'real')
+            THEN CAST(created_at * 1000000 AS INTEGER)
+        ELSE CAST(strftime('%s', created_at) AS INTEGER) * 1000000
+            + CAST(substr(strftime('%f', created_at), 4) AS INTEGER) * 1000
+    END,
+    criteria,
+    payout_cents,
+    CASE
+        WHEN typeof(resolved_at) IN ('integer', 'real')
+            THEN CAST(resolved_at * 1000000 AS INTEGER)
+        ELSE CAST(strftime('%s', resolved_at) AS INTEGER) * 1000000
+            + CAST(substr(strftime('%f', resolved_at), 4) AS INTEGER) * 1000
+    END,
+    outcome
+FROM markets;
+
+CREATE TABLE orders_new (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    market_id INTEGER NOT NULL,
+    creator_id INTEGER NOT NULL,
+    order_type TEXT NOT NULL,
+    order_direction TEXT NOT NULL,
+    price_cents INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    created_at INTEGER DEFAULT (
+        CAST(strftime('%s', 'now') AS INTEGER) * 1000000
+        + CAST(substr(strftime('%f', 'now'), 4) AS INTEGER) * 1000
+    ),
+    expires_at INTEGER,
+    FOREIGN KEY (market_id) REFERENCES markets (id) ON DELETE CASCADE
+);
+
+INSERT INTO orders_new
+SELECT
+    id,
+    market_id,
+    creator_id,
+    order_type,
+    order_direction,
+    price_cents,
+    quantity,
+    CASE
+        WHEN typeof(created_at) IN ('integer', 'real')
+            THEN CAST(created_at * 1000000 AS INTEGER)
+        ELSE CAST(strftime('%s', created_at) AS INTEGER) * 1000000
+            + CAST(substr(strftime('%f', created_at), 4) AS INTEGER) * 1000
+    END,
+    -- Written by the datetime adapter in local time
+    CASE
+        WHEN typeof(expires_at) IN ('integer', 'real')
+            THEN CAST(expires_at * 1000000 AS INTEGER)
+        ELSE CAST(strftime('%s', expires_at, 'utc') AS INTEGER) * 1000000
+            + CAST(substr(strftime('%f', expires_at), 4) AS INTEGER) * 1000
+    END
+FROM orders;
+
+CREATE TABLE trades_new (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    market_id INTEGER NOT NULL,
+    buyer_id INTEGER NOT NULL,
+    seller_id INTEGER NOT NULL,
+    price_cents INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    timestamp INTEGER DEFAULT (
+        CAST(strftime('%s', 'now') AS INTEGER) * 1000000
+        + CAST(substr(strftime('%f', 'now'), 4) AS INTEGER) * 1000
+    ),
+    FOREIGN KEY (market_id) REFERENCES markets (id) ON DELETE CASCADE
+);
+
+INSERT INTO trades_new
+SELECT
+    id,
+    market_id,
+    buyer_id,
+    seller_id,
+    price_cents,
+    quantity,
+    CASE
+        WHEN typeof(timestamp) IN ('integer', 'real')
+            THEN CAST(timestamp * 1000000 AS INTEGER)
+        ELSE CAST(strftime('%s', timestamp) AS INTEGER) * 1000000
+            + CAST(substr(strftime('%f', timestamp), 4) AS INTEGER) * 1000
+    END
+FROM trades;
+
+-- Dropping a table forgets its AUTOINCREMENT counter, which can be ahead of
+-- the largest id left, e.g. after filled orders were deleted
+CREATE TEMP TABLE migration_sequence AS
+SELECT name, seq FROM sqlite_sequence WHERE name IN ('orders', 'trades');
+
+DROP TABLE orders;
+DROP TABLE trades;
+DROP TABLE markets;
+ALTER TABLE markets_new RENAME TO markets;
+ALTER TABLE orders_new RENAME TO orders;
+ALTER TABLE trades_new RENAME TO trades;
+
+DELETE FROM sqlite_sequence WHERE name IN ('orders', 'trades');
+INSERT INTO sqlite_sequence (name, seq) SELECT name, seq FROM migration_sequence;
+DROP TABLE migration_sequence;
+
+-- Indexes, from 0001, 0002, 0004 and 0009
+CREATE INDEX markets_name_idx ON markets (name);
+
+CREATE INDEX orders_book_idx ON orders (
+    market_id,
+    order_direction,
+    price_cents,
+    created_at,
+    quantity,
+    expires_at
+);
+
+CREATE INDEX orders_expiry_idx ON orders (expires_at)
+WHERE expires_at IS NOT NULL;
+
+CREATE INDEX trades_buyer_idx ON trades (
+    buyer_id,
+    market_id,
+    price_cents,
+    quantity
+);
+
+CREATE INDEX trades_seller_idx ON trades (
+    seller_id,
+    market_id,
+    price_cents,
+    quantity
+);
+
+CREATE INDEX trades_market_idx ON trades (market_id, timestamp);
+
+-- Triggers, from ddl.sql, 0008 and 0009
+CREATE TRIGGER delete_orders_with_zero_quantity
+AFTER
+UPDATE OF quantity ON orders BEGIN
+DELETE FROM orders
+WHERE id = OLD.id
+    AND quantity = 0;
+END;
+
+CREATE TRIGGER ensure_valid_market_id_orders
+BEFORE INSERT ON orders
+BEGIN
+    SELECT RAISE(ABORT, 'Invalid market_id')
+    WHERE NEW.market_id NOT IN (SELECT id FROM markets);
+END;
+
+CREATE TRIGGER ensure_valid_market_id_trades
+BEFORE INSERT ON trades
+BEGIN
+    SELECT RAISE(ABORT, 'Invalid market_id')
+    WHERE NEW.market_id NOT IN (SELECT id FROM markets);
+END;
+
+CREATE TRIGGER markets_version_insert
+AFTER INSERT ON markets
+BEGIN
+    UPDATE markets_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER markets_version_update
+AFTER UPDATE ON markets
+BEGIN
+    UPDATE markets_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER markets_version_delete
+AFTER DELETE ON markets
+BEGIN
+    UPDATE markets_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER markets_fts_insert
+AFTER INSERT ON markets
+BEGIN
+    INSERT INTO markets_fts (rowid, name, criteria)
+    VALUES (NEW.id, NEW.name, NEW.criteria);
+END;
+
+CREATE TRIGGER markets_fts_delete
+AFTER DELETE ON markets
+BEGIN
+    INSERT INTO markets_fts (markets_fts, rowid, name, criteria)
+    VALUES ('delete', OLD.id, OLD.name, OLD.criteria);
+END;
+
+CREATE TRIGGER markets_fts_update
+AFTER UPDATE OF name, criteria ON markets
+BEGIN
+    INSERT INTO markets_fts (markets_fts, rowid, name, criteria)
+    VALUES ('delete', OLD.id, OLD.name, OLD.criteria);
+    INSERT INTO markets_fts (rowid, name, criteria)
+    VALUES (NEW.id, NEW.name, NEW.criteria);
+END;
+
+-- Every market row was rewritten
+UPDATE markets_version SET version = version + 1 WHERE id = 1;
+
+-- Journals store expiry times as written before this migration, so make the
+-- next startup rebuild the journal from the database rather than replay it
+UPDATE journal_state SET last_seq = last_seq + 1 WHERE id = 1;
@@ -0,0 +1,159 @@
+"""
+Mark-to-market PnL. Realized PnL is the cash a user's trades have paid or
+received, unrealized PnL is the value of the shares they still hold at each
+market's mark price. The positions ledger is loaded column-wise and every
+user's PnL computed at once with array operations, so the cost per position is
+a few machine instructions rather than a Python loop iteration.
+
+Usage: python -m db.pnl [--limit N] path/to/database.db
+    Print the leaderboard.
+"""
+
+import argparse
+import sqlite3
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Candles with the shortest interval hold the last trade price of each market
+LAST_PRICE_INTERVAL_SECONDS = 60
+
+
+@dataclass
+class PnlTable:
+    """
+    PnL per user, in cents, as parallel arrays ordered by user id.
+    """
+
+    user_ids: np.ndarray
+    realized_cents: np.ndarray
+    unrealized_cents: np.ndarray
+
+    @property
+    def total_cents(self) -> np.ndarray:
+        return self.realized_cents + self.unrealized_cents
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+
+def mark_prices(
+    conn: sqlite3.Connection, mids: Optional[Dict[int, float]] = None
+) -> Dict[int, float]:
+    """
+    The price in cents to value a share of each market at: its payout once
+    resolved, otherwise its mid from mids if given, otherwise its last trade
+    price. Markets that never traded are left out.
+    """
+    rows = conn.execute(
+        """
+        SELECT m.id, m.resolved_at, m.payout_cents, (
+            SELECT close_cents FROM candles c
+            WHERE c.market_id = m.id AND c.interval_seconds = ?
+            ORDER BY c.bucket_start DESC LIMIT 1
+        )
+        FROM markets m
+        """,
+        (LAST_PRICE_INTERVAL_SECONDS,),
+    )
+    mids = mids or {}
+    marks = {}
+    for market_id, resolved_at, payout_cents, last_cents in rows:
+        if resolved_at is not None:
+            marks[market_id] = payout_cents
+        elif market_id in mids:
+            marks[market_id] = mids[market_id]
+        elif last_cents is not None:
+            marks[market_id] = last_cents
+    return marks
+
+
+def load_positions(
+    conn: sqlite3.Connection,
+    user_id: Optional[int] = None,
+    market_id: Optional[int] = None,
+) -> np.ndarray:
+    """
+    Positions as a 4 x n array of user ids, market ids, quantities and cash.
+    """
+    where, params = [], []
+    if user_id is not None:
+        where.append("user_id = ?")
+        params.append(user_id)
+    if market_id is not None:
+        where.append("market_id = ?")
+        params.append(market_id)
+    sql = "SELECT user_id, market_id, quantity, cash_cents FROM positions"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    rows = conn.execute(sql, params).fetchall()
+    return np.array(rows, dtype=np.int64).reshape(-1, 4).T
+
+
+def compute_pnl(positions: np.ndarray, marks: Dict[int, float]) -> PnlTable:
+    """
+    Realized and unrealized PnL per user of positions, as returned by
+    load_positions, with shares valued at marks. Shares of markets without a
+    mark are valued at zero.
+    """
+    user_ids, market_ids, quantities, cash_cents = positions
+
+    # Look every position's mark up by binary search over the sorted market ids
+    mark_ids = np.fromiter(marks.keys(), dtype=np.int64, count=len(marks))
+    mark_cents = np.fromiter(marks.values(), dtype=np.float64, count=len(marks))
+    order = np.argsort(mark_ids)
+    mark_ids, mark_cents = mark_ids[order], mark_cents[order]
+    index = np.minimum(np.searchsorted(mark_ids, market_ids), len(mark_ids) - 1)
+    if len(mark_ids):
+        prices = np.where(mark_ids[index] == market_ids, mark_cents[index], 0.0)
+    else:
+        prices = np.zeros(len(market_ids))
+
+    users, inverse = np.unique(user_ids, return_inverse=True)
+    return PnlTable(
+        user_ids=users,
+        realized_cents=np.bincount(inverse, cash_cents, minlength=len(users)),
+        unrealized_cents=np.bincount(
+            inverse, quantities * prices, minlength=len(users)
+        ),
+    )
+
+
+def leaderboard(table: PnlTable, limit: int) -> List[dict]:
+    """
+    The limit users with the highest total PnL, best first, ties by user id.
+    """
+    # Stable sort of the id-ordered table keeps ties in user id order
+    top = np.argsort(-table.total_cents, kind="stable")[:limit]
+    return [
+        {
+            "rank": rank,
+            "user_id": int(table.user_ids[i]),
+            "realized_cents": round(float(table.realized_cents[i]), 2),
+            "unrealized_cents": round(float(table.unrealized_cents[i]), 2),
+            "total_cents": round(float(table.total_cents[i]), 2),
+        }
+        for rank, i in enumerate(top, start=1)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the PnL leaderboard")
+    parser.add_argument("database")
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database)
+    table = compute_pnl(load_positions(conn), mark_prices(conn))
+    for entry in leaderboard(table, args.limit):
+        print(
+            f"{entry['rank']:>4}. user {entry['user_id']}: "
+            f"${entry['total_cents'] / 100:.2f} "
+            f"(realized ${entry['realized_cents'] / 100:.2f})"
+        )
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
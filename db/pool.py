@@ -0,0 +1,99 @@
+import queue
+import sqlite3
+import threading
+from typing import Dict
+
+from .tracing import InstrumentedConnection
+
+DEFAULT_BUSY_TIMEOUT_MS = 5000
+DEFAULT_CACHED_STATEMENTS = 256
+DEFAULT_MAX_IDLE = 8
+
+
+class ConnectionPool:
+    """
+    Pool of configured SQLite connections to a single database file.
+
+    Each request (or worker thread) checks out a connection for its duration and
+    returns it afterwards, so connection setup and PRAGMAs are paid once per
+    connection rather than once per request. Connections are opened with
+    check_same_thread=False since they may be handed to a different thread after
+    being returned, but a connection is only ever used by one thread at a time.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        busy_timeout_ms: int = DEFAULT_BUSY_TIMEOUT_MS,
+        cached_statements: int = DEFAULT_CACHED_STATEMENTS,
+        max_idle: int = DEFAULT_MAX_IDLE,
+    ):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(max_idle)
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Open a new connection with the pool's settings, bypassing the pool.
+        """
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout_ms / 1000,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,
+            factory=InstrumentedConnection,
+        )
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self.connect()
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        """
+        Return a connection to the pool. Any transaction left open by the caller
+        is rolled back so the next user starts clean.
+        """
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path: str) -> ConnectionPool:
+    """
+    Return the process-wide pool for the database at path, creating it on first
+    use.
+    """
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            pool = _pools[path] = ConnectionPool(path)
+        return pool
+
+
+def close_pools() -> None:
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
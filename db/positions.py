@@ -0,0 +1,71 @@
+"""
+Positions ledger: net quantity and cash flow per (user, market), kept up to date
+in the same transaction as each trade insert.
+
+Usage: python -m db.positions [path/to/database.db] [archive/directory]
+    Rebuild the ledger from the trades table, and the archived trades if given
+    their directory.
+"""
+
+import sqlite3
+import sys
+from typing import List, Tuple
+
+from .archive import HISTORY_VIEW, attach_archives
+
+UPSERT_POSITION_SQL = """
+    INSERT INTO positions (user_id, market_id, quantity, cash_cents)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (user_id, market_id) DO UPDATE SET
+        quantity = quantity + excluded.quantity,
+        cash_cents = cash_cents + excluded.cash_cents
+"""
+
+
+def position_deltas(
+    market_id: int, buyer_id: int, seller_id: int, price_cents: int, quantity: int
+) -> List[Tuple[int, int, int, int]]:
+    """
+    Rows for UPSERT_POSITION_SQL recording a single trade.
+    """
+    cash_cents = price_cents * quantity
+    return [
+        (buyer_id, market_id, quantity, -cash_cents),
+        (seller_id, market_id, -quantity, cash_cents),
+    ]
+
+
+def rebuild_positions(conn: sqlite3.Connection, table: str = "trades") -> int:
+    """
+    Recompute the whole ledger from trades in one transaction. Returns the number
+    of positions written. Pass the trades_history view as table to include
+    archived trades, see db.archive.
+    """
+    with conn:
+        conn.execute("DELETE FROM positions")
+        cursor = conn.execute(
+            f"""
+            INSERT INTO positions (user_id, market_id, quantity, cash_cents)
+            SELECT user_id, market_id, SUM(quantity), SUM(cash_cents)
+            FROM (
+                SELECT buyer_id AS user_id, market_id, quantity, -price_cents * quantity AS cash_cents
+                FROM {table}
+                UNION ALL
+                SELECT seller_id, market_id, -quantity, price_cents * quantity
+                FROM {table}
+            )
+            GROUP BY user_id, market_id
+            """
+        )
+        return cursor.rowcount
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "prediction_markets.db"
+    conn = sqlite3.connect(path)
+    table = "trades"
+    if len(sys.argv) > 2:
+        attach_archives(conn, sys.argv[2])
+        table = HISTORY_VIEW
+    print(f"Rebuilt {rebuild_positions(conn, table)} positions")
+    conn.close()
@@ -0,0 +1,74 @@
+"""
+Full-text search over market names and criteria, backed by the markets_fts
+index.
+"""
+
+import re
+import sqlite3
+from typing import List
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+# Matches in the name count for more than matches in the criteria
+NAME_WEIGHT = 10.0
+CRITERIA_WEIGHT = 1.0
+
+_TOKEN_RE = re.compile(r'"([^"]*)"|(\S+)')
+_WORD_RE = re.compile(r"\w+")
+
+
+def build_query(q: str) -> str:
+    """
+    Translate a user's search into an FTS5 query matching every term. Text in
+    double quotes is a phrase, and a word ending in * matches as a prefix; any
+    other FTS5 syntax is treated as plain text. Raises ValueError if nothing is
+    left to search for.
+    """
+    terms = []
+    for phrase, word in _TOKEN_RE.findall(q):
+        if phrase:
+            words = _WORD_RE.findall(phrase)
+            if words:
+                terms.append('"' + " ".join(words) + '"')
+            continue
+        words = _WORD_RE.findall(word)
+        if not words:
+            continue
+        # Punctuation splits a word into a phrase, as the tokenizer would
+        term = '"' + " ".join(words) + '"'
+        terms.append(term + "*" if word.endswith("*") else term)
+    if not terms:
+        raise ValueError("Empty search query")
+    return " AND ".join(terms)
+
+
+def search_markets(
+    conn: sqlite3.Connection, q: str, limit: int = DEFAULT_SEARCH_LIMIT, offset: int = 0
+) -> List[dict]:
+    """
+    Markets matching q, best match first, with a highlighted excerpt of their
+    criteria.
+    """
+    rows = conn.execute(
+        """
+        SELECT m.id, m.name, m.resolved_at,
+            snippet(markets_fts, 1, '[', ']', '...', 12),
+            bm25(markets_fts, ?, ?) AS score
+        FROM markets_fts
+        JOIN markets m ON m.id = markets_fts.rowid
+        WHERE markets_fts MATCH ?
+        ORDER BY score, m.id
+        LIMIT ? OFFSET ?
+        """,
+        (NAME_WEIGHT, CRITERIA_WEIGHT, build_query(q), limit, offset),
+    )
+    return [
+        {
+            "market_id": market_id,
+            "market_name": name,
+            "resolved": resolved_at is not None,
+            "criteria_snippet": snippet,
+            "score": -score,
+        }
+        for market_id, name, resolved_at, snippet, score in rows
+    ]
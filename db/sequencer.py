@@ -0,0 +1,321 @@
+import logging
+import queue
+import sqlite3
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .metrics import REGISTRY
+from .pool import get_pool
+
+DEFAULT_MAX_GROUP = 64
+DEFAULT_SUBMIT_TIMEOUT_SECONDS = 30.0
+
+group_size = REGISTRY.summary(
+    "sequencer_group_size", "Commands committed together by the write sequencer"
+)
+
+
+class Transaction:
+    """
+    Handle passed to a write command. Changes made outside the database, e.g. to
+    in-memory books, can register callbacks to run once the command's writes
+    are committed, or to undo them if they are rolled back.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self._on_commit: List[Callable[[], Any]] = []
+        self._on_rollback: List[Callable[[], Any]] = []
+
+    def on_commit(self, fn: Callable[[], Any]) -> None:
+        self._on_commit.append(fn)
+
+    def on_rollback(self, fn: Callable[[], Any]) -> None:
+        self._on_rollback.append(fn)
+
+    def committed(self) -> None:
+        _run_callbacks(self._on_commit)
+
+    def rolled_back(self) -> None:
+        _run_callbacks(self._on_rollback)
+
+    def has_rollback_callbacks(self) -> bool:
+        return bool(self._on_rollback)
+
+
+def _run_callbacks(callbacks: List[Callable[[], Any]]) -> None:
+    for fn in callbacks:
+        try:
+            fn()
+        except Exception as e:
+            logging.error(f"Error in transaction callback: {str(e)}")
+
+
+def run_transaction(conn: sqlite3.Connection, fn: Callable[[Transaction], Any]):
+    """
+    Run a single write command in its own transaction on conn, bypassing the
+    sequencer. Mostly useful for scripts and tests.
+    """
+    tx = Transaction(conn)
+    conn.execute("BEGIN")
+    try:
+        result = fn(tx)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        tx.rolled_back()
+        raise
+    tx.committed()
+    return result
+
+
+class _Command:
+    __slots__ = ("fn", "done", "result", "error", "tx")
+
+    def __init__(self, fn: Callable[[Transaction], Any]):
+        self.fn = fn
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.tx: Optional[Transaction] = None
+
+    def fail(self, error: BaseException) -> None:
+        self.error = error
+        self.done.set()
+
+
+class WriteSequencer:
+    """
+    Single writer for a database. Write commands from every request thread are
+    queued and applied in arrival order by one thread that owns the write
+    connection, so requests never contend for SQLite's write lock.
+
+    Whatever has queued up while a group was being written is applied as the
+    next group: each command runs under its own savepoint, so a failing command
+    only rolls back itself, and the whole group is committed (and fsynced) at
+    once. submit() returns only after the command's group has committed.
+
+    If the writer thread dies, e.g. because the database can't be opened, the
+    commands it had taken and everything still queued fail with the error,
+    and the next submit() starts a new writer.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_group: int = DEFAULT_MAX_GROUP,
+        submit_timeout_seconds: float = DEFAULT_SUBMIT_TIMEOUT_SECONDS,
+    ):
+        self.path = path
+        self.max_group = max_group
+        self.submit_timeout_seconds = submit_timeout_seconds
+        self._queue: "queue.Queue[Optional[_Command]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            self._start()
+
+    def _start(self) -> None:
+        if self._thread is None:
+            # Each writer gets a queue of its own, so one that crashed can fail
+            # whatever is left in it without taking commands meant for the next
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(
+                target=self._run,
+                args=(self._queue,),
+                name="write-sequencer",
+                daemon=True,
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+            commands = self._queue
+        if thread is not None:
+            commands.put(None)
+            thread.join()
+
+    def submit(self, fn: Callable[[Transaction], Any]):
+        """
+        Run fn(tx) on the writer thread and return its result once committed,
+        re-raising anything it raised. Raises TimeoutError if that takes more
+        than submit_timeout_seconds, in which case the command may still be
+        applied later.
+        """
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("Write commands can't submit further commands")
+        command = _Command(fn)
+        with self._lock:
+            self._start()
+            self._queue.put(command)
+        if not command.done.wait(self.submit_timeout_seconds):
+            raise TimeoutError(
+                f"Write command not applied within {self.submit_timeout_seconds}s"
+            )
+        if command.error is not None:
+            raise command.error
+        return command.result
+
+    def _run(self, commands: "queue.Queue[Optional[_Command]]") -> None:
+        conn = None
+        group: List[_Command] = []
+        try:
+            conn = get_pool(self.path).connect()
+            conn.isolation_level = None  # transactions are managed explicitly
+            while True:
+                command = commands.get()
+                if command is None:
+                    return
+                group = [command]
+                stopping = False
+                while len(group) < self.max_group:
+                    try:
+                        command = commands.get_nowait()
+                    except queue.Empty:
+                        break
+                    if command is None:
+                        stopping = True
+                        break
+                    group.append(command)
+                self._apply(conn, group)
+                group = []
+                if stopping:
+                    return
+        except BaseException as e:
+            logging.error(f"Write sequencer crashed: {str(e)}")
+            self._crashed(commands, group, e)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _crashed(
+        self,
+        commands: "queue.Queue[Optional[_Command]]",
+        group: List[_Command],
+        error: BaseException,
+    ) -> None:
+        """
+        Fail the unfinished commands of the group being applied and everything
+        still queued, after letting the next submit() start a new writer.
+        """
+        with self._lock:
+            if self._thread is threading.current_thread():
+                self._thread = None
+        while True:
+            try:
+                command = commands.get_nowait()
+            except queue.Empty:
+                break
+            if command is not None:
+                group.append(command)
+        for command in group:
+            if command.done.is_set():
+                continue
+            # The connection is closed without committing
+            if command.tx is not None:
+                command.tx.rolled_back()
+            command.fail(error)
+
+    def _apply(self, conn: sqlite3.Connection, group: List[_Command]) -> None:
+        """
+        Apply a group of commands in as few transactions as possible. A command
+        that fails after registering rollback callbacks, e.g. because it had
+        already changed an in-memory book, ends the transaction: what came
+        before it is committed first, so the callbacks run against committed
+        state, and the rest of the group starts a new transaction.
+        """
+        pending = deque(group)
+        while pending:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+            except Exception as e:
+                for command in pending:
+                    command.fail(e)
+                return
+
+            applied: Optional[List[Tuple[_Command, Transaction]]] = []
+            failed: Optional[Tuple[_Command, Transaction]] = None
+            while pending and failed is None:
+                command = pending.popleft()
+                tx = command.tx = Transaction(conn)
+                conn.execute("SAVEPOINT command")
+                try:
+                    command.result = command.fn(tx)
+                    conn.execute("RELEASE command")
+                    applied.append((command, tx))
+                    continue
+                except Exception as e:
+                    command.error = e
+                try:
+                    conn.execute("ROLLBACK TO command")
+                    conn.execute("RELEASE command")
+                except sqlite3.Error:
+                    # The error rolled back the whole transaction
+                    self._rolled_back(applied + [(command, tx)], command.error)
+                    applied = None
+                    break
+                if tx.has_rollback_callbacks():
+                    failed = (command, tx)
+                else:
+                    command.done.set()
+
+            if applied is not None:
+                self._commit(conn, applied)
+            if failed is not None:
+                command, tx = failed
+                tx.rolled_back()
+                command.done.set()
+
+    def _commit(
+        self, conn: sqlite3.Connection, applied: List[Tuple[_Command, Transaction]]
+    ) -> None:
+        try:
+            conn.execute("COMMIT")
+        except Exception as e:
+            logging.error(f"Error committing write group: {str(e)}")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            self._rolled_back(applied, e)
+            return
+
+        if applied:
+            group_size.observe(len(applied))
+        for command, tx in applied:
+            tx.committed()
+            command.done.set()
+
+    def _rolled_back(
+        self, commands: List[Tuple[_Command, Transaction]], error: BaseException
+    ) -> None:
+        for command, tx in commands:
+            tx.rolled_back()
+            if command.error is None:
+                command.error = error
+            command.done.set()
+
+
+_sequencers: Dict[str, WriteSequencer] = {}
+_sequencers_lock = threading.Lock()
+
+
+def get_sequencer(path: str) -> WriteSequencer:
+    """
+    Return the process-wide write sequencer for the database at path.
+    """
+    with _sequencers_lock:
+        sequencer = _sequencers.get(path)
+        if sequencer is None:
+            sequencer = _sequencers[path] = WriteSequencer(path)
+        return sequencer
+
+
+def close_sequencers() -> None:
+    with _sequencers_lock:
+        sequencers = list(_sequencers.values())
+        _sequencers.clear()
+    for sequencer in sequencers:
+        sequencer.stop()
@@ -1,190 +1,570 @@
-from flask import Flask, request, session, jsonify
-import sqlite3
+from flask import Flask, g, request, session, jsonify, stream_with_context
 import decimal
+import functools
 import logging
-from datetime import datetime
-import dateparser
+import threading
+import zlib
+from contextlib import ExitStack
+from dataclasses import dataclass
+from typing import Optional
+
+from db.archive import attach_archives
+from db.candles import INTERVALS, UPSERT_CANDLE_SQL, candle_rows, get_candles
+from db.db import Database
+from db.durations import parse_duration
+from db.expiry import ExpiryScheduler
+from db.export import FORMATS, TABLES, export
+from db.feed import MarketFeed, RelayFeed, format_sse, replay
+from db.market_cache import get_market_cache
+from db.journal import (
+    Journal,
+    accept_event,
+    cancel_event,
+    expire_event,
+    fill_event,
+    resolve_event,
+)
+from db.matching import MatchingEngine, RestingOrder
+from db.metrics import REGISTRY, instrument_app
+from db.pnl import compute_pnl, leaderboard, load_positions, mark_prices
+from db.pool import close_pools, get_pool
+from db.positions import UPSERT_POSITION_SQL, position_deltas
+from db.search import DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT, search_markets
+from db.sequencer import close_sequencers, get_sequencer
+from db.settlement import settle_market
+from db.shards import ShardPool, serve, shard_of
+from db.snapshots import Snapshot, SnapshotCache
+from db.timestamps import MICROS_PER_SECOND, parse_micros, to_micros
 
 app = Flask(__name__)
 app.secret_key = "YOUR_SECRET_KEY"
+app.config["DATABASE"] = "prediction_markets.db"
 
+# In-memory order books, the source of truth for matching. SQLite only persists
+# the results.
+engine = MatchingEngine()
 
-@app.route("/order", methods=["POST"])
-def order():
-    data = request.get_json()
-    order_type = data["order_type"]
-    order_direction = data["order_direction"]
-    market_id = data["market_id"]
-    quantity = data["quantity"]
-    price = data["price"]
+# Serialized /clob responses, reused until the book changes
+snapshots = SnapshotCache()
+
+# Serialized /leaderboard responses, reused until a trade or market changes
+leaderboards = SnapshotCache(max_markets=16)
+MAX_LEADERBOARD_LIMIT = 100
+
+# Live book and trade updates for /stream subscribers
+feed = MarketFeed()
+STREAM_KEEPALIVE_SECONDS = 15
+
+# Expired orders are removed in the background rather than filtered on every
+# query. Set EXPIRY_INTERVAL_SECONDS to None to disable the sweeper.
+app.config["EXPIRY_INTERVAL_SECONDS"] = 1.0
+expiry = ExpiryScheduler(
+    engine,
+    on_expired=lambda book, expired: publish_levels(
+        book, {(o.order_direction, o.price_cents) for o in expired}
+    ),
+)
+
+
+# Order book events are journaled to JOURNAL_DIR, if set, and the books rebuilt
+# from it on startup
+app.config["JOURNAL_DIR"] = None
+journal: Optional[Journal] = None
+journal_lock = threading.Lock()
+
+# Trades of resolved markets archived by db.archive to ARCHIVE_DIR, if set, are
+# included in exports
+app.config["ARCHIVE_DIR"] = None
+
+# Markets are matched in this process, unless MATCHING_WORKERS is set to the
+# number of worker processes to shard them across, see run_matching_worker.
+# The journal can't be used with workers.
+app.config["MATCHING_WORKERS"] = 0
+workers: Optional[ShardPool] = None
+workers_lock = threading.Lock()
+
+
+def market_cache():
+    """
+    Return the cache of market rows, which every write to markets must invalidate.
+    """
+    return get_market_cache(app.config["DATABASE"])
+
+
+def get_db():
+    """
+    Return this request's connection, checking one out of the pool on first use.
+    """
+    if "db_conn" not in g:
+        g.db_conn = get_pool(app.config["DATABASE"]).acquire()
+    return g.db_conn
+
+
+instrument_app(app)
+fills_per_order = REGISTRY.summary(
+    "matching_fills_per_order", "Resting orders filled by each incoming order"
+)
+levels_swept = REGISTRY.summary(
+    "matching_levels_swept_per_order", "Price levels touched by each incoming order"
+)
+REGISTRY.gauge(
+    "matching_books_loaded", "Order books held in memory", lambda: len(engine.books())
+)
+REGISTRY.gauge("order_expiry_sweeps", "Expiry sweeps run", lambda: expiry.sweeps)
+REGISTRY.gauge(
+    "order_expiry_orders_removed",
+    "Orders removed by expiry sweeps",
+    lambda: expiry.expired_total,
+)
+REGISTRY.gauge(
+    "order_expiry_last_sweep_removed",
+    "Orders removed by the most recent expiry sweep",
+    lambda: expiry.last_result.total if expiry.last_result else 0,
+)
+REGISTRY.gauge(
+    "clob_snapshot_hits", "/clob snapshot cache hits", lambda: snapshots.hits
+)
+REGISTRY.gauge(
+    "clob_snapshot_misses", "/clob snapshot cache misses", lambda: snapshots.misses
+)
+REGISTRY.gauge(
+    "leaderboard_cache_hits", "/leaderboard cache hits", lambda: leaderboards.hits
+)
+REGISTRY.gauge(
+    "leaderboard_cache_misses",
+    "/leaderboard cache misses",
+    lambda: leaderboards.misses,
+)
+
+
+@app.before_request
+def open_journal():
+    global journal
+    directory = app.config["JOURNAL_DIR"]
+    if directory is None or journal is not None:
+        return
+    with journal_lock:
+        if journal is not None:
+            return
+        opened = Journal(directory)
+
+        def recover(tx):
+            engine.install(opened.recover(tx))
+
+        # Recover on the writer thread, so no write can slip in between
+        try:
+            get_sequencer(app.config["DATABASE"]).submit(recover)
+        except BaseException:
+            opened.close()
+            raise
+        journal = expiry.journal = opened
+
+
+def record_events(tx, events):
+    if journal is not None:
+        journal.record(tx, events)
+
+
+@app.before_request
+def start_expiry():
+    interval = app.config["EXPIRY_INTERVAL_SECONDS"]
+    # Workers sweep their own books
+    if interval is not None and not app.config["MATCHING_WORKERS"]:
+        expiry.interval_seconds = interval
+        expiry.start(get_sequencer(app.config["DATABASE"]))
+
+
+@app.before_request
+def start_workers():
+    global workers
+    shards = app.config["MATCHING_WORKERS"]
+    if not shards or workers is not None:
+        return
+    with workers_lock:
+        if workers is not None:
+            return
+        if app.config["JOURNAL_DIR"] is not None:
+            raise ValueError("JOURNAL_DIR can't be combined with MATCHING_WORKERS")
+        config = {
+            key: app.config[key] for key in ("DATABASE", "EXPIRY_INTERVAL_SECONDS")
+        }
+        pool = ShardPool(
+            shards,
+            run_matching_worker,
+            (config,),
+            on_event=functools.partial(replay, feed),
+        )
+        pool.start()
+        workers = pool
+
+
+def stop_workers():
+    global workers
+    with workers_lock:
+        pool, workers = workers, None
+    if pool is not None:
+        pool.stop()
+
+
+@app.teardown_appcontext
+def release_db(exc):
+    conn = g.pop("db_conn", None)
+    if conn is not None:
+        get_pool(app.config["DATABASE"]).release(conn)
+
+
+class OrderError(Exception):
+    """
+    An order or cancel that was rejected, reported to the client with status.
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+    def __reduce__(self):
+        # Keep the status when sent to or from a matching worker
+        return OrderError, (self.message, self.status)
+
+
+@dataclass
+class OrderRequest:
+    order_type: str
+    order_direction: str
+    market_id: int
+    quantity: int
+    price_cents: int
+    expires_at: Optional[int]  # epoch microseconds
+
+
+def parse_order(data):
+    """
+    Validate an order as submitted by a client, raising OrderError if it's
+    invalid.
+    """
+    try:
+        order_type = data["order_type"]
+        order_direction = data["order_direction"]
+        market_id = data["market_id"]
+        quantity = data["quantity"]
+        price = data["price"]
+    except (KeyError, TypeError) as e:
+        raise OrderError(f"Missing order field: {str(e)}.")
     duration = data.get("duration")
-    user_id = session["user_id"]
 
-    # Function logic goes here
+    if order_type not in ("market", "limit"):
+        raise OrderError(
+            f"Invalid order type: {order_type}. Please use market or limit."
+        )
+    if order_direction not in ("buy", "sell"):
+        raise OrderError(
+            f"Invalid order direction: {order_direction}. Please use buy or sell."
+        )
+
     try:
-        conn = get_db()
-        cursor = conn.cursor()
+        market_id = int(market_id)
+        quantity = int(quantity)
+    except (TypeError, ValueError):
+        raise OrderError("Market ID and quantity must be integers.")
+    if quantity <= 0:
+        raise OrderError("Quantity must be positive.")
 
+    try:
         price_cents = int(decimal.Decimal(price) * 100)
+    except (decimal.InvalidOperation, OverflowError, TypeError, ValueError):
+        raise OrderError(f"Invalid price: {price}.")
+    if price_cents < 0:
+        raise OrderError("Price can't be negative.")
 
-        # Parse the duration and calculate the expiration timestamp
-        expires_at = None
+    # Parse the duration and calculate the expiration timestamp
+    expires_at = None
 
-        if order_type == "market":
-            if order_direction == "buy":
-                price_cents = 99999999999999  # infinity
-            else:
-                price_cents = 0  # prices cannot go negative sorry :(
-            expires_at = datetime(1970, 1, 1)
+    if order_type == "market":
+        if order_direction == "buy":
+            price_cents = 99999999999999  # infinity
         else:
-            if duration:
-                try:
-                    # Check if the duration is in the format of +1y3m3w9d3h45m3s
-                    if duration.startswith("+"):
-                        relative_duration = duration[1:]
-                        expires_at = dateparser.parse(f"now + {relative_duration}")
-                        if expires_at is None:
-                            raise ValueError("Invalid relative duration format")
-                    # Check if the duration is in the format of an ISO date (e.g., 2023-04-03)
-                    else:
-                        expires_at = dateparser.parse(duration)
-                        if expires_at is None:
-                            raise ValueError("Invalid ISO date format")
-                        if expires_at.time() == datetime.time(0, 0, 0):
-                            expires_at = expires_at.replace(
-                                hour=23, minute=59, second=59
-                            )
-                except ValueError as e:
-                    return (
-                        jsonify(
-                            {
-                                "error": f"Invalid duration format: {str(e)}. Please provide a valid relative duration (e.g., +1y3m3w9d3h45m3s) or an ISO date (e.g., 2023-04-03)."
-                            }
-                        ),
-                        400,
-                    )
-        # Begin a transaction
-        cursor.execute("BEGIN TRANSACTION")
+            price_cents = 0  # prices cannot go negative sorry :(
+    else:
+        if duration:
+            try:
+                # +1y3m3w9d3h45m3s, an ISO date (e.g. 2023-04-03) or free-form
+                expires_at = to_micros(parse_duration(duration))
+            except ValueError as e:
+                raise OrderError(
+                    f"Invalid duration format: {str(e)}. Please provide a valid relative duration (e.g., +1y3m3w9d3h45m3s) or an ISO date (e.g., 2023-04-03)."
+                )
 
-        # Check if the market exists
-        cursor.execute("SELECT id FROM markets WHERE id = ?", (market_id,))
-        market = cursor.fetchone()
-        if not market:
-            cursor.execute("ROLLBACK")
-            return (
-                jsonify({"error": f"Market with ID {market_id} does not exist."}),
-                404,
+    return OrderRequest(
+        order_type=order_type,
+        order_direction=order_direction,
+        market_id=market_id,
+        quantity=quantity,
+        price_cents=price_cents,
+        expires_at=expires_at,
+    )
+
+
+class PendingWrites:
+    """
+    Trade, position and resting order writes produced by matching, buffered so
+    a whole transaction's worth can be written with executemany.
+    """
+
+    def __init__(self):
+        self.trades = []
+        self.quantities = []
+        self.deletes = []
+        self.events = []
+
+    def add(self, market_id, user_id, order_direction, fills, expired):
+        for fill in fills:
+            self.events.append(fill_event(market_id, fill))
+            self.trades.append(
+                (
+                    market_id,
+                    user_id if order_direction == "buy" else fill.user_id,
+                    fill.user_id if order_direction == "buy" else user_id,
+                    fill.price_cents,
+                    fill.quantity,
+                )
             )
+            self.quantities.append((fill.remaining, fill.order_id))
+        self.deletes.extend((order.id,) for order in expired)
+        self.events.extend(expire_event(market_id, order.id) for order in expired)
+
+    def flush(self, tx, cursor):
+        cursor.executemany(
+            """
+            INSERT INTO trades (market_id, buyer_id, seller_id, price_cents, quantity)
+            VALUES (?, ?, ?, ?, ?)
+        """,
+            self.trades,
+        )
+        cursor.executemany(
+            UPSERT_POSITION_SQL,
+            [row for trade in self.trades for row in position_deltas(*trade)],
+        )
+        cursor.executemany(
+            UPSERT_CANDLE_SQL,
+            [
+                row
+                for market_id, _, _, price_cents, quantity in self.trades
+                for row in candle_rows(market_id, price_cents, quantity)
+            ],
+        )
+        # Orders that reach zero quantity are deleted by trigger. Updates are
+        # applied in matching order, so the last one for an order wins.
+        cursor.executemany(
+            "UPDATE orders SET quantity = ? WHERE id = ?", self.quantities
+        )
+        cursor.executemany("DELETE FROM orders WHERE id = ?", self.deletes)
+        record_events(tx, self.events)
+        self.trades, self.quantities, self.deletes, self.events = [], [], [], []
+
+
+def match_order(cursor, book, user_id, order, writes):
+    """
+    Match an order against its market's book, buffering the resulting writes.
+    Whatever is left of a limit order is inserted and added to the book. The
+    caller must hold the book's lock, and discard the book if the transaction
+    fails. Returns a function that publishes the changes once committed.
+    """
+    fills, expired = book.match(
+        order.order_direction, order.price_cents, order.quantity
+    )
+    writes.add(order.market_id, user_id, order.order_direction, fills, expired)
+    fills_per_order.observe(len(fills))
+    levels_swept.observe(len({fill.price_cents for fill in fills}))
+    quantity = order.quantity - sum(fill.quantity for fill in fills)
 
-        # Insert the order into the orders table
+    # Rest whatever is left of a limit order; market orders never rest
+    changed = {(o.order_direction, o.price_cents) for o in expired}
+    if order.order_type == "limit" and quantity > 0:
         cursor.execute(
             """
-            INSERT INTO orders (market_id, user_id, order_type, order_direction, price_cents, quantity, expires_at)
+            INSERT INTO orders (market_id, creator_id, order_type, order_direction, price_cents, quantity, expires_at)
             VALUES (?, ?, ?, ?, ?, ?, ?)
         """,
             (
-                market_id,
+                order.market_id,
                 user_id,
-                order_type,
-                order_direction,
-                price_cents,
+                order.order_type,
+                order.order_direction,
+                order.price_cents,
                 quantity,
-                expires_at,
+                order.expires_at,
             ),
         )
-        order_id = cursor.lastrowid
+        resting = RestingOrder(
+            id=cursor.lastrowid,
+            user_id=user_id,
+            order_direction=order.order_direction,
+            price_cents=order.price_cents,
+            quantity=quantity,
+            expires_at=order.expires_at,
+        )
+        book.add(resting)
+        writes.events.append(accept_event(order.market_id, resting))
+        changed.add((order.order_direction, order.price_cents))
 
-        matching_orders = get_matching_orders(cursor, order_direction, price_cents)
+    def publish():
+        publish_fills(book, order.order_direction, fills)
+        publish_levels(book, changed)
 
-        for matching_order in matching_orders:
-            (
-                matching_order_id,
-                matching_order_price_cents,
-                matching_order_quantity,
-                matching_user_id,
-            ) = matching_order
-
-            if quantity <= 0:
-                break
-
-            trade_quantity = min(quantity, matching_order_quantity)
-            cursor.execute(
-                """
-                INSERT INTO trades (market_id, buyer_id, seller_id, price_cents, quantity)
-                VALUES (?, ?, ?, ?, ?)
-            """,
-                (
-                    market_id,
-                    user_id if order_direction == "buy" else matching_user_id,
-                    matching_user_id if order_direction == "buy" else user_id,
-                    matching_order_price_cents,
-                    trade_quantity,
-                ),
-            )
+    return publish
 
-            quantity -= trade_quantity
-            cursor.execute(
-                "UPDATE orders SET quantity = quantity - ? WHERE id = ?",
-                (trade_quantity, matching_order_id),
-            )
-        # delete the order if it is a market order
-        if order_type == "market":
-            cursor.execute("DELETE from ORDERS where id = ?", order_id)
 
-        conn.commit()
-        return jsonify({"message": "Order placed successfully"})
+def place_order(tx, user_id, order):
+    """
+    Write command for a single order. Raises OrderError if the market doesn't
+    exist.
+    """
+    cursor = tx.conn.cursor()
+
+    # Check if the market exists and is still open
+    market = market_cache().get(tx.conn, order.market_id)
+    if not market:
+        raise OrderError(f"Market with ID {order.market_id} does not exist.", 404)
+    if market.resolved_at is not None:
+        raise OrderError(f"Market with ID {order.market_id} has already been resolved.")
+
+    book = engine.get_book(cursor, order.market_id)
+    # The book is mutated ahead of the commit, rebuild it from disk on failure
+    tx.on_rollback(functools.partial(engine.discard, order.market_id))
+    with book.lock:
+        writes = PendingWrites()
+        publish = match_order(cursor, book, user_id, order, writes)
+        writes.flush(tx, cursor)
+    tx.on_commit(publish)
+
+
+def execute_command(name, *args):
+    """
+    Submit the write command name of COMMANDS, called as fn(tx, *args), to the
+    database's sequencer. Returns its result and status. Commands run outside
+    of the app context, so they return plain data. OrderErrors are reported to
+    the client, anything else is logged and reported as the command's failure
+    message.
+    """
+    fn, failure_message = COMMANDS[name]
+    sequencer = get_sequencer(app.config["DATABASE"])
+    try:
+        result = sequencer.submit(lambda tx: fn(tx, *args))
+        if journal is not None and journal.snapshot_due:
+            sequencer.submit(journal.snapshot)
+        return result, 200
+    except OrderError as e:
+        return {"error": e.message}, e.status
     except Exception as e:
-        logging.error(f"Error placing order: {str(e)}")
-        conn.rollback()
-        return jsonify({"error": "An error occurred while placing the order."}), 500
-    finally:
-        conn.close()
+        logging.error(f"{failure_message} {str(e)}")
+        return {"error": failure_message}, 500
 
 
-def get_matching_orders(cursor, order_direction, price_cents):
-    # Match the order with existing opposite orders
-    if order_direction == "buy":
-        cursor.execute(
-            """
-                SELECT id,
-                    price_cents,
-                    quantity,
-                    user_id
-                FROM orders
-                WHERE market_id = ?
-                    AND order_direction = 'sell'
-                    AND price_cents >= ?
-                    AND (
-                        expires_at IS NULL
-                        OR expires_at > CURRENT_TIMESTAMP
-                    )
-                ORDER BY price_cents ASC,
-                    created_at ASC
-            """,
-            (market_id, price_cents),
+def run_command(market_id, name, *args):
+    """
+    Run a write command for a market and turn its result into a response. With
+    MATCHING_WORKERS set, it runs on the worker owning the market.
+    """
+    if workers is None:
+        result, status = execute_command(name, *args)
+        return jsonify(result), status
+
+    try:
+        result, status = workers.call(market_id, "command", name, *args)
+    except Exception as e:
+        failure_message = COMMANDS[name][1]
+        logging.error(f"{failure_message} {str(e)}")
+        return jsonify({"error": failure_message}), 500
+    return jsonify(result), status
+
+
+def order_command(tx, user_id, order):
+    place_order(tx, user_id, order)
+    return {"message": "Order placed successfully"}
+
+
+@app.route("/order", methods=["POST"])
+def order():
+    data = request.get_json()
+    user_id = session["user_id"]
+
+    try:
+        order = parse_order(data)
+    except OrderError as e:
+        return jsonify({"error": e.message}), e.status
+
+    return run_command(order.market_id, "order", user_id, order)
+
+
+def publish_fills(book, order_direction, fills):
+    """
+    Publish trade prints for the fills of an incoming order, along with the new
+    depth at every level they touched.
+    """
+    for fill in fills:
+        feed.publish(
+            book.market_id,
+            "trade",
+            {
+                "price_cents": fill.price_cents,
+                "quantity": fill.quantity,
+                "taker_direction": order_direction,
+            },
         )
-    else:
-        cursor.execute(
-            """
-                SELECT id,
-                    price_cents,
-                    quantity,
-                    user_id
-                FROM orders
-                WHERE market_id = ?
-                    AND order_direction = 'buy'
-                    AND price_cents >= ?
-                    AND (
-                        expires_at IS NULL
-                        OR expires_at > CURRENT_TIMESTAMP
-                    )
-                ORDER BY price_cents DESC,
-                    created_at ASC
-            """,
-            (market_id, price_cents),
+    resting_direction = "sell" if order_direction == "buy" else "buy"
+    publish_levels(book, {(resting_direction, fill.price_cents) for fill in fills})
+
+
+def publish_levels(book, levels):
+    with book.lock:
+        for order_direction, price_cents in levels:
+            feed.publish_level(
+                book.market_id,
+                order_direction,
+                price_cents,
+                book.level_quantity(order_direction, price_cents),
+            )
+
+
+def find_order_market(cursor, user_id, order_id):
+    """
+    Return the market of an order, after checking that it exists and belongs to
+    the user.
+    """
+    cursor.execute(
+        "SELECT market_id FROM orders WHERE id = ? AND creator_id = ?",
+        (order_id, user_id),
+    )
+    order = cursor.fetchone()
+    if not order:
+        raise OrderError(
+            f"Order with ID {order_id} does not exist or does not belong to you.",
+            404,
         )
+    return order[0]
+
+
+def cancel_command(tx, user_id, order_id):
+    cursor = tx.conn.cursor()
+    market_id = find_order_market(cursor, user_id, order_id)
 
-    matching_orders = cursor.fetchall()
+    # Delete the order from the orders table and the book
+    book = engine.get_book(cursor, market_id)
+    tx.on_rollback(functools.partial(engine.discard, market_id))
+    with book.lock:
+        cursor.execute("DELETE FROM orders WHERE id = ?", (order_id,))
+        cancelled = book.cancel(order_id)
+    record_events(tx, [cancel_event(market_id, order_id)])
+    if cancelled is not None:
+        tx.on_commit(
+            functools.partial(
+                publish_levels,
+                book,
+                {(cancelled.order_direction, cancelled.price_cents)},
+            )
+        )
+    return {"message": "Order cancelled successfully"}
 
 
 @app.route("/cancel_order", methods=["POST"])
@@ -193,52 +573,152 @@ def cancel_order():
     order_id = data["order_id"]
     user_id = session["user_id"]
 
-    # Function logic goes here
-    try:
-        conn = get_db()
-        cursor = conn.cursor()
+    market_id = None
+    if workers is not None:
+        # Find the worker owning the order; it checks again when cancelling
+        try:
+            market_id = find_order_market(get_db().cursor(), user_id, order_id)
+        except OrderError as e:
+            return jsonify({"error": e.message}), e.status
 
-        # Begin a transaction
-        cursor.execute("BEGIN TRANSACTION")
+    return run_command(market_id, "cancel", user_id, order_id)
 
-        # Check if the order exists and belongs to the user
-        cursor.execute(
-            "SELECT id FROM orders WHERE id = ? AND user_id = ?",
-            (order_id, user_id),
-        )
-        order = cursor.fetchone()
-        if not order:
-            cursor.execute("ROLLBACK")
+
+def error_result(e):
+    return {"error": e.message, "status": e.status}
+
+
+def batch_command(tx, user_id, cancel_ids, orders):
+    cursor = tx.conn.cursor()
+    cancel_results = []
+    order_results = []
+
+    cancels = []
+    for order_id in cancel_ids:
+        try:
+            cancels.append((order_id, find_order_market(cursor, user_id, order_id)))
+        except OrderError as e:
+            cancels.append((order_id, e))
+
+    # Check which markets exist and are still open
+    market_ids = {o.market_id for o in orders if isinstance(o, OrderRequest)}
+    markets = [market_cache().get(tx.conn, m) for m in market_ids]
+    existing = {m.id for m in markets if m is not None}
+    resolved = {m.id for m in markets if m is not None and m.resolved_at}
+    existing.update(m for _, m in cancels if not isinstance(m, OrderError))
+
+    # Lock books in a fixed order so they can't deadlock with readers
+    books = {m: engine.get_book(cursor, m) for m in sorted(existing)}
+    for market_id in books:
+        tx.on_rollback(functools.partial(engine.discard, market_id))
+    with ExitStack() as stack:
+        for book in books.values():
+            stack.enter_context(book.lock)
+
+        writes = PendingWrites()
+        deletes = {}
+        for order_id, market_id in cancels:
+            if isinstance(market_id, OrderError):
+                cancel_results.append(error_result(market_id))
+                continue
+            if order_id in deletes:
+                e = OrderError(
+                    f"Order with ID {order_id} has already been cancelled.",
+                    404,
+                )
+                cancel_results.append(error_result(e))
+                continue
+            deletes[order_id] = (order_id,)
+            writes.events.append(cancel_event(market_id, order_id))
+            cancelled = books[market_id].cancel(order_id)
+            if cancelled is not None:
+                tx.on_commit(
+                    functools.partial(
+                        publish_levels,
+                        books[market_id],
+                        {(cancelled.order_direction, cancelled.price_cents)},
+                    )
+                )
+            cancel_results.append({"message": "Order cancelled successfully"})
+        cursor.executemany("DELETE FROM orders WHERE id = ?", deletes.values())
+
+        for order in orders:
+            if isinstance(order, OrderError):
+                order_results.append(error_result(order))
+                continue
+            if order.market_id not in existing:
+                e = OrderError(f"Market with ID {order.market_id} does not exist.", 404)
+                order_results.append(error_result(e))
+                continue
+            if order.market_id in resolved:
+                e = OrderError(
+                    f"Market with ID {order.market_id} has already been resolved."
+                )
+                order_results.append(error_result(e))
+                continue
+            book = books[order.market_id]
+            tx.on_commit(match_order(cursor, book, user_id, order, writes))
+            order_results.append({"message": "Order placed successfully"})
+        writes.flush(tx, cursor)
+
+    return {"cancels": cancel_results, "orders": order_results}
+
+
+@app.route("/orders/batch", methods=["POST"])
+def order_batch():
+    """
+    Submit many orders and cancels as one write command. The body is
+    {"cancels": [order_id, ...], "orders": [order, ...]}, where each order takes
+    the same fields as /order. Cancels are applied first, then orders in the
+    order given. A rejected item doesn't affect the others; the response has a
+    result per item, in the same shape as the single-item endpoints plus the
+    status of errors.
+    """
+    data = request.get_json()
+    user_id = session["user_id"]
+
+    orders = []
+    for item in data.get("orders", []):
+        try:
+            orders.append(parse_order(item))
+        except OrderError as e:
+            orders.append(e)
+
+    cancel_ids = data.get("cancels", [])
+    market_id = None
+    if workers is not None:
+        # The whole batch is one command, so it must stay within a shard
+        market_ids = {o.market_id for o in orders if isinstance(o, OrderRequest)}
+        cursor = get_db().cursor()
+        for order_id in cancel_ids:
+            try:
+                market_ids.add(find_order_market(cursor, user_id, order_id))
+            except OrderError:
+                pass
+        if len({shard_of(m, len(workers)) for m in market_ids}) > 1:
             return (
-                jsonify(
-                    {
-                        "error": f"Order with ID {order_id} does not exist or does not belong to you."
-                    }
-                ),
-                404,
+                jsonify({"error": "A batch can only touch markets of one shard."}),
+                400,
             )
+        market_id = min(market_ids, default=0)
 
-        # Delete the order from the orders table
-        cursor.execute("DELETE FROM orders WHERE id = ?", (order_id,))
-
-        conn.commit()
-        return jsonify({"message": "Order cancelled successfully"})
-    except Exception as e:
-        logging.error(f"Error cancelling order: {str(e)}")
-        conn.rollback()
-        return jsonify({"error": "An error occurred while cancelling the order."}), 500
-    finally:
-        conn.close()
+    return run_command(market_id, "batch", user_id, cancel_ids, orders)
 
 
 @app.route("/pnl", methods=["GET"])
 def pnl():
+    """
+    Realized PnL by default. With mode=last or mode=mid, open positions are
+    also valued at the market's last trade price or the mid of its book, when
+    it is loaded and has both sides.
+    """
     user = request.args.get("user", "me")
     market = request.args.get("market", "all")
+    mode = request.args.get("mode", "realized")
     user_id = session["user_id"]
 
     # Function logic goes here
-    conn = sqlite3.connect("market.db")
+    conn = get_db()
     c = conn.cursor()
 
     if user == "me":
@@ -273,47 +753,62 @@ def pnl():
                 400,
             )
 
+    if mode not in ("realized", "last", "mid"):
+        return (
+            jsonify({"error": "Invalid mode. Please provide realized, last or mid."}),
+            400,
+        )
+
     if market_id is not None:
         # Check if the market exists
-        c.execute("SELECT id FROM markets WHERE id = ?", (market_id,))
-        market = c.fetchone()
-        if market is None:
+        if market_cache().get(conn, market_id) is None:
             return (
                 jsonify({"error": f"Market with ID {market_id} does not exist."}),
                 404,
             )
 
-    # Calculate PNL for the specified user(s) and market(s)
+    if mode != "realized":
+        return mark_to_market_pnl(conn, user, user_id, market_id, mode)
+
+    # Read PNL for the specified user(s) and market(s) from the positions ledger
     if user_id is not None and market_id is not None:
         c.execute(
             """
-            SELECT SUM(CASE WHEN t.buyer_id = ? THEN -t.price_cents * t.quantity ELSE t.price_cents * t.quantity END) / 100.0 AS pnl
-            FROM trades t
-            WHERE t.market_id = ? AND (t.buyer_id = ? OR t.seller_id = ?)
+            SELECT cash_cents / 100.0 AS pnl
+            FROM positions
+            WHERE user_id = ? AND market_id = ?
         """,
-            (user_id, market_id, user_id, user_id),
+            (user_id, market_id),
         )
     elif user_id is not None:
         c.execute(
             """
-            SELECT SUM(CASE WHEN t.buyer_id = ? THEN -t.price_cents * t.quantity ELSE t.price_cents * t.quantity END) / 100.0 AS pnl
-            FROM trades t
-            WHERE t.buyer_id = ? OR t.seller_id = ?
+            SELECT SUM(cash_cents) / 100.0 AS pnl
+            FROM positions
+            WHERE user_id = ?
+            GROUP BY user_id
         """,
-            (user_id, user_id, user_id),
+            (user_id,),
+        )
+    elif market_id is not None:
+        c.execute(
+            """
+            SELECT user_id, cash_cents / 100.0 AS pnl
+            FROM positions
+            WHERE market_id = ?
+        """,
+            (market_id,),
         )
     else:
         c.execute(
             """
-            SELECT u.id, SUM(CASE WHEN t.buyer_id = u.id THEN -t.price_cents * t.quantity ELSE t.price_cents * t.quantity END) / 100.0 AS pnl
-            FROM trades t
-            JOIN users u ON t.buyer_id = u.id OR t.seller_id = u.id
-            GROUP BY u.id
+            SELECT user_id, SUM(cash_cents) / 100.0 AS pnl
+            FROM positions
+            GROUP BY user_id
         """
         )
 
     result = c.fetchall()
-    conn.close()
 
     if len(result) == 0:
         return (
@@ -333,99 +828,366 @@ def pnl():
             return jsonify({"pnl_data": pnl_data})
 
 
-@app.route("/resolve_market", methods=["POST"])
-def resolve_market():
-    data = request.get_json()
-    market_id = data["market_id"]
-    outcome = data["outcome"]
-    payout_dollars = data["payout_dollars"]
+def book_mids():
+    """
+    Mid price in cents of every loaded book with both a bid and an ask.
+    """
+    mids = {}
+    for book in engine.books():
+        with book.lock:
+            bid, ask = book.best_bid(), book.best_ask()
+        if bid is not None and ask is not None:
+            mids[book.market_id] = (bid + ask) / 2
+    return mids
 
-    # Function logic goes here
-    payout_cents = int(payout_dollars * 100)
 
-    conn = sqlite3.connect("market.db")
-    c = conn.cursor()
+def mark_to_market_pnl(conn, user, user_id, market_id, mode):
+    marks = mark_prices(conn, book_mids() if mode == "mid" else None)
+    table = compute_pnl(load_positions(conn, user_id, market_id), marks)
+    if len(table) == 0:
+        return (
+            jsonify(
+                {"error": "No PNL data found for the specified user(s) and market(s)."}
+            ),
+            404,
+        )
 
-    # Check if the market exists and is not already resolved
-    c.execute("SELECT id, resolved_at FROM markets WHERE id = ?", (market_id,))
-    market = c.fetchone()
+    pnl_data = [
+        {
+            "user_id": int(table.user_ids[i]),
+            "pnl": f"${table.total_cents[i] / 100:.2f}",
+            "realized": f"${table.realized_cents[i] / 100:.2f}",
+            "unrealized": f"${table.unrealized_cents[i] / 100:.2f}",
+        }
+        for i in range(len(table))
+    ]
+    if user_id is not None:
+        entry = pnl_data[0]
+        return jsonify(
+            {
+                "pnl": f"PNL for user {user}: {entry['pnl']}",
+                "realized": entry["realized"],
+                "unrealized": entry["unrealized"],
+            }
+        )
+    return jsonify({"pnl_data": pnl_data})
 
-    if market is None:
-        return jsonify({"error": f"Market with ID {market_id} does not exist."}), 404
 
-    if market[1] is not None:
+@app.route("/leaderboard", methods=["GET"])
+def get_leaderboard():
+    """
+    Users ranked by mark-to-market PnL, with open positions valued at the last
+    trade price. Only recomputed after a trade or a change to any market, such
+    as its resolution.
+    """
+    limit = request.args.get("limit", "10")
+    try:
+        limit = int(limit)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_LEADERBOARD_LIMIT:
+        return (
+            jsonify({"error": f"limit must be between 1 and {MAX_LEADERBOARD_LIMIT}."}),
+            400,
+        )
+
+    # Last trade prices only move with new trades, and payouts with markets
+    conn = get_db()
+    (last_trade_id,) = conn.execute(
+        "SELECT COALESCE(MAX(id), 0) FROM trades"
+    ).fetchone()
+    (version,) = conn.execute(
+        "SELECT version FROM markets_version WHERE id = 1"
+    ).fetchone()
+    etag = f"{last_trade_id}-{version}"
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    snapshot = leaderboards.get(limit, etag)
+    if snapshot is None:
+        table = compute_pnl(load_positions(conn), mark_prices(conn))
+        body = app.json.dumps({"leaderboard": leaderboard(table, limit)})
+        snapshot = Snapshot(etag=etag, body=body.encode())
+        leaderboards.put(limit, snapshot)
+
+    response = app.response_class(snapshot.body, mimetype="application/json")
+    response.set_etag(etag)
+    return response
+
+
+def parse_time(value, default):
+    """
+    Parse a query parameter given as epoch seconds or an ISO date(time), UTC
+    unless it says otherwise.
+    """
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        return parse_micros(value) // MICROS_PER_SECOND
+
+
+@app.route("/candles", methods=["GET"])
+def candles():
+    """
+    OHLCV bars of a market, oldest first. interval is one of 1m, 5m, 1h or 1d;
+    from and to bound the bars' start times as epoch seconds or ISO dates, to
+    exclusive.
+    """
+    interval = request.args.get("interval", "1m")
+    if interval not in INTERVALS:
         return (
             jsonify(
-                {"error": f"Market with ID {market_id} has already been resolved."}
+                {
+                    "error": f"Invalid interval. Please use one of {', '.join(INTERVALS)}."
+                }
             ),
             400,
         )
+    try:
+        market_id = int(request.args.get("market_id"))
+        start = parse_time(request.args.get("from"), 0)
+        end = parse_time(request.args.get("to"), None)
+    except (TypeError, ValueError):
+        return (
+            jsonify(
+                {
+                    "error": "Invalid market ID or time range. Please provide an integer market ID and epoch seconds or ISO dates."
+                }
+            ),
+            400,
+        )
+
+    if get_market_by_id_or_name(market_id) is None:
+        return jsonify({"error": "Market not found."}), 404
 
-    # Update the market with the resolution details
-    c.execute(
-        "UPDATE markets SET outcome = ?, payout_cents = ?, resolved_at = CURRENT_TIMESTAMP WHERE id = ?",
-        (outcome, payout_cents, market_id),
+    bars = get_candles(get_db(), market_id, INTERVALS[interval], start, end)
+    return jsonify({"market_id": market_id, "interval": interval, "candles": bars})
+
+
+@app.route("/export/<table>", methods=["GET"])
+def export_table(table):
+    """
+    Stream a whole table (markets, orders or trades) as CSV or NDJSON, given by
+    format. Orders and trades can be filtered by market_id, and every table by
+    time range with from and to, as ISO dates; to is exclusive.
+    """
+    export_format = request.args.get("format", "csv")
+    if table not in TABLES or export_format not in FORMATS:
+        return (
+            jsonify(
+                {
+                    "error": f"Please export one of {', '.join(TABLES)} as one of {', '.join(FORMATS)}."
+                }
+            ),
+            400,
+        )
+    market_id = request.args.get("market_id")
+    if market_id is not None:
+        try:
+            market_id = int(market_id)
+        except ValueError:
+            return (
+                jsonify(
+                    {"error": "Invalid market ID. Please provide a valid integer."}
+                ),
+                400,
+            )
+
+    start, end = request.args.get("from"), request.args.get("to")
+    # Checked up front, the export itself only starts once the response does
+    try:
+        for value in (start, end):
+            if value is not None:
+                parse_micros(value)
+    except ValueError:
+        return (
+            jsonify(
+                {
+                    "error": "Invalid time range. Please provide from and to as ISO dates."
+                }
+            ),
+            400,
+        )
+    archive_dir = app.config["ARCHIVE_DIR"]
+    history = None
+    if table == "trades" and archive_dir is not None:
+        # Trades including the archived ones. The archives are attached to a
+        # connection of its own, so no pooled connection keeps them attached,
+        # and before the response starts, so a failure is reported as such
+        history = get_pool(app.config["DATABASE"]).connect()
+        try:
+            attach_archives(history, archive_dir, start, end)
+        except BaseException:
+            history.close()
+            raise
+        db = Database(history)
+    else:
+        db = Database(get_db())
+    chunks = export(
+        db, table, export_format, market_id, start, end, history=history is not None
+    )
+    response = app.response_class(
+        # Keep the request's connection checked out until the export is done
+        stream_with_context(chunks),
+        mimetype=FORMATS[export_format],
+        headers={
+            "Content-Disposition": f"attachment; filename={table}.{export_format}"
+        },
     )
-    conn.commit()
-    conn.close()
+    if history is not None:
+        response.call_on_close(history.close)
+    return response
+
+
+@app.route("/markets/search", methods=["GET"])
+def search():
+    """
+    Markets whose name or criteria match every term of q, best match first. Use
+    double quotes for phrases and a trailing * for prefixes. Paginated with
+    limit and offset.
+    """
+    q = request.args.get("q", "")
+    try:
+        limit = min(
+            int(request.args.get("limit", DEFAULT_SEARCH_LIMIT)), MAX_SEARCH_LIMIT
+        )
+        offset = int(request.args.get("offset", 0))
+        if limit <= 0 or offset < 0:
+            raise ValueError
+    except ValueError:
+        return (
+            jsonify({"error": "Limit must be positive and offset non-negative."}),
+            400,
+        )
+
+    try:
+        results = search_markets(get_db(), q, limit, offset)
+    except ValueError:
+        return jsonify({"error": "Please provide something to search for."}), 400
 
     return jsonify(
         {
-            "message": f"Market with ID {market_id} has been resolved with outcome '{outcome}' and a payout of ${payout_dollars:.2f}."
+            "results": results,
+            "next_offset": offset + limit if len(results) == limit else None,
         }
     )
 
 
-def get_market_by_id_or_name(market_id=None, market_name=None):
-    conn = sqlite3.connect("market.db")
-    c = conn.cursor()
+def resolve_command(tx, market_id, outcome, payout_cents, payout_dollars):
+    c = tx.conn.cursor()
+
+    # Check if the market exists and is not already resolved
+    c.execute("SELECT id, resolved_at FROM markets WHERE id = ?", (market_id,))
+    market = c.fetchone()
+
+    if market is None:
+        raise OrderError(f"Market with ID {market_id} does not exist.", 404)
+
+    if market[1] is not None:
+        raise OrderError(f"Market with ID {market_id} has already been resolved.")
+
+    # Record the resolution, cancel resting orders and pay out every holder
+    result = settle_market(tx.conn, market_id, outcome, payout_cents)
+    record_events(tx, [resolve_event(market_id)])
+    # Drop the book and the cached market, and any copy loaded from the
+    # database meanwhile
+    invalidate = functools.partial(market_cache().invalidate, market_id)
+    invalidate()
+    tx.on_commit(invalidate)
+    tx.on_rollback(invalidate)
+    tx.on_commit(functools.partial(engine.discard, market_id))
+    logging.info(
+        f"Settled market {market_id}: cancelled {result.orders_cancelled} "
+        f"orders, paid {result.holders} holders in "
+        f"{result.seconds * 1000:.1f}ms"
+    )
+
+    def publish():
+        feed.publish(
+            market_id,
+            "resolved",
+            {
+                "market_id": market_id,
+                "outcome": outcome,
+                "payout_cents": payout_cents,
+            },
+        )
+        feed.close(market_id)
+
+    tx.on_commit(publish)
+    return {
+        "message": f"Market with ID {market_id} has been resolved with outcome '{outcome}' and a payout of ${payout_dollars:.2f}.",
+        "settlement": {
+            "orders_cancelled": result.orders_cancelled,
+            "holders": result.holders,
+            "total_payout_cents": result.total_payout_cents,
+            "milliseconds": round(result.seconds * 1000, 3),
+        },
+    }
+
 
+@app.route("/resolve_market", methods=["POST"])
+def resolve_market():
+    data = request.get_json()
+    try:
+        # Routed to a worker by its value, so it must be an int
+        market_id = int(data["market_id"])
+    except (TypeError, ValueError):
+        return (
+            jsonify({"error": "Invalid market ID. Please provide a valid integer."}),
+            400,
+        )
+    outcome = data["outcome"]
+    payout_dollars = data["payout_dollars"]
+
+    # Function logic goes here
+    payout_cents = int(payout_dollars * 100)
+
+    response = run_command(
+        market_id, "resolve", market_id, outcome, payout_cents, payout_dollars
+    )
+    if workers is not None:
+        # The worker only invalidated its own copy
+        market_cache().invalidate(market_id)
+    return response
+
+
+def get_market_by_id_or_name(market_id=None, market_name=None):
     if market_id is not None:
-        c.execute("SELECT id, name FROM markets WHERE id = ?", (market_id,))
+        market = market_cache().get(get_db(), market_id)
     elif market_name is not None:
-        c.execute("SELECT id, name FROM markets WHERE name = ?", (market_name,))
+        market = market_cache().get_by_name(get_db(), market_name)
     else:
         return None
 
-    market = c.fetchone()
-    conn.close()
-
-    return market
+    return (market.id, market.name) if market else None
 
 
-def get_clob_data(market_id):
-    conn = sqlite3.connect("market.db")
-    c = conn.cursor()
-
-    # Fetch buy orders for the market
-    c.execute(
-        """
-        SELECT price_cents, SUM(quantity) as total_quantity
-        FROM orders
-        WHERE market_id = ? AND order_direction = 'buy' AND (expires_at IS NULL OR expires_at > CURRENT_TIMESTAMP)
-        GROUP BY price_cents
-        ORDER BY price_cents DESC
-        """,
-        (market_id,),
-    )
-    buy_orders = c.fetchall()
+def get_clob_data(book):
+    # Aggregated depth per price level, best price first
+    return book.depth("buy"), book.depth("sell")
 
-    # Fetch sell orders for the market
-    c.execute(
-        """
-        SELECT price_cents, SUM(quantity) as total_quantity
-        FROM orders
-        WHERE market_id = ? AND order_direction = 'sell' AND (expires_at IS NULL OR expires_at > CURRENT_TIMESTAMP)
-        GROUP BY price_cents
-        ORDER BY price_cents ASC
-        """,
-        (market_id,),
-    )
-    sell_orders = c.fetchall()
 
-    conn.close()
+def get_clob_payload(market_id, market_name, depth):
+    buy_orders, sell_orders = depth
 
-    return buy_orders, sell_orders
+    # Prepare the response data
+    return {
+        "market_id": market_id,
+        "market_name": market_name,
+        "buy_orders": [
+            {"price_cents": order[0], "total_quantity": order[1]}
+            for order in buy_orders
+        ],
+        "sell_orders": [
+            {"price_cents": order[0], "total_quantity": order[1]}
+            for order in sell_orders
+        ],
+    }
 
 
 @app.route("/clob", methods=["GET"])
@@ -454,23 +1216,161 @@ def get_clob():
         return jsonify({"error": "Market not found."}), 404
 
     market_id, market_name = market
-    buy_orders, sell_orders = get_clob_data(market_id)
+    if workers is not None:
+        book_etag, depth = workers.call(market_id, "book", market_id)
+        return clob_response(market_id, market_name, book_etag, lambda: depth)
 
-    # Prepare the response data
-    clob_data = {
-        "market_id": market_id,
-        "market_name": market_name,
-        "buy_orders": [
-            {"price_cents": order[0], "total_quantity": order[1]}
-            for order in buy_orders
-        ],
-        "sell_orders": [
-            {"price_cents": order[0], "total_quantity": order[1]}
-            for order in sell_orders
-        ],
-    }
+    book = engine.get_book(get_db().cursor(), market_id)
+    with book.lock:
+        return clob_response(
+            market_id, market_name, book.etag, functools.partial(get_clob_data, book)
+        )
+
+
+def clob_response(market_id, market_name, book_etag, get_depth):
+    """
+    The /clob response for a book in the state tagged book_etag, only calling
+    get_depth if no snapshot for that state is cached.
+    """
+    # The name is part of the response, so a rename must change the tag too
+    etag = f"{book_etag}-{zlib.crc32(market_name.encode()):08x}"
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    snapshot = snapshots.get(market_id, etag)
+    if snapshot is None:
+        clob_data = get_clob_payload(market_id, market_name, get_depth())
+        snapshot = Snapshot(etag=etag, body=app.json.dumps(clob_data).encode())
+        snapshots.put(market_id, snapshot)
+
+    response = app.response_class(snapshot.body, mimetype="application/json")
+    response.set_etag(etag)
+    return response
+
+
+@app.route("/stream", methods=["GET"])
+def stream():
+    """
+    Server-sent events for a single market: a "snapshot" of the book in the same
+    shape as /clob, followed by "depth" updates with the new total quantity at a
+    price level, "trade" prints and finally "resolved". A "resync" event means
+    the client fell too far behind; the stream ends and should be reopened.
+    Markets that are already resolved get a 410.
+    """
+    market_id = request.args.get("market_id")
+    try:
+        market_id = int(market_id)
+    except (TypeError, ValueError):
+        return (
+            jsonify({"error": "Invalid market ID. Please provide a valid integer."}),
+            400,
+        )
+
+    market = get_market_by_id_or_name(market_id)
+    if market is None:
+        return jsonify({"error": "Market not found."}), 404
 
-    return jsonify(clob_data)
+    market_id, market_name = market
+    if workers is not None:
+        # Updates from the worker reach the feed some time after they happen,
+        # so subscribe before taking the snapshot: an update can then be sent
+        # twice, but never lost
+        subscriber = feed.subscribe(market_id)
+        try:
+            _, depth = workers.call(market_id, "book", market_id)
+        except Exception:
+            feed.unsubscribe(market_id, subscriber)
+            raise
+        snapshot = get_clob_payload(market_id, market_name, depth)
+    else:
+        book = engine.get_book(get_db().cursor(), market_id)
+        # Subscribe under the book lock so no update falls between the snapshot
+        # and the first message
+        with book.lock:
+            subscriber = feed.subscribe(market_id)
+            snapshot = get_clob_payload(market_id, market_name, get_clob_data(book))
+
+    # A resolved market sends nothing more. Check after subscribing, and on disk
+    # rather than the cache, so a resolution committed meanwhile either shows
+    # up here or sends its "resolved" event to the subscriber
+    c = get_db().execute("SELECT resolved_at FROM markets WHERE id = ?", (market_id,))
+    row = c.fetchone()
+    if row is None or row[0] is not None:
+        feed.unsubscribe(market_id, subscriber)
+        if row is None:
+            return jsonify({"error": "Market not found."}), 404
+        return (
+            jsonify({"error": f"Market with ID {market_id} has been resolved."}),
+            410,
+        )
+
+    def generate():
+        try:
+            yield format_sse("snapshot", snapshot)
+            while not subscriber.closed:
+                messages = subscriber.drain(timeout=STREAM_KEEPALIVE_SECONDS)
+                if not messages:
+                    yield ": keepalive\n\n"
+                for event, data in messages:
+                    yield format_sse(event, data)
+                    if event == "resync":
+                        return
+        finally:
+            feed.unsubscribe(market_id, subscriber)
+
+    return app.response_class(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+# Write commands, by name, with the message reported if they fail unexpectedly
+COMMANDS = {
+    "order": (order_command, "An error occurred while placing the order."),
+    "cancel": (cancel_command, "An error occurred while cancelling the order."),
+    "batch": (batch_command, "An error occurred while placing the order batch."),
+    "resolve": (resolve_command, "An error occurred while resolving the market."),
+}
+
+
+def read_book(market_id):
+    """
+    The etag and depth of a market's book, as requested from a worker.
+    """
+    pool = get_pool(app.config["DATABASE"])
+    conn = pool.acquire()
+    try:
+        book = engine.get_book(conn.cursor(), market_id)
+    finally:
+        pool.release(conn)
+    with book.lock:
+        return book.etag, get_clob_data(book)
+
+
+def run_matching_worker(shard, shards, config, events, requests, responses):
+    """
+    Entry point of a matching worker process, owning the books of the markets
+    in its shard. It runs the write commands of COMMANDS forwarded by the web
+    process, through a sequencer of its own, and relays feed updates back to it.
+    """
+    global feed
+    app.config.update(config)
+    feed = RelayFeed(events)
+    logging.info(f"Matching worker {shard + 1}/{shards} started")
+
+    interval = config["EXPIRY_INTERVAL_SECONDS"]
+    if interval is not None:
+        expiry.interval_seconds = interval
+        expiry.start(get_sequencer(config["DATABASE"]))
+    try:
+        serve({"command": execute_command, "book": read_book}, requests, responses)
+    finally:
+        expiry.stop()
+        close_sequencers()
+        close_pools()
 
 
 if __name__ == "__main__":
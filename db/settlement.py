@@ -0,0 +1,65 @@
+"""
+Bulk settlement of resolved markets. Everything is done set-based in the
+caller's transaction, with a constant number of statements however many trades
+or holders the market has: resting orders are deleted in one statement, and
+every holder's payout is computed from the positions ledger by a single
+INSERT ... SELECT.
+"""
+
+import sqlite3
+import time
+from dataclasses import dataclass
+
+from .timestamps import now_micros
+
+
+@dataclass
+class SettlementResult:
+    orders_cancelled: int
+    holders: int
+    total_payout_cents: int  # paid to long holders, and owed by short ones
+    seconds: float
+
+
+def settle_market(
+    conn: sqlite3.Connection, market_id: int, outcome: str, payout_cents: int
+) -> SettlementResult:
+    """
+    Resolve a market with a payout of payout_cents per share held, cancelling
+    its resting orders and writing a settlement row for every holder. Doesn't
+    commit, and expects the market to exist and not to be resolved yet.
+    """
+    start = time.perf_counter()
+    conn.execute(
+        """
+        UPDATE markets
+        SET outcome = ?, payout_cents = ?, resolved_at = ?
+        WHERE id = ?
+        """,
+        (outcome, payout_cents, now_micros(), market_id),
+    )
+    orders_cancelled = conn.execute(
+        "DELETE FROM orders WHERE market_id = ?", (market_id,)
+    ).rowcount
+
+    holders = conn.execute(
+        """
+        INSERT INTO settlements (market_id, user_id, quantity, cash_cents, payout_cents, pnl_cents)
+        SELECT market_id, user_id, quantity, cash_cents, quantity * ?, cash_cents + quantity * ?
+        FROM positions
+        WHERE market_id = ?
+        """,
+        (payout_cents, payout_cents, market_id),
+    ).rowcount
+    (total_payout_cents,) = conn.execute(
+        "SELECT COALESCE(SUM(MAX(payout_cents, 0)), 0) FROM settlements "
+        "WHERE market_id = ?",
+        (market_id,),
+    ).fetchone()
+
+    return SettlementResult(
+        orders_cancelled=orders_cancelled,
+        holders=holders,
+        total_payout_cents=total_payout_cents,
+        seconds=time.perf_counter() - start,
+    )
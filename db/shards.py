@@ -0,0 +1,187 @@
+"""
+Market-sharded worker processes. Markets are hashed to a fixed number of
+shards, each served by a process of its own, which owns the books and the write
+connection for its markets. Matching for different shards runs in parallel, and
+a hot market only slows down the markets sharing its shard.
+
+Requests are (name, args) tuples sent to a worker over a queue, and answered
+with the handler's return value. Workers can also send events back, e.g. feed
+updates, which are handed to on_event in the parent.
+
+The shards still share one database file, so their commits take turns on
+SQLite's write lock; each worker groups whatever commands are queued into a
+single commit, which keeps the time spent waiting for the lock short.
+"""
+
+import itertools
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+DEFAULT_THREADS = 32
+DEFAULT_CALL_TIMEOUT_SECONDS = 30.0
+
+
+class WorkerError(Exception):
+    """
+    A request failed with an exception inside a worker.
+    """
+
+
+def shard_of(market_id: int, shards: int) -> int:
+    return market_id % shards
+
+
+def serve(
+    handlers: Dict[str, Callable[..., Any]],
+    requests: multiprocessing.Queue,
+    responses: multiprocessing.Queue,
+    threads: int = DEFAULT_THREADS,
+) -> None:
+    """
+    Worker side request loop, until a None request. Requests are handled on a
+    thread pool, so commands arriving together reach the worker's write
+    sequencer together and are committed as one group.
+    """
+    with ThreadPoolExecutor(threads) as pool:
+        while (request := requests.get()) is not None:
+            request_id, name, args = request
+            future = pool.submit(handlers[name], *args)
+            future.add_done_callback(partial(_respond, responses, request_id))
+
+
+def _respond(responses: multiprocessing.Queue, request_id: int, future) -> None:
+    error = future.exception()
+    if error is not None:
+        responses.put((request_id, False, f"{type(error).__name__}: {error}"))
+    else:
+        responses.put((request_id, True, future.result()))
+
+
+class ShardWorker:
+    """
+    Parent side handle on one worker process, running target(*args, requests,
+    responses).
+    """
+
+    def __init__(self, context, target: Callable, args: tuple, name: str):
+        self.requests = context.Queue()
+        self.responses = context.Queue()
+        self.process = context.Process(
+            target=target,
+            args=(*args, self.requests, self.responses),
+            name=name,
+            daemon=True,
+        )
+        self._ids = itertools.count()
+        self._pending: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+        self._reader = threading.Thread(
+            target=self._read, name=f"{name}-responses", daemon=True
+        )
+
+    def start(self) -> None:
+        self.process.start()
+        self._reader.start()
+
+    def stop(self) -> None:
+        self.requests.put(None)
+        self.process.join()
+        self.responses.put(None)
+        self._reader.join()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(WorkerError("Worker stopped"))
+
+    def call(
+        self, name: str, *args, timeout: float = DEFAULT_CALL_TIMEOUT_SECONDS
+    ) -> Any:
+        """
+        Run the worker's handler for name on args and return its result.
+        """
+        future = Future()
+        with self._lock:
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+        self.requests.put((request_id, name, args))
+        try:
+            return future.result(timeout)
+        finally:
+            with self._lock:
+                self._pending.pop(request_id, None)
+
+    def _read(self) -> None:
+        while (response := self.responses.get()) is not None:
+            request_id, ok, value = response
+            with self._lock:
+                future = self._pending.pop(request_id, None)
+            if future is None:
+                continue  # timed out
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(WorkerError(value))
+
+
+class ShardPool:
+    """
+    One worker process per shard, each running target(shard, shards, *args,
+    events, requests, responses). Workers are spawned rather than forked, so
+    they don't inherit the parent's threads or connections.
+    """
+
+    def __init__(
+        self,
+        shards: int,
+        target: Callable,
+        args: tuple = (),
+        on_event: Optional[Callable[..., Any]] = None,
+    ):
+        context = multiprocessing.get_context("spawn")
+        self.events = context.Queue()
+        self.on_event = on_event
+        self.workers = [
+            ShardWorker(
+                context, target, (shard, shards, *args, self.events), f"shard-{shard}"
+            )
+            for shard in range(shards)
+        ]
+        self._relay = threading.Thread(
+            target=self._relay_events, name="shard-events", daemon=True
+        )
+
+    def __len__(self) -> int:
+        return len(self.workers)
+
+    def start(self) -> None:
+        for worker in self.workers:
+            worker.start()
+        self._relay.start()
+
+    def stop(self) -> None:
+        for worker in self.workers:
+            worker.stop()
+        self.events.put(None)
+        self._relay.join()
+
+    def worker(self, market_id: int) -> ShardWorker:
+        return self.workers[shard_of(market_id, len(self.workers))]
+
+    def call(self, market_id: int, name: str, *args) -> Any:
+        """
+        Run a request on the worker owning market_id.
+        """
+        return self.worker(market_id).call(name, *args)
+
+    def _relay_events(self) -> None:
+        while (event := self.events.get()) is not None:
+            if self.on_event is None:
+                continue
+            try:
+                self.on_event(*event)
+            except Exception as e:
+                logging.error(f"Error handling shard event: {str(e)}")
@@ -0,0 +1,193 @@
+"""
+Slow-query log. Statements run through a TimedCursor that take longer than
+SLOW_QUERY_MS (default 100) are logged with their fingerprint, parameter shapes,
+duration and EXPLAIN QUERY PLAN. Repeats of a fingerprint within
+SLOW_QUERY_INTERVAL seconds (default 60) are only counted, and reported with
+the next entry for it. Entries are appended as JSON lines to SLOW_QUERY_LOG if
+set, and logged as warnings otherwise.
+
+Usage: python -m db.slowlog [--top N] LOG_FILE
+    Summarize a log: top fingerprints by total time, and any that do a full
+    table scan.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+
+def normalize_sql(sql: str) -> str:
+    return _WHITESPACE_RE.sub(" ", sql).strip()
+
+
+def fingerprint(sql: str) -> str:
+    """
+    Normalized SQL with literals replaced by placeholders, so statements that
+    differ only in their constants are grouped together.
+    """
+    sql = normalize_sql(sql)
+    sql = _STRING_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    return _IN_LIST_RE.sub("(?...)", sql)
+
+
+def fingerprint_id(fp: str) -> str:
+    return hashlib.sha1(fp.encode()).hexdigest()[:12]
+
+
+def param_shape(params):
+    if isinstance(params, dict):
+        return {k: type(v).__name__ for k, v in params.items()}
+    return [type(v).__name__ for v in params]
+
+
+def is_full_scan(plan: List[str]) -> bool:
+    return any(line.startswith("SCAN ") and " USING " not in line for line in plan)
+
+
+class SlowQueryLog:
+    def __init__(
+        self,
+        threshold_ms: float = 100,
+        interval_seconds: float = 60,
+        path: Optional[str] = None,
+    ):
+        self.threshold_ms = threshold_ms
+        self.interval_seconds = interval_seconds
+        self.path = path
+        # fingerprint -> [last logged at, suppressed count, suppressed ms]
+        self._seen: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def check(
+        self,
+        conn: sqlite3.Connection,
+        sql: str,
+        params,
+        seconds: float,
+        many: bool = False,
+    ) -> Optional[dict]:
+        """
+        Record a statement if it was slow. Returns the entry if one was written.
+        """
+        duration_ms = seconds * 1000
+        if duration_ms < self.threshold_ms:
+            return None
+
+        fp = fingerprint(sql)
+        now = time.monotonic()
+        with self._lock:
+            seen = self._seen.get(fp)
+            if seen is not None and now - seen[0] < self.interval_seconds:
+                seen[1] += 1
+                seen[2] += duration_ms
+                return None
+            suppressed, suppressed_ms = (seen[1], seen[2]) if seen else (0, 0.0)
+            self._seen[fp] = [now, 0, 0.0]
+
+        if many:
+            params = list(params)
+            shape = {
+                "rows": len(params),
+                "row": param_shape(params[0]) if params else [],
+            }
+            explain_params = params[0] if params else ()
+        else:
+            shape = param_shape(params)
+            explain_params = params
+
+        entry = {
+            "ts": datetime.now().isoformat(timespec="seconds"),
+            "id": fingerprint_id(fp),
+            "fingerprint": fp,
+            "params": shape,
+            "duration_ms": round(duration_ms, 3),
+            "suppressed": suppressed,
+            "suppressed_ms": round(suppressed_ms, 3),
+            "plan": self.explain(conn, sql, explain_params),
+        }
+        self.write(entry)
+        return entry
+
+    def explain(self, conn: sqlite3.Connection, sql: str, params) -> List[str]:
+        if not normalize_sql(sql).upper().startswith(_EXPLAINABLE):
+            return []
+        try:
+            # A plain cursor, so explaining isn't itself timed and logged
+            cursor = sqlite3.Cursor(conn)
+            rows = cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        except sqlite3.Error as e:
+            return [f"error: {str(e)}"]
+        return [row[-1] for row in rows]
+
+    def write(self, entry: dict) -> None:
+        line = json.dumps(entry)
+        if self.path is None:
+            logging.warning(f"Slow query: {line}")
+            return
+        with self._lock, open(self.path, "a") as f:
+            f.write(line + "\n")
+
+
+SLOW_QUERY_LOG = SlowQueryLog(
+    threshold_ms=float(os.getenv("SLOW_QUERY_MS", "100")),
+    interval_seconds=float(os.getenv("SLOW_QUERY_INTERVAL", "60")),
+    path=os.getenv("SLOW_QUERY_LOG"),
+)
+
+
+def summarize(entries: List[dict], top: int = 10) -> str:
+    stats = defaultdict(lambda: {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+    plans = {}
+    for entry in entries:
+        s = stats[entry["fingerprint"]]
+        s["count"] += 1 + entry["suppressed"]
+        s["total_ms"] += entry["duration_ms"] + entry["suppressed_ms"]
+        s["max_ms"] = max(s["max_ms"], entry["duration_ms"])
+        plans[entry["fingerprint"]] = entry["plan"]
+
+    lines = [f"Top {top} queries by total time:"]
+    ranked = sorted(stats.items(), key=lambda item: item[1]["total_ms"], reverse=True)
+    for fp, s in ranked[:top]:
+        lines.append(
+            f"{s['total_ms']:12.1f}ms total {s['count']:8d}x "
+            f"{s['max_ms']:10.1f}ms max  {fp}"
+        )
+
+    scans = [fp for fp, plan in plans.items() if is_full_scan(plan)]
+    lines.append("")
+    lines.append(f"Queries with a full table scan: {len(scans)}")
+    for fp in scans:
+        lines.append(f"  {fp}")
+        lines.extend(f"    {line}" for line in plans[fp])
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a slow-query log")
+    parser.add_argument("log_file")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    with open(args.log_file) as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    print(summarize(entries, args.top))
+
+
+if __name__ == "__main__":
+    main()
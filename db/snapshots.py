@@ -0,0 +1,52 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Hashable, Optional
+
+DEFAULT_MAX_MARKETS = 1024
+
+
+@dataclass
+class Snapshot:
+    etag: str
+    body: bytes  # serialized response
+
+
+class SnapshotCache:
+    """
+    Serialized order book snapshots, one per market, each tagged with the book
+    state it was built from. Holds at most max_markets entries, evicting the
+    least recently used market. Any other hashable key works in place of the
+    market id, e.g. for rendered pages.
+    """
+
+    def __init__(self, max_markets: int = DEFAULT_MAX_MARKETS):
+        self.max_markets = max_markets
+        self.hits = 0
+        self.misses = 0
+        self._snapshots: "OrderedDict[Hashable, Snapshot]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, market_id: Hashable, etag: str) -> Optional[Snapshot]:
+        """
+        Return the cached snapshot for market_id if it is still for etag.
+        """
+        with self._lock:
+            snapshot = self._snapshots.get(market_id)
+            if snapshot is None or snapshot.etag != etag:
+                self.misses += 1
+                return None
+            self._snapshots.move_to_end(market_id)
+            self.hits += 1
+            return snapshot
+
+    def put(self, market_id: Hashable, snapshot: Snapshot) -> None:
+        with self._lock:
+            self._snapshots[market_id] = snapshot
+            self._snapshots.move_to_end(market_id)
+            while len(self._snapshots) > self.max_markets:
+                self._snapshots.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._snapshots.clear()
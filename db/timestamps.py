@@ -0,0 +1,44 @@
+"""
+Conversions for time columns, which are stored as integer microseconds since
+the Unix epoch, UTC (see migration 0010). Integers compare and range scan in
+the indexes as is, whatever produced them.
+
+Naive datetimes are taken to be local time, like datetime.timestamp() does, so
+the result of parse_duration() converts as expected. Times read back are aware
+datetimes in UTC.
+"""
+
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+MICROS_PER_SECOND = 1_000_000
+
+
+def now_micros() -> int:
+    return time.time_ns() // 1000
+
+
+def to_micros(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.astimezone()
+    return (value - EPOCH) // MICROSECOND
+
+
+def from_micros(value: Optional[int]) -> Optional[datetime]:
+    if value is None:
+        return None
+    return EPOCH + value * MICROSECOND
+
+
+def parse_micros(value: str) -> int:
+    """
+    Convert an ISO date(time) as given in a query, UTC unless it says
+    otherwise.
+    """
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return to_micros(parsed)
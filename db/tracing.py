@@ -0,0 +1,86 @@
+"""
+SQLite connection and cursor types that time every statement.
+"""
+
+import functools
+import sqlite3
+import time
+
+from .metrics import sql_latency, sql_rows
+from .slowlog import SLOW_QUERY_LOG, fingerprint, fingerprint_id
+
+
+@functools.lru_cache(maxsize=1024)
+def statement_label(sql: str) -> str:
+    """
+    Metric label for sql: the id of its fingerprint, as logged by the slow-query
+    log, so statements that only differ in their constants share a series.
+    """
+    return fingerprint_id(fingerprint(sql))
+
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    Cursor recording the execution time of each statement, and the rows it
+    modified or that were fetched from it with fetchone, fetchmany or fetchall.
+    Rows read by iterating over the cursor aren't counted, so iteration stays
+    in C. For queries the time covers preparing the statement and producing
+    the first row only. Slow statements are passed on to the slow-query log.
+    """
+
+    _statement = None
+
+    def _timed(self, method, sql, parameters, many=False):
+        self._statement = statement_label(sql)
+        start = time.perf_counter()
+        try:
+            return method(sql, parameters)
+        finally:
+            seconds = time.perf_counter() - start
+            sql_latency.observe(seconds, self._statement)
+            if self.rowcount > 0:
+                sql_rows.inc(self.rowcount, self._statement)
+            SLOW_QUERY_LOG.check(self.connection, sql, parameters, seconds, many)
+
+    def execute(self, sql, parameters=()):
+        return self._timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        # Materialize generators, so the slow-query log can still look at them
+        seq_of_parameters = list(seq_of_parameters)
+        return self._timed(super().executemany, sql, seq_of_parameters, many=True)
+
+    def _count(self, n: int) -> None:
+        if n and self._statement is not None:
+            sql_rows.inc(n, self._statement)
+
+    def fetchone(self):
+        row = super().fetchone()
+        self._count(row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._count(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self._count(len(rows))
+        return rows
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """
+    Connection whose cursors, including those created implicitly by the execute
+    shortcuts, are TimedCursors.
+    """
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
@@ -24,3 +24,6 @@ echo "New SQLite3 database '$DB_NAME' created."
 # Read the DDL file and execute the SQL statements
 sqlite3 "$DB_NAME" <"$DDL_FILE"
 echo "DDL script executed successfully."
+
+# Bring the new database up to the latest schema version
+PYTHONPATH="$SCRIPT_DIR/.." python -m db.migrate "$DB_NAME"
@@ -0,0 +1,44 @@
+import sqlite3
+
+import pytest
+
+from db import server
+from db.market_cache import clear_market_caches
+from db.migrate import create_schema
+from db.pool import close_pools
+from db.sequencer import close_sequencers
+
+
+@pytest.fixture
+def client(tmp_path):
+    """
+    Test client for the db/server.py app, backed by a fresh on-disk database
+    containing a single market.
+    """
+    path = tmp_path / "market.db"
+    conn = sqlite3.connect(path)
+    create_schema(conn)
+    conn.execute("INSERT INTO markets (name, creator_id, criteria) VALUES ('A', 1, '')")
+    conn.commit()
+    conn.close()
+
+    server.app.config["DATABASE"] = str(path)
+    server.app.config["EXPIRY_INTERVAL_SECONDS"] = None
+    server.app.config["JOURNAL_DIR"] = None
+    server.app.config["ARCHIVE_DIR"] = None
+    server.app.config["MATCHING_WORKERS"] = 0
+    server.engine.clear()
+    server.snapshots.clear()
+    server.leaderboards.clear()
+    with server.app.test_client() as client:
+        yield client
+    server.stop_workers()
+    server.engine.clear()
+    server.snapshots.clear()
+    server.leaderboards.clear()
+    close_sequencers()
+    close_pools()
+    clear_market_caches()
+    if server.journal is not None:
+        server.journal.close()
+        server.journal = server.expiry.journal = None
@@ -0,0 +1,96 @@
+import os
+import sqlite3
+
+from db import Database, server
+from db.archive import HISTORY_VIEW, archive_trades, attach_archives, maintain
+from db.migrate import create_schema
+from db.positions import rebuild_positions
+from db.timestamps import parse_micros
+
+
+def test_archive_trades(tmp_path):
+    conn = sqlite3.connect(tmp_path / "market.db")
+    create_schema(conn)
+    with Database(conn) as d:
+        resolved = d.create_market("A", 1, "")
+        open_market = d.create_market("B", 1, "")
+        for market_id, timestamp in [
+            (resolved, "2023-06-01 12:00:00"),
+            (resolved, "2024-01-01 12:00:00"),
+            (resolved, "2024-02-01 12:00:00"),
+            (open_market, "2023-06-01 12:00:00"),
+        ]:
+            trade_id = d.create_trade(market_id, 1, 2, 50, 10)
+            d.cursor.execute(
+                "UPDATE trades SET timestamp = ? WHERE id = ?",
+                (parse_micros(timestamp), trade_id),
+            )
+    conn.executemany(
+        "INSERT INTO trades (market_id, buyer_id, seller_id, price_cents, quantity, "
+        "timestamp) VALUES (1, 3, 3, 50, 1, ?)",
+        [(parse_micros("2024-03-01"),)] * 2000,
+    )
+    conn.execute("UPDATE markets SET resolved_at = 0 WHERE id = 1")
+    conn.commit()
+    rebuild_positions(conn)
+    positions = conn.execute("SELECT * FROM positions ORDER BY 1, 2").fetchall()
+
+    directory = tmp_path / "archive"
+    result = archive_trades(conn, str(directory))
+    assert result.trades_moved == 2003
+    assert sorted(os.listdir(directory)) == ["trades-2023.db", "trades-2024.db"]
+    assert conn.execute("SELECT market_id FROM trades").fetchall() == [(2,)]
+    # Archiving again has nothing left to move
+    assert archive_trades(conn, str(directory)).trades_moved == 0
+
+    assert attach_archives(conn, str(directory)) == ["archive_2023", "archive_2024"]
+    rows = conn.execute(f"SELECT id FROM {HISTORY_VIEW} ORDER BY id LIMIT 4")
+    assert rows.fetchall() == [(1,), (2,), (3,), (4,)]
+    trades = Database(conn).iter_trades(resolved, "2024-01-15", history=True)
+    assert [t.id for t in trades][:1] == [3]
+    assert attach_archives(conn, str(directory), start="2024-01-01") == ["archive_2024"]
+
+    # The ledger can still be rebuilt from the history
+    attach_archives(conn, str(directory))
+    rebuild_positions(conn, HISTORY_VIEW)
+    assert conn.execute("SELECT * FROM positions ORDER BY 1, 2").fetchall() == (
+        positions
+    )
+
+    for schema in ["archive_2023", "archive_2024"]:
+        conn.execute(f"DETACH DATABASE {schema}")
+    maintenance = maintain(conn)
+    assert maintenance.bytes_reclaimed > 0
+
+
+def test_more_archives_than_attach_slots(client):
+    conn = sqlite3.connect(server.app.config["DATABASE"])
+    conn.executemany(
+        "INSERT INTO trades (market_id, buyer_id, seller_id, price_cents, quantity, "
+        "timestamp) VALUES (1, 1, 2, 50, 1, ?)",
+        [(parse_micros(f"2023-{month:02}-15"),) for month in range(1, 13)],
+    )
+    conn.execute("UPDATE markets SET resolved_at = 0 WHERE id = 1")
+    conn.commit()
+    rebuild_positions(conn)
+    positions = conn.execute("SELECT * FROM positions").fetchall()
+    directory = os.path.join(os.path.dirname(server.app.config["DATABASE"]), "archive")
+    assert len(archive_trades(conn, directory, "month").files) == 12
+
+    schemas = attach_archives(conn, directory)
+    assert 0 < len(schemas) < 12
+    rows = conn.execute(f"SELECT id FROM {HISTORY_VIEW} ORDER BY id").fetchall()
+    assert rows == [(i,) for i in range(1, 13)]
+    rebuild_positions(conn, HISTORY_VIEW)
+    assert conn.execute("SELECT * FROM positions").fetchall() == positions
+    # Archives left out of the range give their slots back
+    assert attach_archives(conn, directory, "2023-03-01", "2023-04-30") == [
+        "archive_2023_03",
+        "archive_2023_04",
+    ]
+    conn.close()
+
+    server.app.config["ARCHIVE_DIR"] = directory
+    res = client.get("/export/trades?format=ndjson")
+    assert res.status_code == 200
+    assert len(res.get_data(as_text=True).splitlines()) == 12
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+from db import Database
+from db.candles import backfill_candles, iter_candles
+from tests.test_db import memory_conn
+from tests.test_server import place
+
+
+def test_iter_candles():
+    trades = [
+        (1, 0, 50, 1),
+        (1, 30, 60, 2),
+        (1, 59, 40, 1),
+        (1, 60, 45, 5),
+        (2, 0, 10, 1),
+    ]
+    minutes = [c for c in iter_candles(iter(trades)) if c[1] == 60]
+    assert minutes == [
+        (1, 60, 0, 50, 60, 40, 40, 4, 3),
+        (1, 60, 60, 45, 45, 45, 45, 5, 1),
+        (2, 60, 0, 10, 10, 10, 10, 1, 1),
+    ]
+    days = [c for c in iter_candles(iter(trades)) if c[1] == 86400]
+    assert days == [
+        (1, 86400, 0, 50, 60, 40, 45, 9, 4),
+        (2, 86400, 0, 10, 10, 10, 10, 1, 1),
+    ]
+
+
+def test_backfill_matches_incremental():
+    conn = memory_conn()
+    with Database(conn) as d:
+        d.create_market(name="A", creator_id=1, criteria="")
+        for price_cents, quantity in ((50, 1), (70, 2), (30, 3), (60, 1)):
+            d.create_trade(
+                market_id=1,
+                buyer_id=1,
+                seller_id=2,
+                price_cents=price_cents,
+                quantity=quantity,
+            )
+
+    query = "SELECT * FROM candles ORDER BY interval_seconds, bucket_start"
+    incremental = conn.execute(query).fetchall()
+    assert backfill_candles(conn) == len(incremental)
+    assert conn.execute(query).fetchall() == incremental
+
+
+def test_candles_endpoint(client):
+    place(client, 1, order_direction="sell", price="0.50", quantity=5)
+    place(client, 2, order_direction="buy", price="0.50", quantity=3)
+    place(client, 2, order_direction="buy", price="0.50", quantity=1)
+
+    res = client.get("/candles?market_id=1&interval=1h").get_json()
+    assert [
+        (c["open_cents"], c["close_cents"], c["volume"], c["trades"])
+        for c in res["candles"]
+    ] == [(50, 50, 4, 2)]
+
+    tomorrow = (datetime.utcnow() + timedelta(days=1)).date().isoformat()
+    res = client.get(f"/candles?market_id=1&interval=1d&from={tomorrow}")
+    assert res.get_json()["candles"] == []
+    assert client.get("/candles?market_id=1&interval=2m").status_code == 400
+    assert client.get("/candles?market_id=9").status_code == 404
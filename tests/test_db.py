@@ -1,6 +1,13 @@
 import sqlite3
+from datetime import timezone
+
+import pytest
 
 from db import Database
+from db.migrate import create_schema
+from db.objects import Position
+from db.positions import rebuild_positions
+from db.timestamps import now_micros, to_micros
 
 
 def memory_conn() -> sqlite3.Connection:
@@ -8,8 +15,7 @@ def memory_conn() -> sqlite3.Connection:
     Return a connection to an in-memory database with the schema loaded.
     """
     conn = sqlite3.connect(":memory:")
-    with open("db/ddl.sql") as f:
-        conn.executescript(f.read())
+    create_schema(conn)
     return conn
 
 
@@ -24,7 +30,7 @@ def test_cascade():
             order_direction="buy",
             price_cents=1,
             quantity=1,
-            expires_at=1.0,
+            expires_at=1_000_000,
         )
         d.create_trade(market_id=1, buyer_id=1, seller_id=1, price_cents=1, quantity=1)
         d.create_trade(market_id=2, buyer_id=1, seller_id=1, price_cents=1, quantity=1)
@@ -54,3 +60,57 @@ def test_rollback():
 
     with Database(conn) as d:
         assert len(d.get_markets()) == 1
+
+
+def test_positions():
+    conn = memory_conn()
+    with Database(conn) as d:
+        d.create_market(name="A", creator_id=1, criteria="")
+        d.create_trade(market_id=1, buyer_id=1, seller_id=2, price_cents=40, quantity=3)
+        trade_id = d.create_trade(
+            market_id=1, buyer_id=2, seller_id=1, price_cents=50, quantity=1
+        )
+        assert d.get_position(user_id=1, market_id=1) == Position(1, 1, 2, -70)
+        assert d.get_position(user_id=2, market_id=1) == Position(2, 1, -2, 70)
+
+        d.delete_trade(trade_id)
+        assert d.get_position(user_id=1, market_id=1) == Position(1, 1, 3, -120)
+
+    conn.execute("UPDATE positions SET quantity = 0, cash_cents = 0")
+    assert rebuild_positions(conn) == 2
+    with Database(conn) as d:
+        assert d.get_position(user_id=1, market_id=1) == Position(1, 1, 3, -120)
+        assert d.get_position(user_id=2, market_id=1) == Position(2, 1, -3, 120)
+
+
+def test_timestamps():
+    conn = memory_conn()
+    before = now_micros()
+    with Database(conn) as d:
+        d.create_market(name="A", creator_id=1, criteria="")
+        d.create_order(1, 1, "limit", "buy", 50, 1, expires_at=before + 1_000_000)
+        d.create_trade(market_id=1, buyer_id=1, seller_id=2, price_cents=1, quantity=1)
+        (market,) = d.get_markets()
+        (order,) = d.get_orders()
+        (trade,) = d.get_trades()
+
+    # Defaults are filled in by SQLite to the millisecond
+    for value in (market.created_at, order.created_at, trade.timestamp):
+        assert isinstance(value, int)
+        assert before - 1000 <= value <= now_micros()
+    assert market.resolved_datetime is None
+    assert market.created_datetime.tzinfo == timezone.utc
+    assert (order.expires_datetime - order.created_datetime).total_seconds() > 0.9
+    assert to_micros(trade.timestamp_datetime) == trade.timestamp
+
+
+def test_rows_are_immutable():
+    with Database(memory_conn()) as d:
+        d.create_market(name="A", creator_id=1, criteria="")
+        market = d.get_market_by_id(1)
+        assert (market.id, market.name) == (1, "A")
+        assert d.get_markets() == [market]
+        assert d.get_market_by_id(2) is None
+    with pytest.raises(AttributeError):
+        market.name = "B"
+    assert not hasattr(market, "__dict__")
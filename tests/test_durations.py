@@ -0,0 +1,49 @@
+from datetime import datetime
+
+import pytest
+
+from db.durations import add_months, parse_duration
+
+NOW = datetime(2024, 1, 31, 12, 0, 0)
+
+
+@pytest.mark.parametrize(
+    "duration,expected",
+    [
+        ("+3m", datetime(2024, 1, 31, 12, 3, 0)),
+        ("+1h3m", datetime(2024, 1, 31, 13, 3, 0)),
+        ("+1y3m", datetime(2025, 4, 30, 12, 0, 0)),
+        ("+1mo", datetime(2024, 2, 29, 12, 0, 0)),
+        ("+3m2d", datetime(2024, 5, 2, 12, 0, 0)),
+        ("+2w", datetime(2024, 2, 14, 12, 0, 0)),
+        ("+1y3m3w9d3h45m3s", datetime(2025, 5, 30, 15, 45, 3)),
+        ("2023-04-03", datetime(2023, 4, 3, 23, 59, 59)),
+        ("2023-04-03 12:30", datetime(2023, 4, 3, 12, 30, 0)),
+        ("2023-04-03T12:30:15", datetime(2023, 4, 3, 12, 30, 15)),
+    ],
+)
+def test_parse_duration(duration, expected):
+    assert parse_duration(duration, now=NOW) == expected
+
+
+@pytest.mark.parametrize(
+    "duration",
+    [
+        "+",
+        "+1x",
+        "+1d1y",
+        "+1d1d",
+        "+1h3m3m",
+        "+1000000000d",
+        "+9000y",
+        "+99999999999999999999s",
+    ],
+)
+def test_invalid_relative(duration):
+    with pytest.raises(ValueError):
+        parse_duration(duration, now=NOW)
+
+
+def test_add_months():
+    assert add_months(datetime(2024, 12, 15), 1) == datetime(2025, 1, 15)
+    assert add_months(datetime(2024, 3, 31), -1) == datetime(2024, 2, 29)
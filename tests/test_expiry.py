@@ -0,0 +1,39 @@
+from db.expiry import ExpiryScheduler
+from db.matching import MatchingEngine
+from db.sequencer import run_transaction
+from db.timestamps import MICROS_PER_SECOND, parse_micros
+from tests.test_db import memory_conn
+
+
+def test_sweep():
+    now = parse_micros("2024-01-01")
+    hour = 3600 * MICROS_PER_SECOND
+    conn = memory_conn()
+    conn.execute("INSERT INTO markets (name, creator_id, criteria) VALUES ('A', 1, '')")
+    conn.execute("INSERT INTO markets (name, creator_id, criteria) VALUES ('B', 1, '')")
+    for market_id in (1, 2):
+        for expires_at in (now - hour, now + hour, None):
+            conn.execute(
+                "INSERT INTO orders (market_id, creator_id, order_type, "
+                "order_direction, price_cents, quantity, expires_at) "
+                "VALUES (?, 1, 'limit', 'buy', 50, 1, ?)",
+                (market_id, expires_at),
+            )
+    conn.commit()
+
+    engine = MatchingEngine()
+    book = engine.get_book(conn.cursor(), 1)
+    changes = []
+    scheduler = ExpiryScheduler(
+        engine, batch_size=1, on_expired=lambda b, expired: changes.append(expired)
+    )
+
+    result = run_transaction(conn, lambda tx: scheduler.sweep(tx, now=now))
+    assert (result.in_memory, result.on_disk) == (1, 1)
+    assert [[o.id for o in expired] for expired in changes] == [[1]]
+    assert len(book) == 2
+    assert conn.execute("SELECT COUNT(*) FROM orders").fetchone() == (4,)
+
+    result = run_transaction(conn, lambda tx: scheduler.sweep(tx, now=now))
+    assert result.total == 0
+    assert (scheduler.sweeps, scheduler.expired_total) == (2, 2)
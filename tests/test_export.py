@@ -0,0 +1,76 @@
+import csv
+import io
+import json
+
+import numpy as np
+
+from db import Database
+from db.export import export
+from db.objects import Trade
+from db.timestamps import parse_micros
+from tests.test_db import memory_conn
+from tests.test_server import place
+
+
+def test_iter_trades():
+    conn = memory_conn()
+    with Database(conn) as d:
+        d.create_market(name="A", creator_id=1, criteria="")
+        d.create_market(name="B", creator_id=1, criteria="")
+        for i in range(7):
+            d.create_trade(
+                market_id=1 + i % 2, buyer_id=1, seller_id=2, price_cents=i, quantity=1
+            )
+        conn.execute(
+            "UPDATE trades SET timestamp = CASE WHEN id > 4 THEN ? ELSE ? END",
+            (parse_micros("2024-01-02"), parse_micros("2024-01-01 12:00:00")),
+        )
+        trades = d.get_trades()
+
+    d = Database(conn)
+    assert list(d.iter_trades(batch_size=2)) == trades
+    assert [t.id for t in d.iter_trades(market_id=2, batch_size=2)] == [2, 4, 6]
+    assert [t.id for t in d.iter_trades(start="2024-01-02", batch_size=2)] == [5, 6, 7]
+    assert [t.id for t in d.iter_trades(end="2024-01-02T00:00:00")] == [1, 2, 3, 4]
+
+    chunks = list(export(d, "trades", "csv", market_id=1, batch_size=2))
+    # A header, then one chunk per batch
+    assert len(chunks) == 3
+    rows = list(csv.DictReader(io.StringIO("".join(chunks))))
+    assert [row["price_cents"] for row in rows] == ["0", "2", "4", "6"]
+
+
+def test_export_endpoint(client):
+    place(client, 1, order_direction="sell", price="0.50", quantity=5)
+    place(client, 2, order_direction="buy", price="0.50", quantity=3)
+
+    res = client.get("/export/trades?format=ndjson&market_id=1")
+    assert res.mimetype == "application/x-ndjson"
+    rows = [json.loads(line) for line in res.get_data(as_text=True).splitlines()]
+    assert [(r["buyer_id"], r["seller_id"], r["quantity"]) for r in rows] == [(2, 1, 3)]
+
+    res = client.get("/export/orders")
+    assert res.get_data(as_text=True).splitlines()[0].startswith("id,market_id")
+    assert client.get("/export/users").status_code == 400
+    assert client.get("/export/trades?from=garbage").status_code == 400
+    assert client.get("/export/trades?from=2024-01-01&to=x").status_code == 400
+
+
+def test_iter_columns():
+    conn = memory_conn()
+    with Database(conn) as d:
+        d.create_market(name="A", creator_id=1, criteria="")
+        for i in range(5):
+            d.create_trade(1, buyer_id=1, seller_id=2, price_cents=10 * i, quantity=i)
+        d.create_order(1, 1, "limit", "buy", 50, 1, expires_at=None)
+
+    d = Database(conn)
+    batches = list(d.iter_columns("trades", market_id=1, batch_size=2))
+    assert [len(batch["id"]) for batch in batches] == [2, 2, 1]
+    assert batches[0]["price_cents"].dtype == np.int64
+    assert batches[1]["price_cents"].tolist() == [20, 30]
+    assert list(batches[0]) == list(Trade._fields)
+
+    (orders,) = d.iter_columns("orders")
+    assert orders["order_type"].tolist() == ["limit"]
+    assert orders["expires_at"].tolist() == [None]
@@ -0,0 +1,28 @@
+from db.feed import MarketFeed
+
+
+def test_coalescing():
+    feed = MarketFeed()
+    subscriber = feed.subscribe(1)
+    feed.publish_level(1, "buy", 50, 5)
+    feed.publish(1, "trade", {"price_cents": 50, "quantity": 1})
+    feed.publish_level(1, "buy", 50, 4)
+    feed.publish_level(2, "buy", 50, 1)  # other market
+
+    assert subscriber.drain(timeout=0) == [
+        ("trade", {"price_cents": 50, "quantity": 1}),
+        ("depth", {"side": "buy", "price_cents": 50, "total_quantity": 4}),
+    ]
+    assert subscriber.drain(timeout=0) == []
+
+
+def test_overflow():
+    feed = MarketFeed()
+    subscriber = feed.subscribe(1, max_pending=2)
+    for i in range(3):
+        feed.publish(1, "trade", {"quantity": i})
+    assert subscriber.drain(timeout=0) == [("resync", {})]
+
+    feed.unsubscribe(1, subscriber)
+    feed.publish(1, "trade", {"quantity": 3})
+    assert subscriber.drain(timeout=0) == []
@@ -0,0 +1,107 @@
+import os
+import threading
+
+from db import server
+from db.journal import (
+    FILL,
+    build_books,
+    cancel_event,
+    encode,
+    fill_event,
+    read_segment,
+    replay,
+    write_snapshot,
+)
+from db.matching import Fill
+from tests.test_server import place
+
+
+def test_replay(tmp_path):
+    directory = str(tmp_path)
+    # order_id -> [user_id, direction, price_cents, quantity, expires_at]
+    markets = {1: {1: [1, 1, 40, 5, -1], 2: [2, -1, 60, 5, -1]}}
+    write_snapshot(os.path.join(directory, f"snapshot-{2:020d}.bin"), 2, markets)
+
+    with open(os.path.join(directory, f"journal-{3:020d}.log"), "wb") as f:
+        f.write(encode(3, fill_event(1, Fill(2, 2, 60, 2, 3))))
+        f.write(encode(4, cancel_event(1, 1)))
+        # Torn write
+        f.write(encode(5, cancel_event(1, 2))[:-3])
+
+    result = replay(directory)
+    assert (result.seq, result.snapshot_orders, result.events) == (4, 2, 2)
+    books = build_books(result.markets)
+    assert books[1].depth("sell") == [(60, 3)]
+    assert books[1].depth("buy") == []
+
+    records, length = read_segment(os.path.join(directory, f"journal-{3:020d}.log"))
+    assert [r[0] for r in records] == [3, 4]
+    assert records[0][1] == FILL
+
+    # Expired orders are left out of the books
+    markets[1][1][4] = 0
+    assert build_books(markets, now=1)[1].depth("buy") == []
+
+
+def restart(client):
+    """
+    Forget the books and the journal, as if the server had been restarted.
+    """
+    server.journal.close()
+    server.journal = server.expiry.journal = None
+    server.engine.clear()
+    client.get("/clob?market_id=1")
+    return server.journal.last_replay
+
+
+def test_server_journal(client, tmp_path):
+    server.app.config["JOURNAL_DIR"] = str(tmp_path / "journal")
+    place(client, 1, order_direction="sell", price="0.50", quantity=5)
+    place(client, 1, order_direction="sell", price="0.55", quantity=5)
+    place(client, 2, order_direction="buy", price="0.40", quantity=2)
+    place(client, 2, order_direction="buy", price="0.50", quantity=3)
+    expected = client.get("/clob?market_id=1").get_json()
+
+    result = restart(client)
+    # The journal was started against an empty book, then has every event since
+    assert (result.snapshot_orders, result.events) == (0, 4)
+    assert client.get("/clob?market_id=1").get_json() == expected
+
+    # A journal that doesn't match the database is rebuilt from it
+    for name in os.listdir(server.app.config["JOURNAL_DIR"]):
+        if name.startswith("journal-"):
+            os.remove(os.path.join(server.app.config["JOURNAL_DIR"], name))
+    result = restart(client)
+    assert (result.snapshot_orders, result.events) == (3, 0)
+    assert client.get("/clob?market_id=1").get_json() == expected
+
+    place(client, 2, order_direction="buy", price="0.55", quantity=2)
+    expected = client.get("/clob?market_id=1").get_json()
+    result = restart(client)
+    assert (result.snapshot_orders, result.events) == (3, 1)
+    assert client.get("/clob?market_id=1").get_json() == expected
+
+
+def test_server_journal_opened_once(client, tmp_path, monkeypatch):
+    server.app.config["JOURNAL_DIR"] = str(tmp_path / "journal")
+    opened = []
+
+    class CountingJournal(server.Journal):
+        def __init__(self, *args):
+            super().__init__(*args)
+            opened.append(self)
+
+    monkeypatch.setattr(server, "Journal", CountingJournal)
+    barrier = threading.Barrier(8)
+
+    def first_request():
+        barrier.wait()
+        with server.app.test_client() as c:
+            assert c.get("/clob?market_id=1").status_code == 200
+
+    threads = [threading.Thread(target=first_request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert opened == [server.journal]
@@ -0,0 +1,113 @@
+from db import Database
+from db.market_cache import MarketCache
+from tests.test_db import memory_conn
+
+
+def test_read_through_and_eviction():
+    conn = memory_conn()
+    with Database(conn) as d:
+        for name in ["A", "B", "B"]:
+            d.create_market(name, 1, "")
+
+    cache = MarketCache(max_markets=2)
+    assert cache.get(conn, 1).name == "A"
+    assert cache.get(conn, 1).name == "A"
+    assert cache.get_by_name(conn, "B").id == 2  # the oldest of that name
+    assert cache.get_by_name(conn, "B").id == 2
+    assert cache.get(conn, 4) is None  # missing markets aren't cached
+    assert (cache.hits, cache.misses) == (2, 3)
+
+    cache.get(conn, 3)  # evicts market 1
+    cache.get(conn, 1)
+    assert (cache.hits, cache.misses) == (2, 5)
+
+    cache = MarketCache(max_age_seconds=0)
+    cache.get(conn, 1)
+    cache.get(conn, 1)
+    assert cache.hits == 0
+
+
+def test_database_invalidates():
+    conn = memory_conn()
+    cache = MarketCache()
+    with Database(conn, cache) as d:
+        d.create_market("A", 1, "")
+        d.create_market("B", 1, "")
+    with Database(conn, cache) as d:
+        assert d.get_market_by_id(1).name == "A"
+        assert d.get_market_by_id(2).name == "B"
+        d.update_market(1, "C", "")
+        d.delete_market(2)
+        assert d.get_market_by_id(1).name == "C"
+        assert d.get_market_by_id(2) is None
+    assert cache.get_by_name(conn, "A") is None
+    assert cache.get_by_name(conn, "C").id == 1
+
+    # A row read before a rolled back write isn't left behind
+    try:
+        with Database(conn, cache) as d:
+            d.update_market(1, "D", "")
+            assert d.get_market_by_id(1).name == "D"
+            raise ValueError
+    except ValueError:
+        pass
+    assert cache.get(conn, 1).name == "C"
+
+
+def test_name_lookup_is_stable():
+    conn = memory_conn()
+    with Database(conn) as d:
+        for name in ["A", "B", "B"]:
+            d.create_market(name, 1, "")
+
+    cache = MarketCache()
+    cache.get(conn, 3)
+    assert cache.get_by_name(conn, "B").id == 2
+    cache.get(conn, 3)
+    assert cache.get_by_name(conn, "B").id == 2
+
+
+class RacingConnection:
+    """
+    Connection whose reads return the row as it was, while a write commits and
+    invalidates it before the read finishes.
+    """
+
+    def __init__(self, conn, cache, market_id):
+        self.conn = conn
+        self.cache = cache
+        self.market_id = market_id
+
+    def execute(self, sql, params):
+        cursor = self.conn.execute(sql, params)
+        row = cursor.fetchone()
+        self.conn.execute(
+            "UPDATE markets SET resolved_at = 1 WHERE id = ?", (self.market_id,)
+        )
+        self.cache.invalidate(self.market_id)
+        return RacingCursor(row)
+
+
+class RacingCursor:
+    def __init__(self, row):
+        self.row = row
+
+    def fetchone(self):
+        return self.row
+
+
+def test_read_racing_invalidation():
+    conn = memory_conn()
+    with Database(conn) as d:
+        d.create_market("A", 1, "")
+
+    cache = MarketCache()
+    stale = cache.get(RacingConnection(conn, cache, 1), 1)
+    assert stale.resolved_at is None
+    # The stale row wasn't stored
+    assert cache.get(conn, 1).resolved_at == 1
+
+    cache.clear()
+    conn.execute("UPDATE markets SET resolved_at = NULL")
+    assert cache.get_by_name(RacingConnection(conn, cache, 1), "A") is not None
+    assert cache.get_by_name(conn, "A").resolved_at == 1
@@ -0,0 +1,82 @@
+from db.matching import OrderBook, RestingOrder
+from db.timestamps import MICROS_PER_SECOND, parse_micros
+
+HOUR = 3600 * MICROS_PER_SECOND
+
+
+def resting(order_id, direction, price_cents, quantity, user_id=1, expires_at=None):
+    return RestingOrder(
+        id=order_id,
+        user_id=user_id,
+        order_direction=direction,
+        price_cents=price_cents,
+        quantity=quantity,
+        expires_at=expires_at,
+    )
+
+
+def test_best_prices():
+    book = OrderBook(market_id=1)
+    assert book.best_bid() is None and book.best_ask() is None
+
+    book.add(resting(1, "buy", 40, 1))
+    book.add(resting(2, "buy", 45, 1))
+    book.add(resting(3, "sell", 60, 1))
+    book.add(resting(4, "sell", 55, 1))
+    assert book.best_bid() == 45
+    assert book.best_ask() == 55
+
+    book.cancel(2)
+    book.cancel(4)
+    assert book.best_bid() == 40
+    assert book.best_ask() == 60
+
+
+def test_price_time_priority():
+    book = OrderBook(market_id=1)
+    book.add(resting(1, "sell", 50, 5, user_id=1))
+    book.add(resting(2, "sell", 50, 5, user_id=2))
+    book.add(resting(3, "sell", 49, 2, user_id=3))
+    book.add(resting(4, "sell", 70, 5, user_id=4))
+
+    fills, expired = book.match("buy", 60, 10)
+    assert [(f.order_id, f.price_cents, f.quantity) for f in fills] == [
+        (3, 49, 2),
+        (1, 50, 5),
+        (2, 50, 3),
+    ]
+    assert fills[-1].remaining == 2
+    assert expired == []
+    assert book.depth("sell") == [(50, 2), (70, 5)]
+
+
+def test_match_skips_expired():
+    now = parse_micros("2024-01-01")
+    book = OrderBook(market_id=1)
+    book.add(resting(1, "buy", 50, 5, expires_at=now - MICROS_PER_SECOND))
+    book.add(resting(2, "buy", 50, 5, expires_at=now + 24 * HOUR))
+
+    fills, expired = book.match("sell", 50, 3, now=now)
+    assert [f.order_id for f in fills] == [2]
+    assert [o.id for o in expired] == [1]
+    assert 1 not in book
+
+
+def test_version_and_expiry():
+    now = parse_micros("2024-01-01")
+    book = OrderBook(market_id=1)
+    book.add(resting(1, "buy", 50, 5, expires_at=now + HOUR))
+    book.add(resting(2, "buy", 50, 5, expires_at=now + 2 * HOUR))
+    book.add(resting(3, "buy", 50, 5))
+    version = book.version
+
+    assert book.match("sell", 60, 1) == ([], [])
+    assert book.version == version
+
+    book.cancel(1)
+    assert book.version == version + 1
+    assert book.next_expiry() == now + 2 * HOUR
+    assert book.expire(now + HOUR) == []
+    assert [o.id for o in book.expire(now + 3 * HOUR)] == [2]
+    assert book.next_expiry() is None
+    assert book.version == version + 2
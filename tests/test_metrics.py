@@ -0,0 +1,48 @@
+import sqlite3
+
+from db.metrics import Registry, sql_latency
+from db.positions import UPSERT_POSITION_SQL
+from db.tracing import InstrumentedConnection, statement_label
+from tests.test_server import place
+
+
+def test_render():
+    registry = Registry()
+    counter = registry.counter("things_total", "Things", ("kind",))
+    summary = registry.summary("latency_seconds", "Latency")
+    registry.gauge("level", "Level", lambda: 3)
+    counter.inc(2, 'a"b')
+    for i in range(1, 101):
+        summary.observe(i)
+
+    assert summary.quantile(0.5) == 51
+    assert summary.quantile(0.99) == 100
+    text = registry.render()
+    assert 'things_total{kind="a\\"b"} 2' in text
+    assert 'latency_seconds{quantile="0.5"} 51' in text
+    assert "latency_seconds_count 100" in text
+    assert "level 3" in text
+
+
+def test_sql_timing():
+    conn = sqlite3.connect(":memory:", factory=InstrumentedConnection)
+    sql = "SELECT 1   UNION ALL SELECT 2"
+    before = sql_latency.count(statement_label(sql))
+    assert conn.execute(sql).fetchall() == [(1,), (2,)]
+    # Statements that only differ in their constants share a label
+    assert list(conn.execute("SELECT 3 UNION ALL SELECT 4")) == [(3,), (4,)]
+    assert sql_latency.count(statement_label(sql)) == before + 2
+
+
+def test_metrics_endpoint(client):
+    place(client, 1, order_direction="sell", price="0.50", quantity=5)
+    place(client, 2, order_direction="buy", price="0.50", quantity=2)
+
+    text = client.get("/metrics").get_data(as_text=True)
+    assert (
+        'http_request_duration_seconds_count{app="db.server",endpoint="order",status="200"}'
+        in text
+    )
+    assert "matching_fills_per_order_count" in text
+    label = statement_label(UPSERT_POSITION_SQL)
+    assert f'sqlite_statement_rows_total{{statement="{label}"}}' in text
@@ -0,0 +1,97 @@
+import sqlite3
+
+from db.expiry import EXPIRE_ON_DISK_SQL
+from db.journal import READ_ORDERS_SQL
+from db.matching import LOAD_BOOK_SQL
+from db.migrate import DDL_FILE, create_schema, get_migrations, get_version, migrate
+from db.pnl import load_positions
+
+
+def query_plan(conn: sqlite3.Connection, sql: str, params=()) -> str:
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    return "\n".join(row[-1] for row in rows)
+
+
+def test_migrate_existing_db():
+    conn = sqlite3.connect(":memory:")
+    with open(DDL_FILE) as f:
+        conn.executescript(f.read())
+    assert get_version(conn) == 0
+
+    latest = get_migrations()[-1][0]
+    assert migrate(conn) == latest
+    assert get_version(conn) == latest
+    # Running again is a no-op
+    assert migrate(conn) == latest
+
+
+def test_order_queries_use_indexes():
+    conn = sqlite3.connect(":memory:")
+    create_schema(conn)
+
+    plan = query_plan(conn, LOAD_BOOK_SQL, (1,))
+    assert "USING INDEX orders_book_idx (market_id=?)" in plan
+
+    plan = query_plan(conn, EXPIRE_ON_DISK_SQL, (0, "[]", 10))
+    assert "USING INDEX orders_expiry_idx (expires_at<?)" in plan
+    assert "SCAN orders" not in plan
+
+    # Sorted by market through the index, only within a market by time
+    plan = query_plan(conn, READ_ORDERS_SQL)
+    assert "SCAN orders USING INDEX orders_book_idx" in plan
+    assert "TEMP B-TREE FOR RIGHT PART OF ORDER BY" in plan
+
+
+def test_pnl_uses_indexes():
+    conn = sqlite3.connect(":memory:")
+    create_schema(conn)
+    statements = []
+    conn.set_trace_callback(statements.append)
+    load_positions(conn, user_id=1)
+    load_positions(conn, market_id=1)
+    load_positions(conn, user_id=1, market_id=1)
+    conn.set_trace_callback(None)
+
+    by_user, by_market, by_both = (query_plan(conn, sql) for sql in statements)
+    assert "SEARCH positions USING PRIMARY KEY (user_id=?)" in by_user
+    assert "USING INDEX positions_market_idx (market_id=?)" in by_market
+    assert "PRIMARY KEY (user_id=? AND market_id=?)" in by_both
+
+
+def test_integer_timestamps():
+    conn = sqlite3.connect(":memory:")
+    with open(DDL_FILE) as f:
+        conn.executescript(f.read())
+    conn.executescript(
+        """
+        INSERT INTO markets (name, creator_id, criteria) VALUES ('A', 1, '');
+        UPDATE markets SET created_at = '2024-01-01 12:00:00.250';
+        INSERT INTO orders (market_id, creator_id, order_type, order_direction,
+            price_cents, quantity, created_at, expires_at)
+        VALUES (1, 1, 'limit', 'buy', 50, 1, '2024-01-01 12:00:00', NULL),
+            (1, 1, 'limit', 'buy', 50, 1, '2024-01-01 12:00:00', 1704110400.5),
+            (1, 1, 'limit', 'buy', 50, 1, '2024-01-01 12:00:00', NULL);
+        DELETE FROM orders WHERE id = 3;
+        INSERT INTO trades (market_id, buyer_id, seller_id, price_cents, quantity)
+        VALUES (1, 1, 2, 50, 1);
+        """
+    )
+    conn.commit()
+
+    migrate(conn)
+    assert conn.execute("SELECT created_at FROM markets").fetchone() == (
+        1704110400250000,
+    )
+    assert conn.execute("SELECT created_at, expires_at FROM orders").fetchall() == [
+        (1704110400000000, None),
+        (1704110400000000, 1704110400500000),
+    ]
+    (timestamp,) = conn.execute("SELECT typeof(timestamp) FROM trades").fetchone()
+    assert timestamp == "integer"
+    # Ids of deleted orders aren't reused
+    conn.execute(
+        "INSERT INTO orders (market_id, creator_id, order_type, order_direction, "
+        "price_cents, quantity) VALUES (1, 1, 'limit', 'buy', 50, 1)"
+    )
+    assert conn.execute("SELECT MAX(id) FROM orders").fetchone() == (4,)
+    assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
@@ -0,0 +1,33 @@
+import numpy as np
+
+from db.pnl import PnlTable, compute_pnl, leaderboard
+
+
+def test_compute_pnl():
+    # user, market, quantity, cash
+    positions = np.array(
+        [
+            (2, 1, 4, -200),
+            (1, 1, -4, 200),
+            (2, 2, -1, 30),
+            (3, 3, 2, -20),  # no mark
+        ],
+        dtype=np.int64,
+    ).T
+    table = compute_pnl(positions, {1: 60, 2: 50.5})
+    assert table.user_ids.tolist() == [1, 2, 3]
+    assert table.realized_cents.tolist() == [200, -170, -20]
+    assert table.unrealized_cents.tolist() == [-240, 189.5, 0]
+
+    empty = compute_pnl(np.zeros((4, 0), dtype=np.int64), {})
+    assert len(empty) == 0
+
+
+def test_leaderboard():
+    table = PnlTable(
+        user_ids=np.array([1, 2, 3]),
+        realized_cents=np.array([0.0, 10.0, 5.0]),
+        unrealized_cents=np.array([5.0, 0.0, 0.0]),
+    )
+    assert [e["user_id"] for e in leaderboard(table, 3)] == [2, 1, 3]
+    assert [e["rank"] for e in leaderboard(table, 2)] == [1, 2]
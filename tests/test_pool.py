@@ -0,0 +1,30 @@
+from db.pool import ConnectionPool, get_pool
+
+
+def test_pragmas(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "test.db"), busy_timeout_ms=1234)
+    conn = pool.acquire()
+    assert conn.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+    assert conn.execute("PRAGMA synchronous").fetchone() == (1,)  # NORMAL
+    assert conn.execute("PRAGMA busy_timeout").fetchone() == (1234,)
+    assert conn.execute("PRAGMA foreign_keys").fetchone() == (1,)
+    pool.close()
+
+
+def test_reuse(tmp_path):
+    pool = get_pool(str(tmp_path / "test.db"))
+    assert get_pool(str(tmp_path / "test.db")) is pool
+
+    conn = pool.acquire()
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.execute("INSERT INTO t VALUES (1)")
+    assert conn.in_transaction
+    pool.release(conn)
+
+    # The open transaction was rolled back and the same connection is handed out
+    again = pool.acquire()
+    assert again is conn
+    assert not again.in_transaction
+    assert again.execute("SELECT COUNT(*) FROM t").fetchone() == (0,)
+    assert pool.acquire() is not conn
+    pool.close()
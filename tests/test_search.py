@@ -0,0 +1,42 @@
+import pytest
+
+from db import Database
+from db.search import build_query, search_markets
+from tests.test_db import memory_conn
+
+
+def test_build_query():
+    assert build_query("rain tomorrow") == '"rain" AND "tomorrow"'
+    assert build_query('elect* "new york"') == '"elect"* AND "new york"'
+    # FTS5 operators and punctuation are plain text
+    assert build_query("NOT a-b OR (c") == '"NOT" AND "a b" AND "OR" AND "c"'
+    with pytest.raises(ValueError):
+        build_query(' "" * ')
+
+
+def test_search_markets():
+    conn = memory_conn()
+    with Database(conn) as d:
+        d.create_market("Rain in London", 1, "Resolves yes if it rains tomorrow")
+        d.create_market("Election", 1, "Resolves yes if London elects a new mayor")
+        d.create_market("Snow", 1, "Resolves yes if it snows in New York")
+
+    def ids(q, **kwargs):
+        return [r["market_id"] for r in search_markets(conn, q, **kwargs)]
+
+    # Name matches rank above criteria matches
+    assert ids("london") == [1, 2]
+    assert ids("lond*") == [1, 2]
+    assert ids('"new york"') == [3]
+    assert ids('"york new"') == []
+    everything = ids("resolves yes")
+    assert sorted(everything) == [1, 2, 3]
+    assert ids("resolves yes", limit=2) + ids("resolves yes", offset=2) == everything
+
+    # The index follows updates and deletes
+    with Database(conn) as d:
+        d.update_market(1, "Rain in Paris", "Resolves yes if it rains tomorrow")
+        d.delete_market(2)
+    assert ids("london") == []
+    assert ids("paris") == [1]
+    assert "[rains]" in search_markets(conn, "rains")[0]["criteria_snippet"]
@@ -0,0 +1,134 @@
+import sqlite3
+import threading
+
+import pytest
+
+from db.migrate import create_schema
+from db.sequencer import WriteSequencer, group_size
+
+
+@pytest.fixture
+def sequencer(tmp_path):
+    path = str(tmp_path / "market.db")
+    conn = sqlite3.connect(path)
+    create_schema(conn)
+    conn.close()
+    sequencer = WriteSequencer(path)
+    yield sequencer
+    sequencer.stop()
+
+
+def insert_market(name):
+    def command(tx):
+        tx.conn.execute(
+            "INSERT INTO markets (name, creator_id, criteria) VALUES (?, 1, '')",
+            (name,),
+        )
+        if name == "X":
+            raise ValueError("rejected")
+        return name
+
+    return command
+
+
+def market_names(sequencer):
+    conn = sqlite3.connect(sequencer.path)
+    names = [row[0] for row in conn.execute("SELECT name FROM markets ORDER BY id")]
+    conn.close()
+    return names
+
+
+def test_submit(sequencer):
+    events = []
+
+    def command(tx):
+        tx.on_commit(lambda: events.append("commit"))
+        return insert_market("A")(tx)
+
+    assert sequencer.submit(command) == "A"
+    assert events == ["commit"]
+    assert market_names(sequencer) == ["A"]
+
+    with pytest.raises(ValueError):
+        sequencer.submit(insert_market("X"))
+    assert market_names(sequencer) == ["A"]
+
+
+def test_group_commit(sequencer):
+    # Hold up the writer so the following commands queue up behind it
+    started, release = threading.Event(), threading.Event()
+
+    def blocker(tx):
+        started.set()
+        release.wait()
+
+    count = group_size.count()
+    threads = [threading.Thread(target=sequencer.submit, args=(blocker,))]
+    threads[0].start()
+    started.wait()
+
+    results = {}
+
+    def submit(name):
+        try:
+            results[name] = sequencer.submit(insert_market(name))
+        except Exception as e:
+            results[name] = e
+
+    # X fails, without affecting the commands around it
+    for name in ("B", "C", "X", "D"):
+        threads.append(threading.Thread(target=submit, args=(name,)))
+        threads[-1].start()
+    while sequencer._queue.qsize() < 4:
+        pass
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    # One transaction for the blocker, one for everything queued behind it
+    assert group_size.count() == count + 2
+    assert sorted(market_names(sequencer)) == ["B", "C", "D"]
+    assert results["C"] == "C" and results["D"] == "D"
+    assert isinstance(results["X"], ValueError)
+
+
+def test_rollback_callbacks(sequencer):
+    events = []
+
+    def failing(tx):
+        tx.on_commit(lambda: events.append("commit"))
+        tx.on_rollback(lambda: events.append(market_names(sequencer)))
+        insert_market("X")(tx)
+
+    sequencer.submit(insert_market("A"))
+    with pytest.raises(ValueError):
+        sequencer.submit(failing)
+    # Rollback callbacks only run once the database holds committed state
+    assert events == [["A"]]
+
+
+def test_writer_crash(sequencer, tmp_path):
+    # The writer can't even open its connection
+    broken = WriteSequencer(str(tmp_path / "missing" / "market.db"))
+    with pytest.raises(sqlite3.OperationalError):
+        broken.submit(insert_market("A"))
+
+    def crash(conn, group):
+        raise RuntimeError("writer crashed")
+
+    sequencer._apply = crash
+    with pytest.raises(RuntimeError):
+        sequencer.submit(insert_market("A"))
+    del sequencer._apply
+    # The next command starts a new writer
+    assert sequencer.submit(insert_market("B")) == "B"
+    assert market_names(sequencer) == ["B"]
+
+
+def test_submit_timeout(tmp_path):
+    release = threading.Event()
+    sequencer = WriteSequencer(str(tmp_path / "market.db"), submit_timeout_seconds=0.1)
+    with pytest.raises(TimeoutError):
+        sequencer.submit(lambda tx: release.wait())
+    release.set()
+    sequencer.stop()
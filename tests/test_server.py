@@ -0,0 +1,340 @@
+import sqlite3
+import time
+
+from db import server
+
+
+def place(client, user_id, **order):
+    with client.session_transaction() as session:
+        session["user_id"] = user_id
+    return client.post("/order", json={"market_id": 1, "order_type": "limit", **order})
+
+
+def test_order_endpoint(client):
+    res = place(client, 1, order_direction="sell", price="0.50", quantity=5)
+    assert res.get_json() == {"message": "Order placed successfully"}
+    place(client, 2, order_direction="buy", price="0.60", quantity=3)
+
+    res = client.get("/clob?market_id=1")
+    assert res.get_json()["sell_orders"] == [{"price_cents": 50, "total_quantity": 2}]
+
+    conn = sqlite3.connect(server.app.config["DATABASE"])
+    trades = conn.execute(
+        "SELECT buyer_id, seller_id, price_cents, quantity FROM trades"
+    ).fetchall()
+    assert trades == [(2, 1, 50, 3)]
+
+    (order_id,) = conn.execute("SELECT id FROM orders").fetchone()
+    with client.session_transaction() as session:
+        session["user_id"] = 1
+    res = client.post("/cancel_order", json={"order_id": order_id})
+    assert res.status_code == 200
+    assert conn.execute("SELECT COUNT(*) FROM orders").fetchone() == (0,)
+    assert len(server.engine.get_book(conn.cursor(), 1)) == 0
+
+
+def test_pnl_endpoint(client):
+    place(client, 1, order_direction="sell", price="0.50", quantity=5)
+    place(client, 2, order_direction="buy", price="0.50", quantity=4)
+
+    res = client.get("/pnl?market=1")  # user 2 is still logged in
+    assert res.get_json() == {"pnl": "PNL for user me: $-2.00"}
+    res = client.get("/pnl?user=1")
+    assert res.get_json() == {"pnl": "PNL for user 1: $2.00"}
+    assert client.get("/pnl?user=3").status_code == 404
+
+
+def test_mark_to_market_pnl(client):
+    place(client, 1, order_direction="sell", price="0.50", quantity=5)
+    place(client, 2, order_direction="buy", price="0.50", quantity=4)
+    place(client, 3, order_direction="buy", price="0.30", quantity=1)
+
+    # User 2 paid $2.00 for 4 shares, last traded at $0.50 and now at a $0.40 mid
+    res = client.get("/pnl?user=2&mode=last").get_json()
+    assert res == {
+        "pnl": "PNL for user 2: $0.00",
+        "realized": "$-2.00",
+        "unrealized": "$2.00",
+    }
+    res = client.get("/pnl?user=2&mode=mid").get_json()
+    assert res["pnl"] == "PNL for user 2: $-0.40"
+    assert client.get("/pnl?mode=best").status_code == 400
+
+
+def test_leaderboard(client):
+    place(client, 1, order_direction="sell", price="0.50", quantity=5)
+    place(client, 2, order_direction="buy", price="0.50", quantity=4)
+
+    res = client.get("/leaderboard")
+    assert [e["user_id"] for e in res.get_json()["leaderboard"]] == [1, 2]
+    etag = res.headers["ETag"]
+    assert (
+        client.get("/leaderboard", headers={"If-None-Match": etag}).status_code == 304
+    )
+    client.get("/leaderboard")
+    assert server.leaderboards.hits == 1
+    assert client.get("/leaderboard?limit=0").status_code == 400
+
+    # Resolution changes the marks
+    client.post(
+        "/resolve_market",
+        json={"market_id": 1, "outcome": "yes", "payout_dollars": 1},
+    )
+    res = client.get("/leaderboard?limit=1", headers={"If-None-Match": etag})
+    assert res.get_json()["leaderboard"] == [
+        {
+            "rank": 1,
+            "user_id": 2,
+            "realized_cents": -200.0,
+            "unrealized_cents": 400.0,
+            "total_cents": 200.0,
+        }
+    ]
+
+
+def test_clob_etag(client):
+    place(client, 1, order_direction="sell", price="0.50", quantity=5)
+
+    res = client.get("/clob?market_id=1")
+    etag = res.headers["ETag"]
+    assert res.status_code == 200
+    res = client.get("/clob?market_id=1", headers={"If-None-Match": etag})
+    assert res.status_code == 304
+    assert server.snapshots.get(1, etag.strip('"')) is not None
+
+    place(client, 1, order_direction="sell", price="0.50", quantity=1)
+    res = client.get("/clob?market_id=1", headers={"If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.headers["ETag"] != etag
+    assert res.get_json()["sell_orders"] == [{"price_cents": 50, "total_quantity": 6}]
+
+
+def test_stream(client):
+    place(client, 1, order_direction="sell", price="0.50", quantity=5)
+    res = client.get("/stream?market_id=1", buffered=False)
+    assert res.mimetype == "text/event-stream"
+    chunks = iter(res.response)
+    assert next(chunks).startswith(b"event: snapshot\n")
+
+    place(client, 2, order_direction="buy", price="0.50", quantity=2)
+    assert next(chunks).startswith(b"event: trade\n")
+    depth = next(chunks)
+    assert depth.startswith(b"event: depth\n")
+    assert b'"total_quantity": 3' in depth
+    res.close()
+    assert server.feed.subscribers(1) == []
+
+
+def test_stream_resolved_market(client):
+    res = client.post(
+        "/resolve_market",
+        json={"market_id": 1, "outcome": "yes", "payout_dollars": 1},
+    )
+    assert res.status_code == 200
+    res = client.get("/stream?market_id=1")
+    assert res.status_code == 410
+    assert server.feed.subscribers(1) == []
+
+
+def test_order_duration(client):
+    res = place(
+        client, 1, order_direction="buy", price="0.5", quantity=1, duration="+1d"
+    )
+    assert res.status_code == 200
+    res = place(
+        client, 1, order_direction="buy", price="0.5", quantity=1, duration="+1q"
+    )
+    assert res.status_code == 400
+    assert "Invalid duration format" in res.get_json()["error"]
+    res = place(
+        client,
+        1,
+        order_direction="buy",
+        price="0.5",
+        quantity=1,
+        duration="+1000000000d",
+    )
+    assert res.status_code == 400
+
+
+def test_order_validation(client):
+    for order in [
+        dict(order_direction="sideways", price="0.5"),
+        dict(order_direction="buy", order_type="stop", price="0.5"),
+        dict(order_direction="buy", price="-3"),
+        dict(order_direction="buy", price="Infinity"),
+    ]:
+        res = place(client, 1, quantity=1, **order)
+        assert res.status_code == 400, order
+    assert client.get("/clob?market_id=1").get_json()["sell_orders"] == []
+
+
+def test_order_batch(client):
+    place(client, 1, order_direction="sell", price="0.60", quantity=5)
+    res = client.post(
+        "/orders/batch",
+        json={
+            "cancels": [1, 1, 99],
+            "orders": [
+                {
+                    "market_id": 1,
+                    "order_type": "limit",
+                    "order_direction": "sell",
+                    "price": "0.55",
+                    "quantity": 2,
+                },
+                {
+                    "market_id": 1,
+                    "order_type": "limit",
+                    "order_direction": "buy",
+                    "price": "0.55",
+                    "quantity": 3,
+                },
+                {
+                    "market_id": 2,
+                    "order_type": "limit",
+                    "order_direction": "buy",
+                    "price": "0.55",
+                    "quantity": 3,
+                },
+                {"market_id": 1, "order_type": "limit"},
+            ],
+        },
+    )
+    body = res.get_json()
+    assert [r.get("status") for r in body["cancels"]] == [None, 404, 404]
+    assert [r.get("status") for r in body["orders"]] == [None, None, 404, 400]
+
+    # The buy order filled against the sell order earlier in the batch, and the
+    # remainder rests
+    res = client.get("/clob?market_id=1").get_json()
+    assert res["buy_orders"] == [{"price_cents": 55, "total_quantity": 1}]
+    assert res["sell_orders"] == []
+    conn = sqlite3.connect(server.app.config["DATABASE"])
+    assert conn.execute("SELECT price_cents, quantity FROM trades").fetchall() == [
+        (55, 2)
+    ]
+    assert conn.execute("SELECT quantity FROM orders").fetchall() == [(1,)]
+
+
+def test_resolve_market(client):
+    place(client, 1, order_direction="sell", price="0.40", quantity=5)
+    place(client, 2, order_direction="buy", price="0.40", quantity=3)
+    place(client, 3, order_direction="buy", price="0.30", quantity=4)
+
+    res = client.post(
+        "/resolve_market",
+        json={"market_id": 1, "outcome": "yes", "payout_dollars": 1},
+    )
+    settlement = res.get_json()["settlement"]
+    assert settlement.pop("milliseconds") >= 0
+    assert settlement == {
+        "orders_cancelled": 2,
+        "holders": 2,
+        "total_payout_cents": 300,
+    }
+
+    conn = sqlite3.connect(server.app.config["DATABASE"])
+    settlements = conn.execute(
+        "SELECT user_id, quantity, payout_cents, pnl_cents FROM settlements "
+        "ORDER BY user_id"
+    ).fetchall()
+    assert settlements == [(1, -3, -300, -180), (2, 3, 300, 180)]
+    assert conn.execute("SELECT COUNT(*) FROM orders").fetchone() == (0,)
+    assert client.get("/clob?market_id=1").get_json()["buy_orders"] == []
+
+    res = place(client, 2, order_direction="buy", price="0.40", quantity=3)
+    assert res.status_code == 400
+    res = client.post(
+        "/resolve_market",
+        json={"market_id": 1, "outcome": "no", "payout_dollars": 0},
+    )
+    assert res.status_code == 400
+
+
+def test_search_endpoint(client):
+    res = client.get("/markets/search?q=a").get_json()
+    assert [r["market_name"] for r in res["results"]] == ["A"]
+    assert res["next_offset"] is None
+    assert client.get("/markets/search?q=%22%22").status_code == 400
+    assert client.get("/markets/search?q=a&limit=0").status_code == 400
+
+
+def test_matching_workers(client):
+    conn = sqlite3.connect(server.app.config["DATABASE"])
+    conn.execute("INSERT INTO markets (name, creator_id, criteria) VALUES ('B', 1, '')")
+    conn.commit()
+    server.app.config["MATCHING_WORKERS"] = 2
+
+    subscriber = server.feed.subscribe(2)
+    for market_id in (1, 2):
+        place(
+            client,
+            1,
+            market_id=market_id,
+            order_direction="sell",
+            price="0.50",
+            quantity=5,
+        )
+        place(
+            client,
+            2,
+            market_id=market_id,
+            order_direction="buy",
+            price="0.50",
+            quantity=3,
+        )
+    trades = conn.execute("SELECT market_id, quantity FROM trades ORDER BY market_id")
+    assert trades.fetchall() == [(1, 3), (2, 3)]
+    # Feed events are relayed from the worker asynchronously, and may arrive in
+    # several drains
+    trade = ("trade", {"price_cents": 50, "quantity": 3, "taker_direction": "buy"})
+    deadline = time.monotonic() + 5
+    messages = []
+    while trade not in messages and time.monotonic() < deadline:
+        messages += subscriber.drain(timeout=max(0, deadline - time.monotonic()))
+    assert trade in messages
+
+    res = client.get("/clob?market_id=2")
+    assert res.get_json()["sell_orders"] == [{"price_cents": 50, "total_quantity": 2}]
+
+    # Cancels go to the worker owning the order's market
+    (order_id,) = conn.execute("SELECT id FROM orders WHERE market_id = 2").fetchone()
+    res = client.post("/cancel_order", json={"order_id": order_id})
+    assert res.status_code == 404  # user 2 is logged in
+    place(client, 1, market_id=1, order_direction="buy", price="0.10", quantity=1)
+    res = client.post("/cancel_order", json={"order_id": order_id})
+    assert res.get_json() == {"message": "Order cancelled successfully"}
+    assert client.get("/clob?market_id=2").get_json()["sell_orders"] == []
+
+    res = client.post(
+        "/orders/batch",
+        json={
+            "orders": [
+                {
+                    "market_id": m,
+                    "order_type": "limit",
+                    "order_direction": "buy",
+                    "price": "0.1",
+                    "quantity": 1,
+                }
+                for m in (1, 2)
+            ]
+        },
+    )
+    assert res.status_code == 400
+
+    res = client.post(
+        "/resolve_market",
+        json={"market_id": "two", "outcome": "yes", "payout_dollars": 1},
+    )
+    assert res.status_code == 400
+    res = client.post(
+        "/resolve_market",
+        json={"market_id": "2", "outcome": "yes", "payout_dollars": 1},
+    )
+    assert res.status_code == 200
+    res = place(client, 2, market_id=2, order_direction="buy", price="0.50", quantity=1)
+    assert res.status_code == 400
+    res = place(client, 2, market_id=3, order_direction="buy", price="0.50", quantity=1)
+    assert res.status_code == 404
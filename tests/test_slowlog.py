@@ -0,0 +1,42 @@
+import json
+import sqlite3
+
+from db.slowlog import SlowQueryLog, fingerprint, summarize
+
+
+def test_fingerprint():
+    assert fingerprint("SELECT * FROM t\n WHERE a = 1 AND b = 'x''y'") == (
+        "SELECT * FROM t WHERE a = ? AND b = ?"
+    )
+    assert fingerprint("SELECT * FROM t WHERE id IN (?, ?, ?)") == (
+        "SELECT * FROM t WHERE id IN (?...)"
+    )
+
+
+def test_log_and_summarize(tmp_path):
+    path = tmp_path / "slow.log"
+    log = SlowQueryLog(threshold_ms=10, interval_seconds=60, path=str(path))
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (a INTEGER, b TEXT)")
+    conn.execute("CREATE INDEX t_a ON t (a)")
+
+    assert log.check(conn, "SELECT * FROM t WHERE a = ?", (1,), 0.001) is None
+    entry = log.check(conn, "SELECT * FROM t WHERE b = ?", ("x",), 0.05)
+    assert entry["params"] == ["str"]
+    assert entry["plan"] == ["SCAN t"]
+    # Deduplicated within the interval, reported with the next entry
+    assert log.check(conn, "SELECT * FROM t WHERE b = ?", ("y",), 0.02) is None
+    log.interval_seconds = 0
+    entry = log.check(conn, "SELECT * FROM t WHERE b = ?", ("z",), 0.03)
+    assert (entry["suppressed"], entry["suppressed_ms"]) == (1, 20.0)
+    log.check(conn, "INSERT INTO t VALUES (?, ?)", [(1, "a"), (2, "b")], 0.5, True)
+
+    entries = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(entries) == 3
+    assert entries[2]["params"] == {"rows": 2, "row": ["int", "str"]}
+
+    summary = summarize(entries)
+    lines = summary.splitlines()
+    assert "INSERT INTO t VALUES (?...)" in lines[1]
+    assert "100.0ms total        3x" in lines[2]
+    assert "Queries with a full table scan: 1" in summary
@@ -0,0 +1,14 @@
+from db.snapshots import Snapshot, SnapshotCache
+
+
+def test_lru_eviction():
+    cache = SnapshotCache(max_markets=2)
+    cache.put(1, Snapshot(etag="a", body=b"1"))
+    cache.put(2, Snapshot(etag="a", body=b"2"))
+    assert cache.get(1, "a").body == b"1"
+    assert cache.get(2, "b") is None  # stale
+
+    cache.put(3, Snapshot(etag="a", body=b"3"))
+    assert cache.get(2, "a") is None  # evicted
+    assert cache.get(1, "a") is not None
+    assert (cache.hits, cache.misses) == (2, 2)
@@ -0,0 +1,39 @@
+import sqlite3
+
+import ui
+from db import Database
+from db.migrate import create_schema
+from db.pool import close_pools
+
+
+def test_market_list(tmp_path, monkeypatch):
+    path = str(tmp_path / "market.db")
+    conn = sqlite3.connect(path)
+    create_schema(conn)
+    with Database(conn) as d:
+        for i in range(3):
+            d.create_market(name=f"market {i}", creator_id=1, criteria="long text")
+    conn.close()
+
+    monkeypatch.setattr(ui, "MARKETS_PER_PAGE", 2)
+    app = ui.create_app({"DATABASE": path, "TESTING": True})
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["user_id"] = 1
+
+    page = client.get("/").get_data(as_text=True)
+    assert "market 2" in page and "market 1" in page and "market 0" not in page
+    assert "long text" not in page
+    page = client.get("/?before=2").get_data(as_text=True)
+    assert "market 0" in page and "Older markets" not in page
+
+    # Served from the cache until a market changes
+    client.get("/")
+    conn = sqlite3.connect(path)
+    with Database(conn) as d:
+        d.update_market(3, "renamed", "long text")
+    conn.close()
+    assert "renamed" in client.get("/").get_data(as_text=True)
+    metrics = client.get("/metrics").get_data(as_text=True)
+    assert "ui_market_page_hits 1" in metrics
+    close_pools()
@@ -1,16 +1,37 @@
-import sqlite3
-
 import flask
 from flask import Flask
 
 from db import Database
+from db.market_cache import get_market_cache
+from db.metrics import REGISTRY, instrument_app
+from db.pool import get_pool
+from db.snapshots import Snapshot, SnapshotCache
 from ui.auth import require_login
 
 
+MARKETS_PER_PAGE = 50
+
+
 def create_app(test_config=None):
     app = Flask(__name__, template_folder="templates")
     app.secret_key = "todo: change this"
     app.config["SESSION_TYPE"] = "filesystem"
+    app.config["DATABASE"] = "prediction_markets.db"
+    if test_config is not None:
+        app.config.update(test_config)
+
+    instrument_app(app)
+
+    # Rendered pages of the market list, valid until markets next change
+    market_pages = SnapshotCache(max_markets=256)
+    REGISTRY.gauge(
+        "ui_market_page_hits", "Market list page cache hits", lambda: market_pages.hits
+    )
+    REGISTRY.gauge(
+        "ui_market_page_misses",
+        "Market list page cache misses",
+        lambda: market_pages.misses,
+    )
 
     from . import auth
 
@@ -23,14 +44,37 @@ def create_app(test_config=None):
     @app.before_request
     def before_request():
         if "user_id" in flask.session:
-            conn = sqlite3.connect("prediction_markets.db")
-            flask.g.db = Database(conn)
+            conn = get_pool(app.config["DATABASE"]).acquire()
+            flask.g.db = Database(conn, get_market_cache(app.config["DATABASE"]))
+
+    @app.teardown_appcontext
+    def teardown_db(exc):
+        db = flask.g.pop("db", None)
+        if db is not None:
+            get_pool(app.config["DATABASE"]).release(db.conn)
 
     @app.route("/")
     def index():
         if "user_id" in flask.session:
+            before = flask.request.args.get("before", type=int)
             with flask.g.db as db:
-                flask.g.markets = db.get_markets()
+                version = str(db.get_markets_version())
+                page = market_pages.get(before, version)
+                if page is None:
+                    # One extra row tells whether there is a next page
+                    markets = db.list_markets(before, MARKETS_PER_PAGE + 1)
+                    html = flask.render_template(
+                        "market/list.html",
+                        markets=markets[:MARKETS_PER_PAGE],
+                        next_before=(
+                            markets[MARKETS_PER_PAGE - 1].id
+                            if len(markets) > MARKETS_PER_PAGE
+                            else None
+                        ),
+                    )
+                    page = Snapshot(etag=version, body=html.encode())
+                    market_pages.put(before, page)
+            flask.g.market_list = page.body.decode()
         return flask.render_template("index.html")
 
     return app